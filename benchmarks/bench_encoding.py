@@ -0,0 +1,99 @@
+"""
+Serialization benchmark for books_query responses.
+
+Builds a 1,000-row books_query result and encodes it the old way
+(``str(result)``), with the standard-library JSON encoder and, when
+installed, with orjson; then the same page as ``format="table"``, with and
+without dictionary encoding. Prints the time per response (including
+building the table) and the payload size.
+
+Usage:
+    python benchmarks/bench_encoding.py [--rows 1000] [--repeat 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mcp_server.encoding as encoding  # noqa: E402
+from mcp_server.books import encode_table  # noqa: E402
+
+WORDS = "river code peace war garden night house great murder python data light shadow storm".split()
+
+
+def books_page(rows):
+    rnd = random.Random(3)
+    data = []
+    for i in range(rows):
+        data.append({
+            "Title": " ".join(rnd.choice(WORDS).title() for _ in range(3)),
+            "Authors": f"By Author {i % 500}",
+            "Description": " ".join(rnd.choice(WORDS) for _ in range(12)),
+            "Category": " History , General",
+            "Publisher": "HarperCollins",
+            "Price Starting With ($)": f"{rnd.uniform(5, 80):.2f}",
+            "Publish Date (Month)": "January",
+            "Publish Date (Year)": str(rnd.randint(1950, 2024)),
+            "id": str(i + 1),
+            "Price (EUR)": round(rnd.uniform(5, 80), 2),
+        })
+    return {
+        "authenticated_user": "bench_user",
+        "data": data,
+        "count": len(data),
+        "query_type": "filtered_search",
+        "filters_applied": {"genre": "history", "year": None, "author": None, "title": None,
+                            "limit": rows, "offset": None, "currency": "EUR",
+                            "min_price": None, "max_price": None},
+        "rates_version": 1,
+    }
+
+
+def as_table(result, dictionary):
+    data = result["data"]
+    columns = list(data[0])
+    table = encode_table(columns, [[row[c] for row in data] for c in columns], dictionary=dictionary)
+    body = {k: v for k, v in result.items() if k != "data"}
+    return dict(body, format="table", **table)
+
+
+def measure(fn, result, repeat):
+    fn(result)  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        text = fn(result)
+    elapsed = (time.perf_counter() - started) / repeat
+    return elapsed * 1e3, len(text.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the books_query page")
+    parser.add_argument("--repeat", type=int, default=200, help="encodings per measurement")
+    args = parser.parse_args()
+
+    result = books_page(args.rows)
+    stdlib = encoding._stdlib_encoder.encode
+    encoding.dumps({})  # the first response imports orjson, if it is installed
+    encoders = [("str(result)", str), ("json (stdlib)", stdlib)]
+    if encoding.orjson is not None:
+        encoders.append(("orjson", encoding.dumps))
+    else:
+        print("orjson not installed; skipping it")
+    dumps = encoding.dumps
+    encoders.append(("table", lambda r: dumps(as_table(r, dictionary=False))))
+    encoders.append(("table + dict", lambda r: dumps(as_table(r, dictionary=True))))
+
+    print(f"{args.rows:,}-row books_query page")
+    print(f"{'encoder':<16} {'ms/response':>12} {'bytes':>10}")
+    for name, fn in encoders:
+        ms, size = measure(fn, result, args.repeat)
+        print(f"{name:<16} {ms:>12.3f} {size:>10,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for JWT validation throughput.
+
+Compares the original per-call implementation (fresh HMAC key setup and a
+plain ``!=`` signature check on every validation) with the current one:
+a reusable keyed HMAC state, constant-time comparison and the
+verified-token cache.
+
+Usage:
+    python benchmarks/bench_jwt.py [--tokens 100] [--seconds 1.0]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server import server  # noqa: E402
+
+
+def legacy_validate(token):
+    """The validation code as it was before the signing state was cached."""
+    try:
+        parts = token.split('.')
+        if len(parts) != 3:
+            return None
+        header_b64, payload_b64, signature_b64 = parts
+        secret = "demo-secret-key-123"
+        message = f"{header_b64}.{payload_b64}"
+        expected = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
+        expected_b64 = base64.urlsafe_b64encode(expected).decode().rstrip('=')
+        if signature_b64 != expected_b64:
+            return None
+        payload_b64 += '=' * (4 - len(payload_b64) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(payload_b64.encode()).decode())
+        if payload.get('exp', 0) < time.time():
+            return None
+        return payload
+    except Exception:
+        return None
+
+
+def rate(fn, tokens, seconds):
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for t in tokens:
+            fn(t)
+        calls += len(tokens)
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=100, help="distinct tokens validated round-robin")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget per variant")
+    args = parser.parse_args()
+
+    tokens = [server.create_jwt_token(f"user_{i}", f"name_{i}") for i in range(args.tokens)]
+
+    def uncached(t):
+        server._VERIFIED_TOKENS.clear()
+        return server.validate_jwt_token(t)
+
+    results = {
+        "legacy (per-call HMAC key, != compare)": rate(legacy_validate, tokens, args.seconds),
+        "keyed HMAC state, cache miss": rate(uncached, tokens, args.seconds),
+        "keyed HMAC state, cache hit": rate(server.validate_jwt_token, tokens, args.seconds),
+    }
+    base = next(iter(results.values()))
+    for name, per_sec in results.items():
+        print(f"{name:<42} {per_sec:>12,.0f} validations/s  ({per_sec / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
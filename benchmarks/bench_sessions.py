@@ -0,0 +1,69 @@
+"""
+Soak benchmark for the session store.
+
+Creates millions of sessions against a capped SessionStore while simulated
+time advances, running expiry eviction periodically like the background
+reaper does. Prints the resident set size as the run progresses; with the
+cap and expiry in place it should stay flat once the store is full.
+
+Usage:
+    python benchmarks/bench_sessions.py [--sessions 2000000] [--cap 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.sessions import SessionStore  # noqa: E402
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=2_000_000, help="sessions to create")
+    parser.add_argument("--cap", type=int, default=100_000, help="MAX_SESSIONS for the store")
+    parser.add_argument("--rate", type=float, default=200.0, help="simulated sessions per second")
+    parser.add_argument("--reap-every", type=int, default=10_000, help="sessions between eviction passes")
+    args = parser.parse_args()
+
+    store = SessionStore(ttl=3600, max_sessions=args.cap)
+    clock = 1_700_000_000.0
+    step = 1.0 / args.rate
+    report_every = max(args.sessions // 20, 1)
+    started = time.perf_counter()
+
+    print(f"{'created':>12} {'live':>10} {'heap':>10} {'expired':>10} {'lru':>10} {'rss MB':>9}")
+    for i in range(1, args.sessions + 1):
+        clock += step
+        store[f"session_{i}"] = {
+            "username": f"user_{i % 5000}",
+            "user_id": f"user_{i % 10000}",
+            "token": "x" * 180,
+            "created_at": clock,
+        }
+        if i % args.reap_every == 0:
+            store.evict_expired(now=clock)
+        if i % report_every == 0:
+            print(f"{i:>12,} {len(store):>10,} {len(store._heap):>10,} {store.evicted_expired:>10,} "
+                  f"{store.evicted_lru:>10,} {rss_mb():>9.1f}")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n{args.sessions:,} sessions in {elapsed:.1f}s ({args.sessions / elapsed:,.0f} inserts/s)")
+
+
+if __name__ == "__main__":
+    main()
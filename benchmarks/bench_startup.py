@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark: time from spawning the server to its first tools/list.
+
+stdio clients start one server process per session, so this is latency
+every new agent session pays. Each run spawns ``python -m mcp_server.server``,
+sends the MCP initialize handshake and a tools/list request as JSON-RPC
+lines on stdin, and times when the initialize and tools/list responses
+arrive. It also times a bare ``import mcp_server.server`` in a fresh
+interpreter, which tooling and tests pay.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+INITIALIZE = {
+    "jsonrpc": "2.0", "id": 1, "method": "initialize",
+    "params": {"protocolVersion": "2025-06-18", "capabilities": {},
+               "clientInfo": {"name": "bench_startup", "version": "1"}},
+}
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+LIST_TOOLS = {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}
+
+
+def _lines(*messages: Dict) -> bytes:
+    return b"".join(json.dumps(m).encode() + b"\n" for m in messages)
+
+
+def time_stdio_start() -> Dict[str, float]:
+    """Seconds from spawn to the initialize response and to the tools/list response."""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "mcp_server.server"], cwd=ROOT,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        # The client writes its first request right away, like stdio clients do
+        proc.stdin.write(_lines(INITIALIZE))
+        proc.stdin.flush()
+        timings: Dict[str, float] = {}
+        while "tools_list" not in timings:
+            line = proc.stdout.readline()
+            if not line:
+                raise RuntimeError("server exited before answering tools/list")
+            message = json.loads(line)
+            if message.get("id") == 1:
+                timings["initialize"] = time.perf_counter() - started
+                proc.stdin.write(_lines(INITIALIZED, LIST_TOOLS))
+                proc.stdin.flush()
+            elif message.get("id") == 2:
+                timings["tools_list"] = time.perf_counter() - started
+                if not message.get("result", {}).get("tools"):
+                    raise RuntimeError(f"unexpected tools/list response: {line[:200]!r}")
+        return timings
+    finally:
+        proc.stdin.close()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def time_import(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - started
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {"min_ms": round(min(samples) * 1e3, 1), "median_ms": round(statistics.median(samples) * 1e3, 1),
+            "max_ms": round(max(samples) * 1e3, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="server starts to time")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    time_stdio_start()  # warm the OS file cache and any __pycache__ writes
+    starts = [time_stdio_start() for _ in range(args.runs)]
+    results = {
+        "python (no imports)": _summary([time_import("sys") for _ in range(args.runs)]),
+        "import mcp_server.server": _summary([time_import("mcp_server.server") for _ in range(args.runs)]),
+        "stdio initialize": _summary([s["initialize"] for s in starts]),
+        "stdio first tools/list": _summary([s["tools_list"] for s in starts]),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'':<28} {'min':>9} {'median':>9} {'max':>9}   ({args.runs} runs)")
+    for name, s in results.items():
+        print(f"{name:<28} {s['min_ms']:>7.1f}ms {s['median_ms']:>7.1f}ms {s['max_ms']:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Benchmark suite for the repository, converter, rates, auth and end-to-end calls.
+
+Generates synthetic catalogs of the requested sizes (and an XLSX workbook
+for each, up to --xlsx-max rows), then times:
+
+- repository: BooksRepository.ensure_loaded, get_by_id and filter over a mix
+  of predicates, plus the same filters on a BooksSnapshot
+- xlsx: xlsx_first_sheet_to_csv
+- rates: ExchangeRates.convert / convert_batch and RateCache.snapshot
+- auth: JWT create, and validate with and without the verified-token cache
+- e2e: handle_call_tool round-trips through an MCP client session over
+  in-memory streams (tools/list, authenticate, session_status, books_query,
+  exchange_convert)
+
+Each benchmark reports seconds per operation (median, min, mean over a few
+samples). Results are written as JSON. Pass --baseline with an earlier
+results file to compare: benchmarks whose best time slowed down by more
+than --threshold are flagged, and the exit status is 1. The best time is
+compared because noise on a quiet machine only ever adds time.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 10k,1m,10m] [--only repository,e2e]
+                                     [--output results.json] [--baseline baseline.json]
+                                     [--threshold 0.25]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.books import BooksRepository  # noqa: E402
+from mcp_server.books_snapshot import BooksSnapshot, write_snapshot  # noqa: E402
+from mcp_server.exchange import default_rates  # noqa: E402
+from mcp_server.util.xlsx_to_csv import xlsx_first_sheet_to_csv  # noqa: E402
+
+GROUPS = ("repository", "xlsx", "rates", "auth", "e2e")
+HEADER = ["Title", "Authors", "Description", "Category", "Publisher",
+          "Price Starting With ($)", "Publish Date (Month)", "Publish Date (Year)"]
+WORDS = "river code peace war garden night house great murder python data light shadow storm".split()
+GENRES = ["History , General", "Fiction , Mystery & Detective", "Science , Physics",
+          "Business & Economics , General", "Poetry", "Juvenile Fiction , Animals"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+# Predicate mixes for filter benchmarks: from one cheap column test to
+# combinations and a query that matches nothing
+FILTER_MIXES = {
+    "genre": {"genre": "fiction"},
+    "year": {"year": "2001"},
+    "author": {"author": "author 42"},
+    "title": {"title_contains": "garden"},
+    "price": {"min_price": 20.0, "max_price": 30.0},
+    "genre+year+title": {"genre": "history", "year": "1999", "title_contains": "river"},
+    "no_match": {"title_contains": "zzzz"},
+}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def size_label(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+
+def catalog_rows(rows: int, seed: int = 7):
+    rnd = random.Random(seed)
+    for i in range(rows):
+        yield [
+            " ".join(rnd.choice(WORDS).title() for _ in range(3)),
+            f"By Author {i % 5000}",
+            " ".join(rnd.choice(WORDS) for _ in range(8)),
+            rnd.choice(GENRES),
+            f"Publisher {i % 300}",
+            f"{rnd.uniform(5, 80):.2f}",
+            rnd.choice(MONTHS),
+            str(rnd.randint(1950, 2024)),
+        ]
+
+
+def write_catalog_csv(path: str, rows: int) -> None:
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(catalog_rows(rows))
+
+
+def write_catalog_xlsx(path: str, rows: int) -> None:
+    """Minimal single-sheet workbook with inline strings, like a spreadsheet export."""
+    def col(j: int) -> str:
+        return chr(ord("A") + j)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml",
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" ContentType="application/'
+                    'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+                    'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                    '</Types>')
+        zf.writestr("xl/workbook.xml",
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    '<sheets><sheet name="Books" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        zf.writestr("xl/_rels/workbook.xml.rels",
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" '
+                    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                    'Target="worksheets/sheet1.xml"/></Relationships>')
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for r, values in enumerate([HEADER, *catalog_rows(rows)], start=1):
+                cells = "".join(f'<c r="{col(j)}{r}" t="inlineStr"><is><t>{escape(v)}</t></is></c>'
+                                for j, v in enumerate(values))
+                sheet.write(f'<row r="{r}">{cells}</row>'.encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+
+
+class Suite:
+    """Collects timings as ``name -> stats``; each sample runs an operation ``number`` times."""
+
+    def __init__(self, min_time: float = 0.2, repeat: int = 5, budget: float = 10.0) -> None:
+        self.min_time = min_time
+        self.repeat = repeat
+        self.budget = budget
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def _number(self, run: Callable[[int], float]) -> int:
+        number = 1
+        while True:
+            if run(number) >= self.min_time or number >= 1 << 20:
+                return number
+            number *= 4
+
+    def _record(self, name: str, samples: List[float], number: int) -> None:
+        per_op = sorted(s / number for s in samples)
+        self.results[name] = {
+            "median_s": per_op[len(per_op) // 2],
+            "min_s": per_op[0],
+            "mean_s": sum(per_op) / len(per_op),
+            "samples": len(per_op),
+            "ops_per_sample": number,
+        }
+        print(f"  {name:<44} {_fmt(per_op[len(per_op) // 2]):>10}/op  "
+              f"(min {_fmt(per_op[0])}, {len(per_op)}x{number})", flush=True)
+
+    def time(self, name: str, fn: Callable[[], Any]) -> None:
+        def run(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            return time.perf_counter() - started
+
+        number = self._number(run)
+        samples: List[float] = []
+        deadline = time.perf_counter() + self.budget
+        while len(samples) < self.repeat and (not samples or time.perf_counter() < deadline):
+            samples.append(run(number))
+        self._record(name, samples, number)
+
+    async def time_async(self, name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        async def run(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                await fn()
+            return time.perf_counter() - started
+
+        number = 1
+        while await run(number) < self.min_time and number < 1 << 16:
+            number *= 4
+        samples: List[float] = []
+        deadline = time.perf_counter() + self.budget
+        while len(samples) < self.repeat and (not samples or time.perf_counter() < deadline):
+            samples.append(await run(number))
+        self._record(name, samples, number)
+
+
+def bench_repository(suite: Suite, csv_path: str, label: str, tmp: str) -> None:
+    suite.time(f"repository.load[{label}]", lambda: BooksRepository(csv_path).ensure_loaded())
+
+    repo = BooksRepository(csv_path)
+    repo.ensure_loaded()
+    n = len(repo)
+    rnd = random.Random(1)
+    ids = [str(rnd.randint(1, n)) for _ in range(64)]
+    cycle = itertools.cycle(ids)
+    suite.time(f"repository.get_by_id[{label}]", lambda: repo.get_by_id(next(cycle)))
+    prices = repo.prices()
+    for mix, params in FILTER_MIXES.items():
+        kwargs = dict(params, prices=prices) if "min_price" in params else params
+        suite.time(f"repository.filter.{mix}[{label}]", lambda kw=kwargs: repo.filter(limit=20, **kw))
+
+    snap_path = os.path.join(tmp, f"books-{label}.snapshot")
+    write_snapshot(repo, snap_path)
+    snapshot = BooksSnapshot(snap_path)
+    try:
+        for mix, params in FILTER_MIXES.items():
+            kwargs = dict(params, prices=snapshot.prices()) if "min_price" in params else params
+            suite.time(f"snapshot.filter.{mix}[{label}]", lambda kw=kwargs: snapshot.filter(limit=20, **kw))
+    finally:
+        snapshot.close()
+
+
+def bench_xlsx(suite: Suite, xlsx_path: str, label: str, tmp: str) -> None:
+    out = os.path.join(tmp, f"converted-{label}.csv")
+    suite.time(f"xlsx.to_csv[{label}]", lambda: xlsx_first_sheet_to_csv(xlsx_path, out))
+
+
+def bench_rates(suite: Suite) -> None:
+    from mcp_server.rates import RateCache, StaticRateProvider
+
+    rates = default_rates()
+    suite.time("rates.convert", lambda: rates.convert(100.0, "USD", "EUR"))
+    suite.time("rates.rate", lambda: rates.rate("GBP", "JPY"))
+    amounts = [float(i) for i in range(1000)]
+    suite.time("rates.convert_batch[1000]", lambda: rates.convert_batch(amounts, "USD", "EUR"))
+    targets = [rates.codes[i % len(rates.codes)] for i in range(1000)]
+    suite.time("rates.convert_batch.mixed[1000]", lambda: rates.convert_batch(amounts, "USD", targets))
+    cache = RateCache(StaticRateProvider(rates))
+    cache.snapshot()
+    suite.time("rates.cache_snapshot", cache.snapshot)
+
+
+def bench_auth(suite: Suite) -> None:
+    from mcp_server import server
+
+    suite.time("auth.jwt_create", lambda: server.create_jwt_token("user-1", "bench_user"))
+    token = server.create_jwt_token("user-1", "bench_user")
+    server.validate_jwt_token(token)
+    suite.time("auth.jwt_validate.cached", lambda: server.validate_jwt_token(token))
+
+    def validate_uncached() -> None:
+        server._VERIFIED_TOKENS.clear()
+        server.validate_jwt_token(token)
+    suite.time("auth.jwt_validate.uncached", validate_uncached)
+
+
+async def bench_e2e(suite: Suite, csv_path: str, label: str) -> None:
+    from unittest.mock import patch
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from mcp_server import server
+    from mcp_server.books import ConvertedPriceCache
+
+    repo = BooksRepository(csv_path)
+    repo.ensure_loaded()
+    with patch.object(server, "_BOOKS", repo), patch.object(server, "_PRICE_COLUMNS", ConvertedPriceCache(repo)):
+        async with create_connected_server_and_client_session(server.server) as client:
+            await suite.time_async("e2e.list_tools", client.list_tools)
+            await suite.time_async("e2e.authenticate",
+                                   lambda: client.call_tool("authenticate", {"username": "bench_user"}))
+            await suite.time_async("e2e.session_status", lambda: client.call_tool("session_status", {}))
+            await suite.time_async("e2e.exchange_convert", lambda: client.call_tool(
+                "exchange_convert", {"amount": 100, "from_currency": "USD", "to_currency": "EUR"}))
+            await suite.time_async(f"e2e.books_query.id[{label}]",
+                                   lambda: client.call_tool("books_query", {"id": "42"}))
+            await suite.time_async(f"e2e.books_query.genre[{label}]",
+                                   lambda: client.call_tool("books_query", {"genre": "fiction", "limit": 20}))
+            await suite.time_async(f"e2e.books_query.currency[{label}]", lambda: client.call_tool(
+                "books_query", {"title": "garden", "currency": "EUR", "limit": 20}))
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print current vs. baseline best times; returns the names that regressed."""
+    regressions = []
+    current, base = results["benchmarks"], baseline.get("benchmarks", {})
+    print(f"\n{'benchmark':<46} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(set(current) & set(base)):
+        before, after = base[name]["min_s"], current[name]["min_s"]
+        change = after / before - 1 if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<46} {_fmt(before):>10} {_fmt(after):>10} {change:>+7.1%}{flag}")
+    missing = set(base) - set(current)
+    if missing:
+        print(f"{len(missing)} baseline benchmark(s) not run this time")
+    print(f"\n{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def _fmt(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f}{unit}"
+    return f"{seconds / 1e-9:.1f}ns"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10k", help="catalog sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"groups to run ({', '.join(GROUPS)})")
+    parser.add_argument("--xlsx-max", default="1m", help="largest catalog also written and converted as XLSX")
+    parser.add_argument("--output", default="bench-results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown flagged as a regression")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per sample, at least")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds per benchmark before sampling stops")
+    args = parser.parse_args(argv)
+
+    groups = {g.strip() for g in args.only.split(",") if g.strip()}
+    unknown = groups - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    xlsx_max = parse_size(args.xlsx_max)
+    suite = Suite(min_time=args.min_time, repeat=args.repeat, budget=args.budget)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            label = size_label(rows)
+            if groups & {"repository", "e2e", "xlsx"}:
+                csv_path = os.path.join(tmp, f"books-{label}.csv")
+                print(f"catalog {label}: generating {rows:,} rows", flush=True)
+                write_catalog_csv(csv_path, rows)
+            if "repository" in groups:
+                bench_repository(suite, csv_path, label, tmp)
+            if "xlsx" in groups:
+                if rows <= xlsx_max:
+                    xlsx_path = os.path.join(tmp, f"books-{label}.xlsx")
+                    write_catalog_xlsx(xlsx_path, rows)
+                    bench_xlsx(suite, xlsx_path, label, tmp)
+                else:
+                    print(f"  xlsx skipped for {label} (above --xlsx-max)")
+            if "e2e" in groups:
+                asyncio.run(bench_e2e(suite, csv_path, label))
+            for name in os.listdir(tmp):  # keep at most one catalog size on disk
+                os.remove(os.path.join(tmp, name))
+        if "rates" in groups:
+            print("rates", flush=True)
+            bench_rates(suite)
+        if "auth" in groups:
+            print("auth", flush=True)
+            bench_auth(suite)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": [size_label(r) for r in sizes],
+        },
+        "benchmarks": suite.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {len(suite.results)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
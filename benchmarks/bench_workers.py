@@ -0,0 +1,114 @@
+"""
+Throughput benchmark for books_query worker processes.
+
+Writes a synthetic catalog, snapshots it, and runs the same mix of scan
+queries in-process and through BooksWorkerPool with increasing worker
+counts. Prints queries per second and each worker's private (anonymous)
+memory next to the shared, file-backed snapshot pages.
+
+Usage:
+    python benchmarks/bench_workers.py [--books 200000] [--queries 400] [--workers 1,2,4]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.books import BooksRepository, query_books  # noqa: E402
+from mcp_server.books_snapshot import BooksSnapshot, write_snapshot  # noqa: E402
+from mcp_server.workers import BooksWorkerPool  # noqa: E402
+
+WORDS = "river code peace war garden night house great murder python data light shadow storm".split()
+GENRES = ["History , General", "Fiction , Mystery", "Science , Physics", "Business , Economics", "Poetry"]
+
+
+def write_catalog(path, books):
+    rnd = random.Random(7)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n")
+        for i in range(books):
+            title = " ".join(rnd.choice(WORDS).title() for _ in range(3))
+            f.write(f'{title},By Author {i % 5000},"{rnd.choice(GENRES)}",Pub {i % 50},'
+                    f'{rnd.uniform(5, 80):.2f},{rnd.randint(1950, 2024)}\n')
+
+
+def query_mix(n):
+    rnd = random.Random(11)
+    mix = []
+    for _ in range(n):
+        mix.append({"title": rnd.choice(WORDS), "genre": rnd.choice(["history", "fiction", None]),
+                    "year": str(rnd.randint(1950, 2024)) if rnd.random() < 0.3 else None,
+                    "limit": 20})
+    return mix
+
+
+def memory_kb(pid):
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("RssAnon", "RssFile"):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return fields
+
+
+async def run_pool(path, workers, mix):
+    pool = BooksWorkerPool(path, workers)
+    pool.start()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(pool.query(q) for q in mix))
+        elapsed = time.perf_counter() - started
+        pids = list(pool._executor._processes)
+        mem = [memory_kb(pid) for pid in pids]
+    finally:
+        pool.close()
+    return len(mix) / elapsed, mem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=200_000, help="rows in the synthetic catalog")
+    parser.add_argument("--queries", type=int, default=400, help="queries per run")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "books.csv")
+        snap_path = os.path.join(tmp, "books.snapshot")
+        write_catalog(csv_path, args.books)
+        repo = BooksRepository(csv_path)
+        write_snapshot(repo, snap_path)
+        print(f"catalog: {args.books:,} books, snapshot {os.path.getsize(snap_path) / 2**20:.1f} MB")
+        mix = query_mix(args.queries)
+
+        started = time.perf_counter()
+        for q in mix:
+            query_books(repo, **q)
+        print(f"{'in-process (dicts)':<22} {len(mix) / (time.perf_counter() - started):>9.1f} q/s")
+
+        snapshot = BooksSnapshot(snap_path)
+        started = time.perf_counter()
+        for q in mix:
+            query_books(snapshot, **q)
+        print(f"{'in-process (snapshot)':<22} {len(mix) / (time.perf_counter() - started):>9.1f} q/s")
+
+        for workers in [int(w) for w in args.workers.split(",")]:
+            qps, mem = asyncio.run(run_pool(snap_path, workers, mix))
+            anon = sum(m.get("RssAnon", 0) for m in mem) / 1024
+            shared = max((m.get("RssFile", 0) for m in mem), default=0) / 1024
+            print(f"{f'{workers} workers':<22} {qps:>9.1f} q/s   private {anon:6.1f} MB total, "
+                  f"file-backed {shared:6.1f} MB each (shared)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Load test: concurrent agents replaying tool calls against the server.
+
+Each agent opens its own MCP connection, authenticates, and then sends
+tool calls from the workload until the run ends. The workload is a
+JSON-lines file with one call per line, {"tool": ..., "arguments": ...}.
+Trace files written by the server's jsonl trace exporter (TRACE_FILE) use
+the same keys and can be replayed as they are. ``authenticate`` lines
+supply the agents' logins (session ids are dropped), and the other lines
+are replayed in order, shared across agents. Without --workload, a synthetic mix of books_query and
+exchange_convert calls is used (--write-workload saves it for editing).
+
+Transports:
+- memory (default): in-process server, one in-memory connection per agent
+- stdio: one ``python -m mcp_server.server`` process per agent, as stdio
+  clients do
+- http: a running ``--transport http`` server at --url, one MCP session per
+  agent
+
+Without --rate, each agent sends its next call as soon as the previous one
+returns (closed loop, plus --think seconds). With --rate, calls arrive at
+that many per second (Poisson arrivals) and wait for a free agent. Their
+latency is measured from the arrival, so a saturated server shows up as
+growing latency instead of a lower sending rate.
+
+--concurrency takes a list (e.g. 1,4,16,64) and runs one level after
+another. The summary line per level shows where throughput stops growing
+and p99 latency takes off. Per-tool throughput, p50/p95/p99 latency and
+error rates are printed for each level, and --output writes them as JSON.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,4,16,64] [--duration 30]
+                                   [--rate 200] [--workload calls.jsonl]
+                                   [--transport memory|stdio|http] [--url http://127.0.0.1:8000/mcp]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# tool name, arguments
+Call = Tuple[str, Dict[str, Any]]
+
+GENRES = ["fiction", "history", "science", "business", "poetry", "juvenile", "religion", "cooking"]
+WORDS = ["river", "war", "peace", "garden", "night", "house", "love", "murder", "python", "light"]
+CURRENCIES = ["EUR", "GBP", "JPY", "CAD", "AUD", "CHF", "INR"]
+YEARS = [str(y) for y in range(1990, 2021)]
+
+
+def synthetic_workload(calls: int = 10_000, seed: int = 1) -> Tuple[List[Dict[str, Any]], List[Call]]:
+    """
+    Logins and a mix of calls modelled on agent traffic.
+
+    About 70% are books_query calls: id lookups, genre, year, title and
+    author searches, some with a price range or a currency conversion.
+    The remaining 30% are currency conversions, one in twenty of them an
+    exchange_convert_batch call with ten amounts.
+    """
+    rnd = random.Random(seed)
+    mix = []
+    for _ in range(calls):
+        r = rnd.random()
+        if r < 0.25:
+            call = ("books_query", {"id": str(rnd.randint(1, 2000))})
+        elif r < 0.40:
+            call = ("books_query", {"genre": rnd.choice(GENRES), "limit": 20})
+        elif r < 0.48:
+            call = ("books_query", {"genre": rnd.choice(GENRES), "year": rnd.choice(YEARS), "limit": 20})
+        elif r < 0.58:
+            call = ("books_query", {"title": rnd.choice(WORDS), "limit": 10})
+        elif r < 0.63:
+            call = ("books_query", {"author": rnd.choice(WORDS), "limit": 10})
+        elif r < 0.66:
+            call = ("books_query", {"genre": rnd.choice(GENRES), "min_price": 10, "max_price": 25, "limit": 20})
+        elif r < 0.70:
+            call = ("books_query", {"title": rnd.choice(WORDS), "currency": rnd.choice(CURRENCIES), "limit": 10})
+        elif r < 0.985:
+            call = ("exchange_convert", {"amount": round(rnd.uniform(1, 500), 2), "from_currency": "USD",
+                                         "to_currency": rnd.choice(CURRENCIES)})
+        else:
+            call = ("exchange_convert_batch", {"amounts": [round(rnd.uniform(1, 500), 2) for _ in range(10)],
+                                               "from_currency": "USD", "to_currency": rnd.choice(CURRENCIES)})
+        mix.append(call)
+    return [], mix
+
+
+def load_workload(path: str) -> Tuple[List[Dict[str, Any]], List[Call]]:
+    """Logins (authenticate arguments) and the other calls from a JSON-lines file."""
+    logins: List[Dict[str, Any]] = []
+    calls: List[Call] = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "tool" not in record:
+                raise ValueError(f"{path}:{number}: missing 'tool'")
+            # Sessions belong to the agent replaying the call
+            arguments = {k: v for k, v in record.get("arguments", {}).items() if k != "session_id"}
+            if record["tool"] == "authenticate":
+                logins.append(arguments)
+            elif record["tool"] != "logout":  # would end the agent's session mid-run
+                calls.append((record["tool"], arguments))
+    if not calls:
+        raise ValueError(f"{path}: no tool calls to replay")
+    return logins, calls
+
+
+def write_workload(path: str, calls: List[Call]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for tool, arguments in calls:
+            f.write(json.dumps({"tool": tool, "arguments": arguments}) + "\n")
+
+
+# ===============================================================================
+# CONNECTIONS
+# ===============================================================================
+
+@contextlib.asynccontextmanager
+async def connect(args: argparse.Namespace) -> AsyncIterator[Any]:
+    """An initialized ClientSession over the selected transport."""
+    from mcp import ClientSession
+
+    if args.transport == "memory":
+        from mcp.shared.memory import create_connected_server_and_client_session
+        from mcp_server import server
+        async with create_connected_server_and_client_session(server.server) as client:
+            yield client
+        return
+
+    if args.transport == "stdio":
+        from mcp.client.stdio import StdioServerParameters, stdio_client
+        params = StdioServerParameters(command=sys.executable, args=["-m", "mcp_server.server"],
+                                       cwd=ROOT, env=dict(os.environ))
+        transport = stdio_client(params)
+    else:
+        from mcp.client.streamable_http import streamablehttp_client
+        transport = streamablehttp_client(args.url, timeout=args.timeout)
+    async with transport as streams:
+        async with ClientSession(streams[0], streams[1]) as client:
+            await client.initialize()
+            yield client
+
+
+def _use_books_csv(path: str) -> None:
+    """Point the in-process server at another catalog (memory transport)."""
+    from mcp_server import server
+    from mcp_server.books import BooksRepository, ConvertedPriceCache
+
+    repo = BooksRepository(path)
+    repo.ensure_loaded()
+    server._BOOKS = repo
+    server._PRICE_COLUMNS = ConvertedPriceCache(repo)
+
+
+# ===============================================================================
+# RUN
+# ===============================================================================
+
+class Results:
+    """Latencies and outcomes per tool for one concurrency level."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.started = 0.0
+        self.ended = 0.0
+
+    def record(self, tool: str, outcome: str, seconds: float) -> None:
+        self.latencies.setdefault(tool, []).append(seconds)
+        counts = self.outcomes.setdefault(tool, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(self.ended - self.started, 1e-9)
+        tools = {tool: _stats(latencies, self.outcomes[tool], elapsed)
+                 for tool, latencies in sorted(self.latencies.items())}
+        every = [s for latencies in self.latencies.values() for s in latencies]
+        outcomes: Dict[str, int] = {}
+        for counts in self.outcomes.values():
+            for outcome, n in counts.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + n
+        return {"seconds": round(elapsed, 3), "total": _stats(every, outcomes, elapsed), "tools": tools}
+
+
+def _stats(latencies: List[float], outcomes: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    n = len(ordered)
+    errors = n - outcomes.get("ok", 0)
+    return {
+        "calls": n,
+        "throughput": round(n / elapsed, 2),
+        "errors": errors,
+        "error_rate": round(errors / n, 4) if n else 0.0,
+        "outcomes": dict(sorted(outcomes.items())),
+        **{f"p{q}_ms": round(_percentile(ordered, q / 100) * 1e3, 3) for q in (50, 95, 99)},
+        "max_ms": round(ordered[-1] * 1e3, 3) if n else 0.0,
+    }
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _outcome(result: Any) -> str:
+    """"ok", or the error code of a tool response (as the server's metrics count it)."""
+    text = result.content[0].text if result.content else ""
+    if text.startswith('{"error":"'):
+        return text[10:text.index('"', 10)]
+    return "tool_error" if result.isError else "ok"
+
+
+async def run_level(args: argparse.Namespace, agents: int, logins: List[Dict[str, Any]],
+                    calls: List[Call]) -> Results:
+    """Run ``agents`` agents for one measurement window."""
+    results = Results()
+    ready = asyncio.Event()
+    connected = 0
+    all_connected = asyncio.Event()
+    next_call = itertools.cycle(calls).__next__
+    deadline = [math.inf]
+    arrivals: "Optional[asyncio.Queue[Tuple[float, Call]]]" = asyncio.Queue() if args.rate else None
+    budget = [args.calls or math.inf]
+
+    async def send(client: Any, call: Call, since: float) -> None:
+        tool, arguments = call
+        try:
+            result = await asyncio.wait_for(client.call_tool(tool, arguments), args.timeout)
+            outcome = _outcome(result)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+        except Exception as e:  # transport failures count as errors of the call
+            outcome = type(e).__name__
+        end = time.perf_counter()
+        if end <= deadline[0]:
+            results.record(tool, outcome, end - since)
+
+    async def agent(number: int) -> None:
+        nonlocal connected
+        login = dict(logins[number % len(logins)]) if logins else {"username": f"load_user_{number}"}
+        async with connect(args) as client:
+            auth = await client.call_tool("authenticate", login)
+            if _outcome(auth) != "ok":
+                raise RuntimeError(f"agent {number}: authenticate failed: {auth.content[0].text}")
+            connected += 1
+            if connected == agents:
+                all_connected.set()
+            await ready.wait()
+            while time.perf_counter() < deadline[0]:
+                if arrivals is not None:
+                    arrived, call = await arrivals.get()
+                    await send(client, call, arrived)
+                    continue
+                if budget[0] <= 0:
+                    return
+                budget[0] -= 1
+                await send(client, next_call(), time.perf_counter())
+                if args.think:
+                    await asyncio.sleep(args.think)
+
+    async def arrive() -> None:
+        assert arrivals is not None
+        rnd = random.Random(args.seed)
+        at = time.perf_counter()
+        sent = 0
+        while at < deadline[0] and sent < budget[0]:
+            at += rnd.expovariate(args.rate)
+            delay = at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            arrivals.put_nowait((at, next_call()))
+            sent += 1
+
+    tasks = [asyncio.create_task(agent(i)) for i in range(agents)]
+    waiter = asyncio.create_task(all_connected.wait())
+    await asyncio.wait([waiter, *tasks], return_when=asyncio.FIRST_COMPLETED)
+    if not waiter.done():  # an agent failed before all of them connected
+        waiter.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()  # type: ignore[misc]
+        raise RuntimeError("agents stopped before connecting")
+
+    results.started = time.perf_counter()
+    deadline[0] = results.started + args.duration
+    ready.set()
+    if arrivals is not None:
+        await arrive()
+        # Let agents finish the calls that already arrived, then stop them
+        while not arrivals.empty() and time.perf_counter() < deadline[0]:
+            await asyncio.sleep(0.01)
+        deadline[0] = min(deadline[0], time.perf_counter())
+        results.ended = deadline[0]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    else:
+        await asyncio.gather(*tasks)
+        results.ended = min(deadline[0], time.perf_counter())
+    return results
+
+
+def print_level(agents: int, summary: Dict[str, Any]) -> None:
+    print(f"\n{agents} agents, {summary['seconds']:.1f}s")
+    print(f"{'tool':<24} {'calls':>8} {'calls/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'errors':>7}")
+    rows = list(summary["tools"].items()) + [("(all)", summary["total"])]
+    for tool, s in rows:
+        print(f"{tool:<24} {s['calls']:>8} {s['throughput']:>9.1f} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} "
+              f"{s['p99_ms']:>9.3f} {s['max_ms']:>9.3f} {s['error_rate']:>7.2%}")
+    failures = {o: n for o, n in summary["total"]["outcomes"].items() if o != "ok"}
+    if failures:
+        print("errors: " + ", ".join(f"{o}={n}" for o, n in sorted(failures.items())))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.workload:
+        logins, calls = load_workload(args.workload)
+    else:
+        logins, calls = synthetic_workload(seed=args.seed)
+    if args.write_workload:
+        write_workload(args.write_workload, calls)
+    if args.transport == "memory" and args.books:
+        _use_books_csv(args.books)
+
+    levels = []
+    for agents in args.concurrency:
+        summary = (await run_level(args, agents, logins, calls)).summary()
+        print_level(agents, summary)
+        levels.append({"agents": agents, **summary})
+
+    print(f"\n{'agents':>7} {'calls/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for level in levels:
+        t = level["total"]
+        print(f"{level['agents']:>7} {t['throughput']:>9.1f} {t['p50_ms']:>9.3f} {t['p99_ms']:>9.3f} "
+              f"{t['error_rate']:>7.2%}")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "transport": args.transport,
+            "workload": args.workload or "synthetic",
+            "rate": args.rate,
+            "duration": args.duration,
+            "think": args.think,
+        },
+        "levels": levels,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", default="1,4,16",
+                        type=lambda text: [int(n) for n in text.split(",") if n.strip()],
+                        help="agents per run, e.g. 1,4,16,64 (one run per value)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per run")
+    parser.add_argument("--calls", type=int, default=0, help="stop a run after this many calls (0: no limit)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="arrivals per second across all agents (0: each agent sends back to back)")
+    parser.add_argument("--think", type=float, default=0.0, help="pause after each call, closed loop only")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a call counts as timed out")
+    parser.add_argument("--workload", help="JSON-lines calls or trace file to replay (default: synthetic mix)")
+    parser.add_argument("--write-workload", help="also save the calls replayed to this JSON-lines file")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic mix and arrivals")
+    parser.add_argument("--transport", choices=("memory", "stdio", "http"), default="memory")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="server endpoint for --transport http")
+    parser.add_argument("--books", help="CSV catalog for the in-process server (memory transport)")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,48 @@
 import csv
 import os
-from typing import Dict, Iterable, List, Optional
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .books_index import INDEXED_FIELDS, SUGGEST_FIELDS, BooksIndex, PrefixIndex, index_filter, parse_filter
+from .tracing import span
 
 
 class BooksRepository:
-    def __init__(self, csv_path: str) -> None:
+    # Currency of the dataset's "Price Starting With ($)" column
+    price_currency = "USD"
+
+    def __init__(self, csv_path: str, source: Optional[str] = None) -> None:
         self.csv_path = csv_path
+        # XLSX workbook converted to csv_path by the first load if the CSV is missing
+        self.source = source
         self._data: Optional[List[Dict[str, str]]] = None
+        self._prices: Optional[np.ndarray] = None
+        self._index: Optional[BooksIndex] = None
+        self._prefix: Dict[str, PrefixIndex] = {}
+        self._load_lock = threading.Lock()
 
     def ensure_loaded(self) -> None:
         if self._data is not None:
             return
+        with self._load_lock:
+            if self._data is None:
+                self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.csv_path) and self.source and os.path.exists(self.source):
+            from .util.xlsx_to_csv import xlsx_first_sheet_to_csv
+            os.makedirs(os.path.dirname(os.path.abspath(self.csv_path)), exist_ok=True)
+            # Convert to a private file and rename it into place, so a concurrent
+            # server process never loads a half-written CSV
+            partial = f"{self.csv_path}.{os.getpid()}.partial"
+            try:
+                xlsx_first_sheet_to_csv(self.source, partial)
+                os.replace(partial, self.csv_path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
         if not os.path.exists(self.csv_path):
             raise FileNotFoundError(f"Books CSV not found: {self.csv_path}")
         rows: List[Dict[str, str]] = []
@@ -24,6 +56,8 @@ class BooksRepository:
         if not has_id:
             for i, r in enumerate(rows, start=1):
                 r["id"] = str(i)
+        price_col = _find_col(headers, "price")
+        self._prices = np.array([_parse_price(r.get(price_col)) for r in rows], dtype=np.float64)
         self._data = rows
 
     @property
@@ -32,54 +66,435 @@ class BooksRepository:
         assert self._data is not None
         return list(self._data[0].keys()) if self._data else []
 
+    def __len__(self) -> int:
+        self.ensure_loaded()
+        assert self._data is not None
+        return len(self._data)
+
     def list_all(self) -> List[Dict[str, str]]:
         self.ensure_loaded()
         assert self._data is not None
         return list(self._data)
 
     def get_by_id(self, book_id: str) -> Optional[Dict[str, str]]:
+        index = self.index_of_id(book_id)
+        if index is None:
+            return None
+        assert self._data is not None
+        return self._data[index]
+
+    def index_of_id(self, book_id: str) -> Optional[int]:
         self.ensure_loaded()
         assert self._data is not None
         key_candidates = [k for k in self.headers if k.lower() in ("id", "book_id")] or [self.headers[0]]
         key = key_candidates[0]
-        for row in self._data:
+        for i, row in enumerate(self._data):
             if str(row.get(key, "")).strip() == str(book_id).strip():
-                return row
+                return i
         return None
 
+    def prices(self) -> np.ndarray:
+        """Price column as floats in ``price_currency`` (NaN where missing)."""
+        self.ensure_loaded()
+        assert self._prices is not None
+        return self._prices
+
+    def index(self) -> BooksIndex:
+        """Bitmap indexes of category, year and publisher, built on first use."""
+        self.ensure_loaded()
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    assert self._data is not None
+                    headers = self.headers
+                    columns = {field: [r.get(_find_col(headers, col)) for r in self._data]
+                               for field, col in INDEXED_FIELDS.items()}
+                    self._index = BooksIndex.build(columns, len(self._data))
+        return self._index
+
+    def prefix_index(self, field: str) -> PrefixIndex:
+        """Sorted prefix index of ``field`` (a ``SUGGEST_FIELDS`` name), built on first use."""
+        index = self._prefix.get(field)
+        if index is not None:
+            return index
+        self.ensure_loaded()
+        with self._load_lock:
+            if field not in self._prefix:
+                assert self._data is not None
+                col = _find_col(self.headers, SUGGEST_FIELDS[field])
+                self._prefix[field] = PrefixIndex.build(field, (r.get(col) for r in self._data))
+        return self._prefix[field]
+
+    def has_prefix_index(self, field: str) -> bool:
+        return field in self._prefix
+
+    def rows(self, indices: Iterable[int]) -> List[Dict[str, str]]:
+        self.ensure_loaded()
+        assert self._data is not None
+        return [self._data[i] for i in indices]
+
+    def column_values(self, indices: Sequence[int]) -> List[List[str]]:
+        """Values of every column (in ``headers`` order) at ``indices``, column by column."""
+        self.ensure_loaded()
+        assert self._data is not None
+        data = self._data
+        return [[data[i].get(h) for i in indices] for h in self.headers]
+
     def filter(self,
                genre: Optional[str] = None,
                year: Optional[str] = None,
                author: Optional[str] = None,
                title_contains: Optional[str] = None,
                limit: Optional[int] = None,
-               offset: Optional[int] = None) -> List[Dict[str, str]]:
+               offset: Optional[int] = None,
+               min_price: Optional[float] = None,
+               max_price: Optional[float] = None,
+               prices: Optional[np.ndarray] = None,
+               where: Optional[str] = None) -> List[Dict[str, str]]:
+        indices = self.filter_indices(genre=genre, year=year, author=author, title_contains=title_contains,
+                                      min_price=min_price, max_price=max_price, prices=prices, where=where)
+        if offset is not None:
+            indices = indices[offset:]
+        if limit is not None:
+            indices = indices[:limit]
+        return self.rows(indices)
+
+    def filter_indices(self,
+                       genre: Optional[str] = None,
+                       year: Optional[str] = None,
+                       author: Optional[str] = None,
+                       title_contains: Optional[str] = None,
+                       min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       prices: Optional[np.ndarray] = None,
+                       where: Optional[str] = None) -> List[int]:
+        """
+        Row positions matching every given filter, in dataset order.
+
+        Price bounds are inclusive and compared against ``prices`` when given
+        (e.g. a column already converted to another currency), otherwise
+        against the dataset's own price column. ``where`` is a filter
+        expression over category, year and publisher (see ``books_index``).
+        It and ``year`` are answered from the bitmap indexes before any row
+        is looked at.
+        """
+        candidates, matches = self._plan(genre, year, author, title_contains, min_price, max_price, prices, where)
+        if matches is None:
+            return list(candidates)
+        data = self._data
+        assert data is not None
+        return [i for i in candidates if matches(data[i])]
+
+    def count_matches(self,
+                      genre: Optional[str] = None,
+                      year: Optional[str] = None,
+                      author: Optional[str] = None,
+                      title_contains: Optional[str] = None,
+                      min_price: Optional[float] = None,
+                      max_price: Optional[float] = None,
+                      prices: Optional[np.ndarray] = None,
+                      where: Optional[str] = None,
+                      stop_after: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Number of rows ``filter_indices`` would return, without building the list.
+
+        Returns ``(count, checked)``, where ``checked`` is the number of rows
+        examined one by one. Index and price filters alone are counted from
+        the bitmaps without checking any row. Otherwise candidates are
+        checked in order and counting stops at ``stop_after`` matches, so
+        ``stop_after=1`` answers "is there any?" at the first match.
+        """
+        self.ensure_loaded()
+        if genre is None and author is None and title_contains is None and not _blank_year(year):
+            mask = _price_mask(self.prices() if prices is None else prices, min_price, max_price)
+            return self.index().count(index_filter(where, year), mask), 0
+        candidates, matches = self._plan(genre, year, author, title_contains, min_price, max_price, prices, where)
+        assert matches is not None and self._data is not None
+        data = self._data
+        count = checked = 0
+        for i in candidates:
+            checked += 1
+            if matches(data[i]):
+                count += 1
+                if stop_after is not None and count >= stop_after:
+                    break
+        return count, checked
+
+    def _plan(self,
+              genre: Optional[str],
+              year: Optional[str],
+              author: Optional[str],
+              title_contains: Optional[str],
+              min_price: Optional[float],
+              max_price: Optional[float],
+              prices: Optional[np.ndarray],
+              where: Optional[str]) -> Tuple[Iterable[int], Optional[Callable[[Dict[str, str]], bool]]]:
+        """
+        Candidate rows left by the index and price filters, in order, and the
+        check the remaining filters make on each (None when nothing is left
+        to check).
+        """
         self.ensure_loaded()
         assert self._data is not None
 
+        mask = _price_mask(self.prices() if prices is None else prices, min_price, max_price)
+        node = index_filter(where, year)
+        if node is not None:
+            selected = self.index().rows_of(node)
+            if mask is not None:
+                selected = selected[mask[selected]]
+            candidates: Iterable[int] = selected.tolist()
+        elif mask is not None:
+            candidates = np.flatnonzero(mask).tolist()
+        else:
+            candidates = range(len(self._data))
+        # A blank year matches rows without one, which the index does not list
+        year_s = "" if _blank_year(year) else None
+        if genre is None and year_s is None and author is None and title_contains is None:
+            return candidates, None
+
+        genre_col = _find_col(self.headers, "genre")
+        year_col = _find_col(self.headers, "year")
+        author_col = _find_col(self.headers, "author")
+        title_col = _find_col(self.headers, "title")
+        genre_l = genre.lower() if genre is not None else None
+        title_l = title_contains.lower() if title_contains is not None else None
+
         def matches(row: Dict[str, str]) -> bool:
-            if genre is not None:
-                genre_col = _find_col(self.headers, "genre")
+            if genre_l is not None:
                 genre_val = str(row.get(genre_col, ""))
                 # Check if genre is contained in the category string (case insensitive)
-                if genre.lower() not in genre_val.lower():
+                if genre_l not in genre_val.lower():
                     return False
-            if year is not None and str(row.get(_find_col(self.headers, "year"), "")).strip() != str(year).strip():
+            if year_s is not None and str(row.get(year_col, "")).strip() != year_s:
                 return False
-            if author is not None and not _eq_ci(row.get(_find_col(self.headers, "author"), ""), author):
+            if author is not None and not _eq_ci(row.get(author_col, ""), author):
                 return False
-            if title_contains is not None:
-                title_val = str(row.get(_find_col(self.headers, "title"), ""))
-                if title_contains.lower() not in title_val.lower():
+            if title_l is not None:
+                title_val = str(row.get(title_col, ""))
+                if title_l not in title_val.lower():
                     return False
             return True
 
-        filtered: List[Dict[str, str]] = [row for row in self._data if matches(row)]
-        if offset is not None:
-            filtered = filtered[offset:]
-        if limit is not None:
-            filtered = filtered[:limit]
-        return filtered
+        return candidates, matches
+
+
+class ConvertedPriceCache:
+    """
+    Price columns converted to other currencies, one vectorized multiply each.
+
+    Columns are keyed by currency and tied to the rate snapshot version they
+    were computed from; a new snapshot version drops every cached column.
+    """
+
+    def __init__(self, repo: BooksRepository) -> None:
+        self.repo = repo
+        # (snapshot version, {currency: column}), swapped as one reference
+        self._cache: Tuple[Optional[int], Dict[str, np.ndarray]] = (None, {})
+
+    def column(self, currency: str, snapshot: Any) -> np.ndarray:
+        c = currency.upper()
+        version, columns = self._cache
+        if version != snapshot.version:
+            version, columns = snapshot.version, {}
+            self._cache = (version, columns)
+        col = columns.get(c)
+        if col is None:
+            rate = snapshot.rates.rate(self.repo.price_currency, c)
+            col = self.repo.prices() * rate
+            columns[c] = col
+        return col
+
+
+def query_books(repo: Any,
+                book_id: Optional[str] = None,
+                genre: Optional[str] = None,
+                year: Optional[str] = None,
+                author: Optional[str] = None,
+                title: Optional[str] = None,
+                limit: Optional[int] = None,
+                offset: Optional[int] = None,
+                min_price: Optional[float] = None,
+                max_price: Optional[float] = None,
+                prices: Optional[np.ndarray] = None,
+                price_key: Optional[str] = None,
+                format: str = "records",
+                dictionary: bool = True,
+                where: Optional[str] = None,
+                mode: str = "rows") -> Dict[str, Any]:
+    """
+    Run one ``books_query`` against ``repo`` and return the data part of the answer.
+
+    ``repo`` is anything with the repository read API (``BooksRepository`` or a
+    ``BooksSnapshot``), which lets the same code run in the server process and
+    in worker processes. Returns ``{"data": row}`` for an id lookup
+    (``{"data": None}`` when missing) or ``{"data": [rows]}`` for a search,
+    plus ``"scanned"``, the number of rows the lookup or filters examined.
+    When ``prices`` (a price column, e.g. converted to another currency) and
+    ``price_key`` are given, each returned row gets that price under
+    ``price_key``.
+
+    With ``format="table"`` a search returns ``{"table": {...}}`` instead,
+    built by ``encode_table`` from the repository's columns. ``where`` is a
+    filter expression (see ``books_index``) applied with the other filters.
+
+    ``mode="count"`` returns ``{"count": n}`` and ``mode="exists"``
+    ``{"exists": bool}`` instead of rows, from ``count_matches``: no row is
+    built, ``limit``/``offset`` do not apply, and an exists query stops at
+    the first match.
+    """
+    with span("books.load"):
+        repo.ensure_loaded()
+    if mode != "rows":
+        if book_id not in (None, ""):
+            with span("books.lookup"):
+                index = repo.index_of_id(str(book_id))
+            count, checked = (0, len(repo)) if index is None else (1, index + 1)
+        else:
+            with span("books.count", mode=mode) as stage:
+                count, checked = repo.count_matches(genre=genre, year=year, author=author, title_contains=title,
+                                                    min_price=min_price, max_price=max_price, prices=prices,
+                                                    where=where, stop_after=1 if mode == "exists" else None)
+                stage.set(matched=count)
+        if mode == "exists":
+            return {"exists": count > 0, "scanned": checked}
+        return {"count": count, "scanned": checked}
+    if book_id not in (None, ""):
+        with span("books.lookup"):
+            index = repo.index_of_id(str(book_id))
+        if index is None:
+            return {"data": None, "scanned": len(repo)}
+        item = repo.rows([index])[0]
+        if prices is not None and price_key:
+            item = dict(item, **{price_key: _round_price(prices[index])})
+        # Id lookups stop at the first match
+        return {"data": item, "scanned": index + 1}
+
+    with span("books.filter") as stage:
+        indices = repo.filter_indices(genre=genre, year=year, author=author, title_contains=title,
+                                      min_price=min_price, max_price=max_price, prices=prices, where=where)
+        stage.set(matched=len(indices))
+    if offset is not None:
+        indices = indices[offset:]
+    if limit is not None:
+        indices = indices[:limit]
+    if format == "table":
+        with span("books.table", rows=len(indices)):
+            columns = repo.headers
+            values = repo.column_values(indices)
+            if prices is not None and price_key:
+                columns = columns + [price_key]
+                values.append([_round_price(p) for p in (prices[indices].tolist() if len(indices) else [])])
+            table = encode_table(columns, values, dictionary=dictionary)
+        return {"table": table, "scanned": len(repo)}
+    with span("books.rows", rows=len(indices)):
+        data = repo.rows(indices)
+        if prices is not None and price_key:
+            # One vectorized gather for the whole page
+            page_prices = prices[indices].tolist() if len(indices) else []
+            data = [dict(row, **{price_key: _round_price(p)}) for row, p in zip(data, page_prices)]
+    return {"data": data, "scanned": len(repo)}
+
+
+def encode_table(columns: List[str], values: List[List[Any]], dictionary: bool = True) -> Dict[str, Any]:
+    """
+    Tabular result: ``columns`` once, then one array of values per row.
+
+    ``values`` holds one list per column. With ``dictionary`` set, a column
+    whose values mostly repeat (at most half of them distinct, e.g. category
+    or publisher) is sent as a list of distinct values under
+    ``dictionaries[column]``, and its cells become indexes into that list.
+    """
+    n = len(values[0]) if values else 0
+    dictionaries: Dict[str, List[Any]] = {}
+    if dictionary and n >= 4:
+        for j, col in enumerate(values):
+            distinct = list(dict.fromkeys(col))  # first-seen order
+            if len(distinct) * 2 <= n:
+                codes = {v: k for k, v in enumerate(distinct)}
+                values[j] = [codes[v] for v in col]
+                dictionaries[columns[j]] = distinct
+    table: Dict[str, Any] = {"columns": columns, "rows": [list(row) for row in zip(*values)]}
+    if dictionaries:
+        table["dictionaries"] = dictionaries
+    return table
+
+
+def query_key(book_id: Optional[str] = None,
+              genre: Optional[str] = None,
+              year: Optional[str] = None,
+              author: Optional[str] = None,
+              title: Optional[str] = None,
+              limit: Optional[int] = None,
+              offset: Optional[int] = None,
+              min_price: Optional[float] = None,
+              max_price: Optional[float] = None,
+              price_key: Optional[str] = None,
+              format: str = "records",
+              dictionary: bool = True,
+              where: Optional[str] = None,
+              mode: str = "rows") -> Tuple[Any, ...]:
+    """
+    Hashable key for ``query_books`` arguments; equal keys give equal results.
+
+    Values are normalized the way the filters compare them (case-insensitive
+    genre/title/author, stripped year and id), so e.g. ``genre="Fiction"`` and
+    ``genre="fiction"`` share a key. A ``where`` expression is keyed by its
+    parsed form, so it must be valid. Count and exists queries ignore the
+    page and output options, so those are left out of their keys.
+    """
+    if book_id not in (None, ""):
+        return ("id", str(book_id).strip(), price_key if mode == "rows" else None, mode)
+    if mode != "rows":
+        limit = offset = price_key = None
+        format, dictionary = "records", True
+    return (
+        mode,
+        genre.lower() if isinstance(genre, str) else _hashable(genre),
+        str(year).strip() if year is not None else None,
+        author.strip().lower() if isinstance(author, str) else _hashable(author),
+        title.lower() if isinstance(title, str) else _hashable(title),
+        _hashable(limit),
+        _hashable(offset),
+        float(min_price) if isinstance(min_price, (int, float)) else _hashable(min_price),
+        float(max_price) if isinstance(max_price, (int, float)) else _hashable(max_price),
+        price_key,
+        _hashable(format),
+        bool(dictionary),
+        parse_filter(where) if isinstance(where, str) else _hashable(where),
+    )
+
+
+def _hashable(value: Any) -> Any:
+    return value if value is None or isinstance(value, (str, int, float)) else repr(value)
+
+
+def _price_mask(column: np.ndarray, min_price: Optional[float], max_price: Optional[float]) -> Optional[np.ndarray]:
+    """Rows priced within the inclusive bounds, or None when neither bound is given."""
+    if min_price is None and max_price is None:
+        return None
+    mask = ~np.isnan(column)
+    if min_price is not None:
+        mask &= column >= float(min_price)
+    if max_price is not None:
+        mask &= column <= float(max_price)
+    return mask
+
+
+def _blank_year(year: Optional[str]) -> bool:
+    return year is not None and not str(year).strip()
+
+
+def _round_price(price: float) -> Optional[float]:
+    """Round a price for display, mapping missing prices (NaN) to None."""
+    return None if price != price else round(float(price), 2)
+
+
+def _parse_price(value: Optional[str]) -> float:
+    try:
+        return float(str(value).replace(",", "").replace("$", "").strip())
+    except (TypeError, ValueError):
+        return float("nan")
 
 
 def _find_col(headers: Iterable[str], target: str) -> str:
@@ -93,6 +508,7 @@ def _find_col(headers: Iterable[str], target: str) -> str:
         "author": {"authors", "writer"},
         "year": {"publication_year", "year_published", "publish date (year)"},
         "genre": {"category", "genres"},
+        "price": {"price starting with ($)", "price_usd", "list_price"},
     }
     if target in aliases:
         for h in headers:
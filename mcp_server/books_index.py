@@ -0,0 +1,453 @@
+"""
+Bitmap indexes over the books dataset's categorical fields, and the boolean
+filter expressions answered from them.
+
+``BooksIndex`` keeps, for each indexed field (``category``, ``year`` and
+``publisher``), a dictionary of the field's distinct normalized values and
+the rows holding each one. Category cells are composite ("Fiction ,
+Romance"), so they are split on commas and a row is listed under every
+category it names.
+
+Row lists are stored compactly: per field, one sorted ``uint32`` array of
+row numbers grouped by value, plus each value's offset into it, so a value
+costs 4 bytes per row it occurs on however large the dataset is. A query
+turns the lists it needs into bitmaps, Python ints with bit ``i`` set for
+row ``i``; ``&``, ``|`` and ``& ~`` on those run in C a machine word at a
+time. A filter such as::
+
+    category:fiction AND NOT category:romance AND (year:2001 OR year:2002)
+
+then costs a few bitwise operations instead of a Python loop over every
+row. Bitmaps of recently used terms are cached.
+
+Filter syntax: ``field:value`` terms combined with ``AND`` (also implied
+between adjacent terms), ``OR``, ``NOT`` and parentheses. A value is a word
+or a double-quoted string (``publisher:"Simon & Schuster"``); keywords and
+values are case-insensitive. ``value*`` matches every value starting with
+``value``, and ``year:1990..1999`` every year in the range. ``genre`` is
+accepted for ``category``.
+
+``PrefixIndex`` backs ``books_suggest``: the distinct values of a text
+field (title, author or publisher) under sorted normalized keys, so the
+completions of a prefix are one contiguous range found by binary search.
+"""
+
+import bisect
+import functools
+import itertools
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Indexed fields and the dataset column each is read from (see books._find_col)
+INDEXED_FIELDS = {"category": "genre", "year": "year", "publisher": "publisher"}
+_FIELD_ALIASES = {"genre": "category", "categories": "category"}
+
+# Text fields offered by books_suggest and the dataset column each is read from
+SUGGEST_FIELDS = {"title": "title", "author": "author", "publisher": "publisher"}
+
+# Cached term bitmaps per index
+_CACHE_SIZE = 256
+# Deepest parenthesis nesting a filter may use
+_MAX_DEPTH = 32
+
+Node = Tuple[Any, ...]
+
+_TOKENS = re.compile(r"""
+    \s*(?:
+        (?P<open>\() | (?P<close>\)) |
+        (?P<field>[A-Za-z_]+):(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<word>[^\s()"]+)) |
+        (?P<keyword>[^\s()"]+)
+    )""", re.VERBOSE)
+_RANGE = re.compile(r"^(\d+)\.\.(\d+)$")
+
+
+class FilterError(ValueError):
+    """A filter expression that cannot be parsed."""
+
+
+def field_values(field: str, text: Any) -> List[str]:
+    """Normalized values of ``field`` in one cell; categories split on commas."""
+    text = "" if text is None else str(text)
+    if field == "category":
+        return list(dict.fromkeys(c.strip().lower() for c in text.split(",") if c.strip()))
+    value = _normalize(field, text)
+    return [value] if value else []
+
+
+def _normalize(field: str, value: str) -> str:
+    # Years compare as written (stripped), text fields case-insensitively
+    return value.strip() if field == "year" else value.strip().lower()
+
+
+class ValueIndex:
+    """Distinct values of one field with the rows holding each, as sorted row lists."""
+
+    def __init__(self, values: List[str], offsets: np.ndarray, rows: np.ndarray, n: int) -> None:
+        # Rows of values[k] are rows[offsets[k]:offsets[k + 1]], ascending
+        self.values = values
+        self.offsets = offsets
+        self.rows = rows
+        self.n = n
+        self._ids = {v: k for k, v in enumerate(values)}
+
+    @classmethod
+    def build(cls, cells: Iterable[Sequence[str]], n: int) -> "ValueIndex":
+        """Index the normalized values of each row (``cells[i]`` for row ``i``)."""
+        postings: Dict[str, List[int]] = {}
+        for i, values in enumerate(cells):
+            for v in values:
+                postings.setdefault(v, []).append(i)
+        values = sorted(postings)
+        lists = [postings[v] for v in values]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        if lists:
+            offsets[1:] = np.cumsum([len(rows) for rows in lists])
+        rows = np.fromiter(itertools.chain.from_iterable(lists), dtype=np.uint32, count=int(offsets[-1]))
+        return cls(values, offsets, rows, n)
+
+    def ids(self, predicate: Callable[[str], bool]) -> List[int]:
+        """Positions in ``values`` of the values matching ``predicate``."""
+        return [k for k, v in enumerate(self.values) if predicate(v)]
+
+    def id_of(self, value: str) -> Optional[int]:
+        return self._ids.get(value)
+
+    def count(self, k: int) -> int:
+        """Number of rows holding ``values[k]``."""
+        return int(self.offsets[k + 1] - self.offsets[k])
+
+    def bitmap(self, ids: Sequence[int]) -> int:
+        """Bitmap of the rows holding any of the values at ``ids``."""
+        if not ids:
+            return 0
+        mask = np.zeros(self.n, dtype=bool)
+        for k in ids:
+            mask[self.rows[self.offsets[k]:self.offsets[k + 1]]] = True
+        return to_bitmap(mask)
+
+
+class BooksIndex:
+    """Value indexes of the dataset's categorical fields, queried with filter expressions."""
+
+    def __init__(self, fields: Dict[str, ValueIndex], n: int) -> None:
+        self.fields = fields
+        self.n = n
+        self.universe = (1 << n) - 1
+        self._cache: Dict[Node, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, columns: Dict[str, Sequence[Any]], n: int) -> "BooksIndex":
+        """Index ``columns[field]`` (one raw cell per row) for every field in ``INDEXED_FIELDS``."""
+        return cls({field: ValueIndex.build((field_values(field, cell) for cell in columns[field]), n)
+                    for field in INDEXED_FIELDS}, n)
+
+    def select(self, expression: str) -> int:
+        """Bitmap of the rows matching the filter ``expression``."""
+        return self.evaluate(parse_filter(expression))
+
+    def rows(self, expression: str) -> np.ndarray:
+        """Rows matching the filter ``expression``, ascending."""
+        return self.rows_of(parse_filter(expression))
+
+    def rows_of(self, node: Node) -> np.ndarray:
+        """Rows matching the parsed filter ``node``, ascending."""
+        if node[0] == "term":
+            # One value's row list is already the answer
+            index = self.fields[node[1]]
+            k = index.id_of(node[2])
+            if k is None:
+                return np.empty(0, dtype=np.int64)
+            return index.rows[index.offsets[k]:index.offsets[k + 1]].astype(np.int64)
+        return bitmap_rows(self.evaluate(node), self.n)
+
+    def count(self, node: Optional[Node], mask: Optional[np.ndarray] = None) -> int:
+        """
+        Number of rows matching ``node`` (every row when None) and ``mask``.
+
+        A single term is counted from its row list's length; anything else
+        is the population count of the combined bitmap. No row is read.
+        """
+        if mask is None:
+            if node is None:
+                return self.n
+            if node[0] == "term":
+                index = self.fields[node[1]]
+                k = index.id_of(node[2])
+                return 0 if k is None else index.count(k)
+            return self.evaluate(node).bit_count()
+        if node is None:
+            return int(np.count_nonzero(mask))
+        return (self.evaluate(node) & to_bitmap(mask)).bit_count()
+
+    def evaluate(self, node: Node) -> int:
+        kind = node[0]
+        if kind == "and":
+            # AND the positive terms, then clear everything the NOT terms match
+            matched: Optional[int] = None
+            excluded = 0
+            for child in node[1]:
+                if child[0] == "not":
+                    excluded |= self.evaluate(child[1])
+                else:
+                    bits = self.evaluate(child)
+                    matched = bits if matched is None else matched & bits
+                if matched == 0:
+                    return 0
+            matched = self.universe if matched is None else matched
+            return matched & ~excluded if excluded else matched
+        if kind == "or":
+            bits = 0
+            for child in node[1]:
+                bits |= self.evaluate(child)
+            return bits
+        if kind == "not":
+            return self.universe & ~self.evaluate(node[1])
+        return self._term(node)
+
+    def _term(self, node: Node) -> int:
+        bits = self._cache.get(node)
+        if bits is not None:
+            return bits
+        kind, field = node[0], node[1]
+        index = self.fields[field]
+        if kind == "term":
+            k = index.id_of(node[2])
+            ids = [] if k is None else [k]
+        elif kind == "prefix":
+            ids = index.ids(lambda v: v.startswith(node[2]))
+        else:  # range
+            lo, hi = node[2], node[3]
+            ids = index.ids(lambda v: v.isdigit() and lo <= int(v) <= hi)
+        bits = index.bitmap(ids)
+        with self._lock:
+            if len(self._cache) >= _CACHE_SIZE:
+                self._cache.clear()
+            self._cache[node] = bits
+        return bits
+
+
+class PrefixIndex:
+    """
+    Distinct values of one text field, sorted by normalized key, with their frequencies.
+
+    Keys are lowercased with whitespace collapsed (and, for authors, a
+    leading "By " dropped, as the dataset writes "By Jane Austen"). Values
+    differing only in case or spacing share a key and are shown in their
+    most frequent spelling, which is the form ``books_query`` matches.
+    """
+
+    def __init__(self, keys: List[str], display: List[str], counts: np.ndarray, field: str) -> None:
+        self.keys = keys
+        self.display = display
+        self.counts = counts
+        self.field = field
+        # Most frequent values first, for an empty prefix
+        self._top = np.lexsort((np.arange(len(keys)), -counts))
+
+    @classmethod
+    def build(cls, field: str, cells: Iterable[Any]) -> "PrefixIndex":
+        spellings: Dict[str, Dict[str, int]] = {}
+        for cell in cells:
+            value = "" if cell is None else str(cell).strip()
+            key = suggest_key(field, value)
+            if key:
+                variants = spellings.setdefault(key, {})
+                variants[value] = variants.get(value, 0) + 1
+        keys = sorted(spellings)
+        display = [max(spellings[k].items(), key=lambda item: item[1])[0] for k in keys]
+        counts = np.array([sum(spellings[k].values()) for k in keys], dtype=np.int64)
+        return cls(keys, display, counts, field)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Up to ``limit`` ``(value, count)`` pairs whose key starts with ``prefix``, most frequent first."""
+        if limit <= 0:
+            return []
+        key = suggest_key(self.field, prefix, partial=True)
+        if not key:
+            top = self._top[:limit]
+            return [(self.display[i], int(self.counts[i])) for i in top.tolist()]
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_left(self.keys, key + "\U0010ffff", lo)
+        counts = self.counts[lo:hi]
+        if hi - lo > limit:
+            picked = np.argpartition(-counts, limit - 1)[:limit]
+        else:
+            picked = np.arange(hi - lo)
+        # Most frequent first, ties in key order
+        picked = picked[np.lexsort((picked, -counts[picked]))]
+        return [(self.display[lo + i], int(counts[i])) for i in picked.tolist()]
+
+
+def suggest_key(field: str, value: str, partial: bool = False) -> str:
+    """
+    Normalized ``PrefixIndex`` key of ``value``. With ``partial`` (a typed
+    prefix) trailing whitespace is kept, so "jane " does not match "janet".
+    """
+    key = " ".join(value.lower().split())
+    if partial and key and value[-1:].isspace():
+        key += " "
+    if field == "author" and key.startswith("by "):
+        key = key[3:]
+    return key
+
+
+def index_filter(where: Optional[str], year: Optional[str] = None) -> Optional[Node]:
+    """
+    The part of a query the index answers: the ``where`` expression AND an
+    exact ``year``. None when the query has neither. A blank year is left
+    out, since rows without a year are not indexed.
+    """
+    nodes = []
+    if where is not None:
+        nodes.append(parse_filter(where))
+    if year is not None and str(year).strip():
+        nodes.append(("term", "year", str(year).strip()))
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
+
+
+def to_bitmap(mask: np.ndarray) -> int:
+    """Bitmap (bit ``i`` for row ``i``) of a boolean row mask."""
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def bitmap_rows(bits: int, n: int) -> np.ndarray:
+    """Rows set in ``bits``, ascending."""
+    if not bits:
+        return np.empty(0, dtype=np.int64)
+    packed = np.frombuffer(bits.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, count=n, bitorder="little"))
+
+
+@functools.lru_cache(maxsize=256)
+def parse_filter(expression: str) -> Node:
+    """
+    Parse a filter expression into a tree of tuples.
+
+    Leaves are ``("term", field, value)``, ``("prefix", field, prefix)`` and
+    ``("range", field, lo, hi)`` with normalized values; inner nodes are
+    ``("and", children)``, ``("or", children)`` and ``("not", child)``. The
+    tree is hashable, so equal filters share cache and coalescing keys.
+    Raises ``FilterError`` for malformed expressions.
+    """
+    tokens = _tokenize(expression)
+    if not tokens:
+        raise FilterError("Filter is empty")
+    parser = _Parser(tokens)
+    node = parser.parse_or(0)
+    if parser.pos < len(tokens):
+        raise FilterError(f"Unexpected {_describe(tokens[parser.pos])}")
+    return node
+
+
+def _tokenize(expression: str) -> List[Tuple[str, Any]]:
+    tokens: List[Tuple[str, Any]] = []
+    expression = expression.rstrip()
+    pos = 0
+    while pos < len(expression):
+        m = _TOKENS.match(expression, pos)
+        if m is None:
+            raise FilterError(f"Cannot parse filter at position {pos}: {expression[pos:pos + 20]!r}")
+        pos = m.end()
+        if m.group("open"):
+            tokens.append(("(", None))
+        elif m.group("close"):
+            tokens.append((")", None))
+        elif m.group("field"):
+            value = m.group("word")
+            if value is None:
+                value = re.sub(r"\\(.)", r"\1", m.group("quoted"))
+            tokens.append(("term", _term(m.group("field"), value)))
+        else:
+            word = m.group("keyword")
+            if word.endswith(":") and expression[pos:pos + 1] == '"':
+                raise FilterError(f"Unterminated quoted value after {word!r}")
+            if word.endswith(":"):
+                raise FilterError(f"Missing value after {word!r}")
+            if word.upper() not in ("AND", "OR", "NOT"):
+                raise FilterError(f"Expected field:value, AND, OR or NOT, not {word!r}")
+            tokens.append((word.upper(), None))
+    return tokens
+
+
+def _term(field: str, value: str) -> Node:
+    name = _FIELD_ALIASES.get(field.lower(), field.lower())
+    if name not in INDEXED_FIELDS:
+        raise FilterError(f"Unknown filter field {field!r} (use {', '.join(INDEXED_FIELDS)})")
+    if name == "year":
+        m = _RANGE.match(value.strip())
+        if m:
+            lo, hi = int(m.group(1)), int(m.group(2))
+            if lo > hi:
+                raise FilterError(f"Empty year range {value!r}")
+            return ("range", name, lo, hi)
+    if value.endswith("*"):
+        return ("prefix", name, _normalize(name, value[:-1]))
+    return ("term", name, _normalize(name, value))
+
+
+class _Parser:
+    """Recursive descent over the tokens: OR binds looser than AND, AND than NOT."""
+
+    def __init__(self, tokens: List[Tuple[str, Any]]) -> None:
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse_or(self, depth: int) -> Node:
+        children = [self.parse_and(depth)]
+        while self._peek() == "OR":
+            self.pos += 1
+            children.append(self.parse_and(depth))
+        return children[0] if len(children) == 1 else ("or", tuple(children))
+
+    def parse_and(self, depth: int) -> Node:
+        children = [self.parse_unary(depth)]
+        while self._peek() in ("AND", "NOT", "term", "("):
+            if self._peek() == "AND":
+                self.pos += 1
+            children.append(self.parse_unary(depth))
+        return children[0] if len(children) == 1 else ("and", tuple(children))
+
+    def parse_unary(self, depth: int) -> Node:
+        kind = self._peek()
+        if kind is None:
+            raise FilterError("Filter ends unexpectedly")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if kind == "NOT":
+            # A run of NOTs is consumed here, not by recursion, so its length is unbounded
+            negate = True
+            while self._peek() == "NOT":
+                self.pos += 1
+                negate = not negate
+            child = self.parse_unary(depth)
+            if not negate:
+                return child
+            return child[1] if child[0] == "not" else ("not", child)
+        if kind == "(":
+            if depth >= _MAX_DEPTH:
+                raise FilterError("Filter nests parentheses too deeply")
+            node = self.parse_or(depth + 1)
+            if self._peek() != ")":
+                raise FilterError("Missing closing parenthesis")
+            self.pos += 1
+            return node
+        if kind == "term":
+            return token[1]
+        raise FilterError(f"Unexpected {_describe(token)}")
+
+
+def _describe(token: Tuple[str, Any]) -> str:
+    return "term" if token[0] == "term" else repr(token[0])
@@ -0,0 +1,418 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .books import BooksRepository, _blank_year, _find_col, _price_mask
+from .books_index import INDEXED_FIELDS, SUGGEST_FIELDS, BooksIndex, PrefixIndex, ValueIndex, index_filter
+from .books_vectors import BookVectors
+
+
+_MAGIC = b"BKSNAP03"
+_ALIGN = 8
+
+# Search columns: (logical column, lowercase?) scanned by filter_indices
+_SEARCH_COLUMNS = (("title", True), ("author", True), ("genre", True), ("year", False), ("id", False))
+
+
+class BooksSnapshot:
+    """
+    Read-only, memory-mapped columnar copy of a ``BooksRepository``.
+
+    The snapshot file holds each column as one UTF-8 blob plus an offsets
+    array, the price column as float64, and a normalized (stripped, and for
+    text searches lowercased) ``\\x00``-separated blob per searchable column,
+    the row lists of the ``BooksIndex`` bitmap indexes and the ``BookVectors``
+    similarity vectors.
+    Every process that opens the same file maps the same page-cache pages, so
+    N worker processes cost one copy of the dataset plus their own small
+    decoded pages.
+
+    Implements the repository read API (``headers``, ``prices``, ``rows``,
+    ``index_of_id``, ``get_by_id``, ``filter_indices``, ``filter``,
+    ``prefix_index``), so it can
+    stand in for ``BooksRepository`` anywhere the data is only queried.
+    Filters scan the search blobs with ``mmap.find`` instead of matching
+    Python dicts row by row; filter expressions use the index, whose row
+    lists are read from the mapping rather than rebuilt in every process.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Not a books snapshot: {path}")
+        (header_len,) = struct.unpack_from("<Q", mm, len(_MAGIC))
+        start = len(_MAGIC) + 8
+        meta = json.loads(mm[start:start + header_len].decode("utf-8"))
+        self._headers: List[str] = meta["headers"]
+        self._n: int = meta["rows"]
+        self.price_currency: str = meta["price_currency"]
+        self._search_cols: Dict[str, str] = meta["search_columns"]
+        self._arrays: Dict[str, Tuple[int, int]] = {k: (v[0], v[1]) for k, v in meta["arrays"].items()}
+        self._prices = self._array("prices", np.float64)
+        self._offsets = [self._array(f"col{j}.offsets", np.int64) for j in range(len(self._headers))]
+        self._blob_starts = [self._arrays[f"col{j}.data"][0] for j in range(len(self._headers))]
+        self._search: Dict[str, Tuple[int, int, np.ndarray]] = {}
+        for name, _ in _SEARCH_COLUMNS:
+            offset, length = self._arrays[f"search.{name}"]
+            self._search[name] = (offset, offset + length, self._array(f"search.{name}.starts", np.int64))
+        self._index = BooksIndex({
+            field: ValueIndex(values, self._array(f"index.{field}.offsets", np.int64),
+                              self._array(f"index.{field}.rows", np.uint32), self._n)
+            for field, values in meta["index_values"].items()
+        }, self._n)
+        self._vectors: Optional[BookVectors] = None
+        self._prefix: Dict[str, PrefixIndex] = {}
+        self._prefix_lock = threading.Lock()
+
+    def _array(self, name: str, dtype: Any) -> np.ndarray:
+        offset, length = self._arrays[name]
+        return np.frombuffer(self._mm, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def close(self) -> None:
+        # Drop the numpy views first; the mmap cannot close while they export its buffer
+        self._prices = None  # type: ignore[assignment]
+        self._offsets = []
+        self._search = {}
+        self._index = None  # type: ignore[assignment]
+        self._vectors = None
+        self._prefix = {}
+        self._mm.close()
+
+    def ensure_loaded(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def headers(self) -> List[str]:
+        return list(self._headers)
+
+    def prices(self) -> np.ndarray:
+        """Price column as floats in ``price_currency`` (NaN where missing)."""
+        return self._prices
+
+    def rows(self, indices: Iterable[int]) -> List[Dict[str, str]]:
+        mm = self._mm
+        cols = list(zip(self._headers, self._blob_starts, self._offsets))
+        out = []
+        for i in indices:
+            row = {}
+            for name, base, offs in cols:
+                row[name] = mm[base + int(offs[i]):base + int(offs[i + 1])].decode("utf-8")
+            out.append(row)
+        return out
+
+    def column_values(self, indices: Sequence[int]) -> List[List[str]]:
+        """Values of every column (in ``headers`` order) at ``indices``, column by column."""
+        mm = self._mm
+        return [
+            [mm[base + int(offs[i]):base + int(offs[i + 1])].decode("utf-8") for i in indices]
+            for base, offs in zip(self._blob_starts, self._offsets)
+        ]
+
+    def list_all(self) -> List[Dict[str, str]]:
+        return self.rows(range(self._n))
+
+    def index(self) -> BooksIndex:
+        """Bitmap indexes of category, year and publisher."""
+        return self._index
+
+    def prefix_index(self, field: str) -> PrefixIndex:
+        """Sorted prefix index of ``field`` (a ``SUGGEST_FIELDS`` name), built from its column on first use."""
+        index = self._prefix.get(field)
+        if index is not None:
+            return index
+        with self._prefix_lock:
+            if field not in self._prefix:
+                col = _find_col(self._headers, SUGGEST_FIELDS[field])
+                if col in self._headers:
+                    j = self._headers.index(col)
+                    mm, base, offs = self._mm, self._blob_starts[j], self._offsets[j]
+                    cells: Iterable[Optional[str]] = (mm[base + int(offs[i]):base + int(offs[i + 1])].decode("utf-8")
+                                                      for i in range(self._n))
+                else:
+                    cells = ()
+                self._prefix[field] = PrefixIndex.build(field, cells)
+        return self._prefix[field]
+
+    def has_prefix_index(self, field: str) -> bool:
+        return field in self._prefix
+
+    def vectors(self) -> BookVectors:
+        """Similarity vectors, read from the mapping as they were written."""
+        if self._vectors is None:
+            self._vectors = BookVectors(self._array("vectors.indptr", np.int64),
+                                        self._array("vectors.indices", np.int32),
+                                        self._array("vectors.data", np.float32))
+        return self._vectors
+
+    def index_of_id(self, book_id: str) -> Optional[int]:
+        hits = self._exact("id", str(book_id).strip(), first=True)
+        return int(hits[0]) if len(hits) else None
+
+    def get_by_id(self, book_id: str) -> Optional[Dict[str, str]]:
+        index = self.index_of_id(book_id)
+        return None if index is None else self.rows([index])[0]
+
+    def filter(self,
+               genre: Optional[str] = None,
+               year: Optional[str] = None,
+               author: Optional[str] = None,
+               title_contains: Optional[str] = None,
+               limit: Optional[int] = None,
+               offset: Optional[int] = None,
+               min_price: Optional[float] = None,
+               max_price: Optional[float] = None,
+               prices: Optional[np.ndarray] = None,
+               where: Optional[str] = None) -> List[Dict[str, str]]:
+        indices = self.filter_indices(genre=genre, year=year, author=author, title_contains=title_contains,
+                                      min_price=min_price, max_price=max_price, prices=prices, where=where)
+        if offset is not None:
+            indices = indices[offset:]
+        if limit is not None:
+            indices = indices[:limit]
+        return self.rows(indices)
+
+    def filter_indices(self,
+                       genre: Optional[str] = None,
+                       year: Optional[str] = None,
+                       author: Optional[str] = None,
+                       title_contains: Optional[str] = None,
+                       min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       prices: Optional[np.ndarray] = None,
+                       where: Optional[str] = None) -> List[int]:
+        """Same matching rules and result order as ``BooksRepository.filter_indices``."""
+        selections = self._selections(genre, year, author, title_contains, min_price, max_price, prices, where)
+        if not selections:
+            return list(range(self._n))
+        # Intersect the smallest selections first
+        selections.sort(key=len)
+        result = selections[0]
+        for other in selections[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result.tolist()
+
+    def count_matches(self,
+                      genre: Optional[str] = None,
+                      year: Optional[str] = None,
+                      author: Optional[str] = None,
+                      title_contains: Optional[str] = None,
+                      min_price: Optional[float] = None,
+                      max_price: Optional[float] = None,
+                      prices: Optional[np.ndarray] = None,
+                      where: Optional[str] = None,
+                      stop_after: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Same as ``BooksRepository.count_matches``. With text filters, the
+        ``checked`` rows are those of the scanned search blobs.
+        """
+        text_filters = [f for f in (genre, author, title_contains) if f is not None]
+        if _blank_year(year):
+            text_filters.append(year)
+        if not text_filters:
+            mask = _price_mask(self._prices if prices is None else prices, min_price, max_price)
+            return self._index.count(index_filter(where, year), mask), 0
+        if stop_after == 1 and len(text_filters) == 1 and where is None and not year \
+                and min_price is None and max_price is None:
+            # A lone text filter stops its scan at the first match
+            if genre is not None:
+                hits = self._contains("genre", genre.lower(), first=True)
+            elif author is not None:
+                hits = self._exact("author", str(author).strip().lower(), first=True)
+            elif title_contains is not None:
+                hits = self._contains("title", title_contains.lower(), first=True)
+            else:
+                hits = self._exact("year", "", first=True)
+            return len(hits), self._n
+        return len(self.filter_indices(genre, year, author, title_contains, min_price, max_price, prices,
+                                       where)), self._n
+
+    def _selections(self,
+                    genre: Optional[str],
+                    year: Optional[str],
+                    author: Optional[str],
+                    title_contains: Optional[str],
+                    min_price: Optional[float],
+                    max_price: Optional[float],
+                    prices: Optional[np.ndarray],
+                    where: Optional[str]) -> List[np.ndarray]:
+        """Ascending rows matching each given filter; empty when there is none."""
+        selections: List[np.ndarray] = []
+        node = index_filter(where, year)
+        if node is not None:
+            selections.append(self._index.rows_of(node))
+        mask = _price_mask(self._prices if prices is None else prices, min_price, max_price)
+        if mask is not None:
+            selections.append(np.flatnonzero(mask))
+        if genre is not None:
+            selections.append(self._contains("genre", genre.lower()))
+        if _blank_year(year):
+            selections.append(self._exact("year", ""))
+        if author is not None:
+            selections.append(self._exact("author", str(author).strip().lower()))
+        if title_contains is not None:
+            selections.append(self._contains("title", title_contains.lower()))
+        return selections
+
+    def _contains(self, column: str, needle: str, first: bool = False) -> np.ndarray:
+        """Rows whose normalized value contains ``needle``."""
+        if not needle:
+            return np.arange(min(self._n, 1) if first else self._n, dtype=np.int64)
+        if "\x00" in needle:
+            return np.empty(0, dtype=np.int64)
+        return self._scan(column, re.escape(needle.encode("utf-8")), first=first)
+
+    def _exact(self, column: str, value: str, first: bool = False) -> np.ndarray:
+        """Rows whose normalized value equals ``value``."""
+        if "\x00" in value:
+            return np.empty(0, dtype=np.int64)
+        # Match the separator in front of the value, so adjacent equal values both match
+        return self._scan(column, b"(?<=\x00)" + re.escape(value.encode("utf-8")) + b"(?=\x00)", first=first)
+
+    def _scan(self, column: str, pattern: bytes, first: bool = False) -> np.ndarray:
+        """Rows of ``column`` whose search blob entry matches ``pattern``, ascending."""
+        begin, end, starts = self._search[column]
+        if not self._n:
+            return np.empty(0, dtype=np.int64)
+        regex = re.compile(pattern)
+        # Start after the leading separator: lookbehinds can see bytes before ``pos``
+        if first:
+            m = regex.search(self._mm, begin + 1, end)
+            positions = [m.start()] if m else []
+        else:
+            positions = [m.start() for m in regex.finditer(self._mm, begin + 1, end)]
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        # Map blob positions back to rows in one vectorized search
+        rows = np.searchsorted(starts, np.asarray(positions, dtype=np.int64) - begin, side="right") - 1
+        return np.unique(rows)
+
+
+def write_snapshot(repo: BooksRepository, path: str) -> None:
+    """
+    Write ``repo`` as a snapshot file at ``path``.
+
+    The file is written next to its destination and renamed into place, so
+    processes still mapping an older snapshot keep a consistent view.
+    """
+    repo.ensure_loaded()
+    headers = repo.headers
+    data = repo.list_all()
+    arrays: List[Tuple[str, bytes]] = []
+
+    for j, h in enumerate(headers):
+        encoded = [_text(r.get(h)).encode("utf-8") for r in data]
+        arrays.append((f"col{j}.data", b"".join(encoded)))
+        arrays.append((f"col{j}.offsets", _offsets(encoded).tobytes()))
+
+    search_cols: Dict[str, str] = {}
+    for name, lower in _SEARCH_COLUMNS:
+        col = _id_col(headers) if name == "id" else _find_col(headers, name)
+        search_cols[name] = col
+        values = [_text(r.get(col, "")).strip() for r in data]
+        if lower:
+            values = [v.lower() for v in values]
+        # Separator on both sides of every value: b"\x00v0\x00v1\x00...\x00"
+        encoded = [v.encode("utf-8") for v in values]
+        starts = np.zeros(len(encoded), dtype=np.int64)
+        if encoded:
+            starts[1:] = np.cumsum([len(e) + 1 for e in encoded[:-1]])
+        starts += 1
+        arrays.append((f"search.{name}", b"\x00" + b"\x00".join(encoded) + b"\x00"))
+        arrays.append((f"search.{name}.starts", starts.tobytes()))
+
+    index = repo.index()
+    index_values: Dict[str, List[str]] = {}
+    for field in INDEXED_FIELDS:
+        values = index.fields[field]
+        index_values[field] = values.values
+        arrays.append((f"index.{field}.offsets", values.offsets.tobytes()))
+        arrays.append((f"index.{field}.rows", np.ascontiguousarray(values.rows, dtype=np.uint32).tobytes()))
+
+    vectors = BookVectors.build(headers, data)
+    for name, array in vectors.arrays().items():
+        arrays.append((f"vectors.{name}", array.tobytes()))
+
+    arrays.append(("prices", np.ascontiguousarray(repo.prices(), dtype=np.float64).tobytes()))
+
+    # Lay out the header first, then every array at an 8-byte boundary
+    layout: Dict[str, List[int]] = {}
+    meta = {
+        "headers": headers,
+        "rows": len(data),
+        "price_currency": repo.price_currency,
+        "search_columns": search_cols,
+        "index_values": index_values,
+        "arrays": layout,
+    }
+    header = b""
+    while True:  # offsets depend on the header length; repeat until it settles
+        offset = _align(len(_MAGIC) + 8 + len(header))
+        for name, blob in arrays:
+            layout[name] = [offset, len(blob)]
+            offset = _align(offset + len(blob))
+        new_header = json.dumps(meta).encode("utf-8")
+        settled = len(new_header) == len(header)
+        header = new_header
+        if settled:
+            break
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, blob in arrays:
+            f.write(b"\x00" * (layout[name][0] - f.tell()))
+            f.write(blob)
+    os.replace(tmp, path)
+
+
+def ensure_snapshot(repo: BooksRepository, path: Optional[str] = None) -> str:
+    """
+    Return the path of an up-to-date snapshot of ``repo``, writing it if needed.
+
+    Defaults to ``<csv name>.snapshot`` next to the CSV and rebuilds when the
+    CSV is newer than the snapshot or the snapshot has an older file format.
+    """
+    path = path or os.path.splitext(repo.csv_path)[0] + ".snapshot"
+    if (not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(repo.csv_path)
+            or not _current_format(path)):
+        write_snapshot(repo, path)
+    return path
+
+
+def _current_format(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _id_col(headers: List[str]) -> str:
+    # Same key choice as BooksRepository.index_of_id
+    return ([k for k in headers if k.lower() in ("id", "book_id")] or headers[:1] or ["id"])[0]
+
+
+def _offsets(encoded: List[bytes]) -> np.ndarray:
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -0,0 +1,145 @@
+"""
+"More like this" vectors: one hashed TF-IDF vector per book, for cosine
+similarity search.
+
+Each book's title words, author, categories and description words become
+features, namespaced by field (``title:code`` and ``description:code`` are
+different features) and hashed into ``FEATURES`` buckets with CRC-32, which
+is stable across processes, so vectors written to a snapshot stay valid.
+Weights are sublinear term frequency (``1 + log(count)``) times a per-field
+weight times smoothed inverse document frequency. Only a book's
+``MAX_FEATURES`` heaviest features are kept, which drops words common to
+most books and bounds the matrix at ``MAX_FEATURES`` entries per book. Each
+row is then L2-normalized, so a dot product is the cosine similarity.
+
+The vectors form a CSR matrix (``indptr``/``indices``/``data`` arrays) of
+8 bytes per stored feature and need nothing beyond NumPy. ``similar``
+scatters one book's vector into a dense query vector and scores every book
+with one vectorized sparse matrix-vector product (a gather, a multiply and
+a per-row sum), then picks the top k with a partial sort.
+"""
+
+import math
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .books import _find_col
+from .books_index import field_values, suggest_key
+
+
+# Hash buckets (a power of two)
+FEATURES = 1 << 18
+# Features kept per book
+MAX_FEATURES = 32
+
+# Dataset columns (see books._find_col) and weights of the fields vectorized.
+# Descriptions are long, so their words count less than a title's
+_FIELDS = (("title", "title", 1.0), ("author", "author", 1.0), ("category", "genre", 1.0),
+           ("description", "description", 0.5))
+
+_WORD = re.compile(r"[^\W_]{2,}")
+
+
+class BookVectors:
+    """L2-normalized hashed TF-IDF vectors of every book, as a CSR matrix."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray) -> None:
+        # Features of book i are indices[indptr[i]:indptr[i + 1]], weighted by the same slice of data
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n = len(indptr) - 1
+        # reduceat sums one element for an empty row instead of none
+        self._empty = np.flatnonzero(np.diff(indptr) == 0)
+
+    @classmethod
+    def build(cls, headers: List[str], rows: List[Dict[str, Any]]) -> "BookVectors":
+        """Vectorize ``rows`` (dataset rows with ``headers``)."""
+        columns = [(field, _find_col(headers, column), weight) for field, column, weight in _FIELDS]
+        buckets: Dict[str, int] = {}
+
+        def bucket(feature: str) -> int:
+            b = buckets.get(feature)
+            if b is None:
+                b = buckets[feature] = zlib.crc32(feature.encode("utf-8")) & (FEATURES - 1)
+            return b
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indices: List[int] = []
+        weights: List[float] = []
+        for i, row in enumerate(rows):
+            vector: Dict[int, float] = {}
+            for field, column, weight in columns:
+                counts: Dict[str, int] = {}
+                for token in _tokens(field, row.get(column)):
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    b = bucket(f"{field}:{token}")
+                    vector[b] = vector.get(b, 0.0) + weight * (1.0 + math.log(count))
+            indices.extend(vector)
+            weights.extend(vector.values())
+            indptr[i + 1] = len(indices)
+
+        index_array = np.array(indices, dtype=np.int32)
+        data = np.array(weights, dtype=np.float64)
+        # Smoothed idf: features on every book still weigh a little
+        df = np.bincount(index_array, minlength=FEATURES)
+        idf = np.log((1.0 + len(rows)) / (1.0 + df)) + 1.0
+        data *= idf[index_array]
+
+        # Keep each book's heaviest features: rank them within the book, heaviest first
+        books = np.repeat(np.arange(len(rows)), np.diff(indptr))
+        order = np.lexsort((index_array, -data, books))
+        rank = np.arange(len(order)) - indptr[books[order]]
+        keep = np.sort(order[rank < MAX_FEATURES])
+        index_array, data, books = index_array[keep], data[keep], books[keep]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(books, minlength=len(rows)))
+
+        norms = np.sqrt(np.bincount(books, weights=data * data, minlength=len(rows)))
+        data /= np.where(norms > 0, norms, 1.0)[books]
+        return cls(indptr, index_array, data.astype(np.float32))
+
+    def similar(self, i: int, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Up to ``k`` ``(book, cosine similarity)`` pairs most similar to book ``i``,
+        best first (ties by position). Books sharing no feature are left out.
+        """
+        start, end = int(self.indptr[i]), int(self.indptr[i + 1])
+        if start == end or k <= 0:
+            return []
+        query = np.zeros(FEATURES, dtype=np.float32)
+        query[self.indices[start:end]] = self.data[start:end]
+        # Sparse matrix-vector product: every stored weight times the query's
+        # weight of the same feature, summed per book. The trailing 0 keeps
+        # every row start a valid reduceat index, even after empty last rows
+        products = np.zeros(len(self.indices) + 1, dtype=np.float32)
+        np.take(query, self.indices, out=products[:-1])
+        products[:-1] *= self.data
+        scores = np.add.reduceat(products, self.indptr[:-1])
+        scores[self._empty] = 0.0
+        scores[i] = 0.0
+        k = min(k, self.n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(j, round(float(scores[j]), 4)) for j in top.tolist() if scores[j] > 1e-9]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The CSR arrays by name, for writing to a snapshot."""
+        return {"indptr": self.indptr, "indices": self.indices, "data": self.data}
+
+
+def _tokens(field: str, value: Optional[Any]) -> List[str]:
+    if value is None:
+        return []
+    text = str(value)
+    if field == "author":
+        # The whole name is one feature: "Jane Austen" and "Jane Smith" share nothing
+        key = suggest_key("author", text)
+        return [key] if key else []
+    if field == "category":
+        return field_values("category", text)
+    return _WORD.findall(text.lower())
@@ -0,0 +1,170 @@
+import asyncio
+import contextvars
+import functools
+import os
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    """Raised when a tool has no free slot and its wait queue is full or timed out."""
+
+    def __init__(self, tool: str, reason: str) -> None:
+        super().__init__(f"{tool}: {reason}")
+        self.tool = tool
+        self.reason = reason
+
+
+class ToolLimiter:
+    """
+    Admission control for one tool: a concurrency limit plus a bounded wait queue.
+
+    Up to ``max_concurrent`` calls run at once. Further calls wait in FIFO
+    order, at most ``max_queued`` of them and for at most ``max_wait``
+    seconds; anything beyond that raises ``Overloaded`` immediately, so excess
+    load is turned away instead of building up latency. A released slot is
+    handed straight to the oldest waiter.
+
+    Waiters are plain futures on the caller's running loop, so one limiter can
+    be shared by every loop that runs on the server's event-loop thread.
+    """
+
+    def __init__(self, tool: str, max_concurrent: int, max_queued: int = 0,
+                 max_wait: Optional[float] = None) -> None:
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.tool = tool
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(self.tool, "too many concurrent calls")
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait({fut}, timeout=self.max_wait)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self.release()  # handed a slot just as the caller was cancelled: pass it on
+            else:
+                self._abandon(fut)
+            raise
+        if not fut.done():
+            self._abandon(fut)
+            self.rejected += 1
+            raise Overloaded(self.tool, f"no free slot within {self.max_wait:g}s")
+
+    def _abandon(self, fut: "asyncio.Future[None]") -> None:
+        fut.cancel()
+        self._waiters.remove(fut)
+
+    def release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # slot moves to the waiter; active is unchanged
+                return
+        self.active -= 1
+
+    async def __aenter__(self) -> "ToolLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first call for a key starts ``fn()`` as its own task. Calls with the
+    same key that arrive while it is still running await that task instead
+    of starting another, and get its result or its exception. Nothing is
+    cached: once the task finishes, the next call for the key starts a new
+    one. Because the work runs in a separate task, a cancelled caller does
+    not cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self.started = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller went away
+
+
+def limiters_from_env(defaults: Dict[str, str]) -> Dict[str, ToolLimiter]:
+    """
+    Build per-tool limiters from ``defaults`` overridden by ``TOOL_LIMITS``.
+
+    Each limit is ``tool=concurrent[:queued]``, comma separated, e.g.
+    ``TOOL_LIMITS="books_query=8:64,exchange_convert_batch=2"``; a concurrency
+    of 0 removes the tool's limit. ``TOOL_QUEUE_TIMEOUT`` bounds how long a
+    queued call waits for a slot (seconds, default 5).
+    """
+    specs = dict(defaults)
+    for part in os.environ.get("TOOL_LIMITS", "").split(","):
+        tool, sep, spec = part.partition("=")
+        if sep:
+            specs[tool.strip()] = spec.strip()
+    max_wait = float(os.environ.get("TOOL_QUEUE_TIMEOUT", "5"))
+    limiters: Dict[str, ToolLimiter] = {}
+    for tool, spec in specs.items():
+        concurrent, _, queued = spec.partition(":")
+        if int(concurrent) > 0:
+            limiters[tool] = ToolLimiter(tool, int(concurrent), int(queued or 0), max_wait)
+    return limiters
+
+
+def offload_executor_from_env() -> Executor:
+    """Thread pool for CPU-heavy tool bodies, sized by ``OFFLOAD_THREADS`` (default 4)."""
+    return ThreadPoolExecutor(max_workers=int(os.environ.get("OFFLOAD_THREADS", "4")),
+                              thread_name_prefix="tool-offload")
+
+
+async def run_blocking(executor: Executor, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run ``fn(*args, **kwargs)`` on ``executor`` without blocking the event loop.
+
+    ``fn`` runs in a copy of the caller's context, so context variables such
+    as the active trace carry over to the executor thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, context.run, functools.partial(fn, *args, **kwargs))
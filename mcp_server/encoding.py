@@ -0,0 +1,110 @@
+"""
+JSON encoding of tool responses.
+
+Every tool returns its result dict through ``response``, which serializes it
+once as compact JSON, with orjson when it is installed and the standard
+library otherwise. Both give the same output; NaN and infinities, which JSON
+cannot represent, become null. orjson is imported by the first response,
+not at import. Responses whose body never changes (e.g. the authentication
+errors) are encoded once, on first use, with ``StaticResponse``.
+
+With ``MCP_STRUCTURED_CONTENT=1`` responses also carry the result as MCP
+structured content, next to the same JSON text.
+"""
+
+import json
+import math
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from .tracing import span
+
+if TYPE_CHECKING:
+    import mcp.types as types
+
+# The orjson module, None when it is not installed (an optional speedup), or
+# _UNLOADED until the first response
+_UNLOADED: Any = object()
+orjson: Any = _UNLOADED
+
+
+ToolResponse = Union[List["types.TextContent"], Tuple[List["types.TextContent"], Dict[str, Any]]]
+
+# Also return results as structuredContent (clients that read it skip parsing)
+STRUCTURED_CONTENT = os.environ.get("MCP_STRUCTURED_CONTENT", "").lower() in ("1", "true", "yes")
+
+
+def _default(value: Any) -> Any:
+    # NumPy scalars and arrays become plain numbers and lists, like with orjson
+    tolist = getattr(value, "tolist", None)
+    return _finite(tolist()) if callable(tolist) else str(value)
+
+
+def _finite(value: Any) -> Any:
+    # NaN and infinities become null, like with orjson (JSON has no such numbers)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False, default=_default)
+
+# types.TextContent, bound by the first response (importing the MCP SDK is slow)
+_TextContent: Any = None
+
+
+def _content(text: str) -> List["types.TextContent"]:
+    global _TextContent
+    if _TextContent is None:
+        from mcp.types import TextContent
+        _TextContent = TextContent
+    return [_TextContent(type="text", text=text)]
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text for ``obj``; values JSON cannot represent fall back to ``str``."""
+    global orjson
+    if orjson is _UNLOADED:
+        try:
+            import orjson as module
+        except ImportError:
+            module = None
+        orjson = module
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib handles them
+    try:
+        return _stdlib_encoder.encode(obj)
+    except ValueError:  # a non-finite float; rare, so only then copy the result
+        return _stdlib_encoder.encode(_finite(obj))
+
+
+def response(result: Dict[str, Any]) -> ToolResponse:
+    """Encode a tool result as MCP content (plus structured content when enabled)."""
+    with span("encode"):
+        content = _content(dumps(result))
+    return (content, result) if STRUCTURED_CONTENT else content
+
+
+class StaticResponse:
+    """A tool result that never changes, encoded once and returned on every call."""
+
+    def __init__(self, result: Dict[str, Any]) -> None:
+        self.result = result
+        self._text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self.result)
+        return self._text
+
+    def __call__(self) -> ToolResponse:
+        content = _content(self.text)
+        return (content, dict(self.result)) if STRUCTURED_CONTENT else content
@@ -1,32 +1,120 @@
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+CurrencyArg = Union[str, Sequence[str]]
 
 
 @dataclass
 class ExchangeRates:
     base: str
     rates: Dict[str, float]
+    # Derived lookup structures, built once per snapshot. ``rates`` is treated
+    # as immutable after construction; build a new instance to change rates.
+    codes: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    index: Dict[str, int] = field(init=False, repr=False, compare=False)
+    matrix: np.ndarray = field(init=False, repr=False, compare=False)
+    _sorted_codes: np.ndarray = field(init=False, repr=False, compare=False)
+    _sorted_to_index: np.ndarray = field(init=False, repr=False, compare=False)
 
-    def convert(self, amount: float, from_ccy: str, to_ccy: str) -> float:
+    def __post_init__(self) -> None:
+        self.base = self.base.upper()
+        vector: Dict[str, float] = {c.upper(): float(r) for c, r in self.rates.items()}
+        # 1 base = 1 base, whatever the table says about itself
+        vector[self.base] = 1.0
+        self.codes = tuple(vector)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        r = np.array([vector[c] for c in self.codes], dtype=np.float64)
+        # matrix[i, j] = units of currency j per one unit of currency i
+        self.matrix = r[np.newaxis, :] / r[:, np.newaxis]
+        order = np.argsort(np.array(self.codes))
+        self._sorted_codes = np.array(self.codes)[order]
+        self._sorted_to_index = order
+
+    def rate(self, from_ccy: str, to_ccy: str) -> float:
+        """Cross rate for one unit of ``from_ccy`` expressed in ``to_ccy``."""
         from_c = from_ccy.upper()
         to_c = to_ccy.upper()
         if from_c == to_c:
+            return 1.0
+        i = self.index.get(from_c)
+        if i is None:
+            raise ValueError(f"Unknown currency: {from_c}")
+        j = self.index.get(to_c)
+        if j is None:
+            raise ValueError(f"Unknown currency: {to_c}")
+        return float(self.matrix[i, j])
+
+    def convert(self, amount: float, from_ccy: str, to_ccy: str) -> float:
+        if from_ccy.upper() == to_ccy.upper():
             return amount
-        # Normalize to base, then to target
-        # rates are relative to base (1 base = rate[target])
-        if from_c == self.base:
-            if to_c not in self.rates:
-                raise ValueError(f"Unknown currency: {to_c}")
-            return amount * self.rates[to_c]
-        if to_c == self.base:
-            if from_c not in self.rates:
-                raise ValueError(f"Unknown currency: {from_c}")
-            return amount / self.rates[from_c]
-        if from_c not in self.rates or to_c not in self.rates:
-            missing = from_c if from_c not in self.rates else to_c
-            raise ValueError(f"Unknown currency: {missing}")
-        base_amount = amount / self.rates[from_c]
-        return base_amount * self.rates[to_c]
+        return amount * self.rate(from_ccy, to_ccy)
+
+    def convert_batch(self,
+                      amounts: Sequence[float],
+                      from_ccy: CurrencyArg,
+                      to_ccy: CurrencyArg) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """
+        Convert many amounts in one vectorized pass over the cross-rate matrix.
+
+        ``from_ccy`` and ``to_ccy`` may each be a single code (applied to every
+        amount) or a sequence with one code per amount. Returns the converted
+        values (NaN where an item failed) and a parallel list holding ``None``
+        or the error message for each item.
+        """
+        n = len(amounts)
+        values, errors = _parse_amounts(amounts)
+        from_codes = _broadcast_codes(from_ccy, n, "from_currency")
+        to_codes = _broadcast_codes(to_ccy, n, "to_currency")
+
+        fi, from_ok = self._lookup(from_codes)
+        ti, to_ok = self._lookup(to_codes)
+        same = from_codes == to_codes
+
+        factors = np.where(from_ok & to_ok, self.matrix[fi, ti], np.nan)
+        factors = np.where(same, 1.0, factors)
+        converted = values * factors
+
+        for k in np.flatnonzero(~same & ~(from_ok & to_ok)):
+            if errors[k] is None:
+                missing = from_codes[k] if not from_ok[k] else to_codes[k]
+                errors[k] = f"Unknown currency: {missing}"
+        for k, err in enumerate(errors):
+            if err is not None:
+                converted[k] = np.nan
+        return converted, errors
+
+    def _lookup(self, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        pos = np.searchsorted(self._sorted_codes, codes)
+        pos = np.clip(pos, 0, len(self._sorted_codes) - 1)
+        found = self._sorted_codes[pos] == codes
+        return self._sorted_to_index[pos], found
+
+
+def _parse_amounts(amounts: Sequence[float]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    errors: List[Optional[str]] = [None] * len(amounts)
+    try:
+        return np.asarray(amounts, dtype=np.float64).reshape(len(amounts)), errors
+    except (TypeError, ValueError):
+        pass
+    # Slow path: at least one amount is not numeric, report it per item
+    values = np.full(len(amounts), np.nan)
+    for k, a in enumerate(amounts):
+        try:
+            values[k] = float(a)
+        except (TypeError, ValueError):
+            errors[k] = f"Invalid amount: {a!r}"
+    return values, errors
+
+
+def _broadcast_codes(codes: CurrencyArg, n: int, name: str) -> np.ndarray:
+    if isinstance(codes, str):
+        return np.full(n, codes.upper())
+    if len(codes) != n:
+        raise ValueError(f"'{name}' has {len(codes)} entries but 'amounts' has {n}")
+    return np.char.upper(np.array([str(c) for c in codes], dtype=str))
 
 
 def default_rates() -> ExchangeRates:
@@ -46,4 +134,3 @@ def default_rates() -> ExchangeRates:
             "BRL": 5.2,
         },
     )
-
@@ -0,0 +1,87 @@
+"""
+HTTP transports for the MCP server.
+
+One server process accepts any number of clients over HTTP instead of one
+process per stdio client, so every client shares the same warm books
+dataset and rate cache. Two endpoints are mounted on one Starlette app:
+
+- ``/mcp``: Streamable HTTP (current MCP transport), stateful by default so
+  each client keeps its MCP session, and with it its authenticated session
+- ``/sse`` + ``/messages/``: legacy HTTP+SSE transport for older clients
+
+Starlette and uvicorn ship with the MCP SDK and are only imported here, so
+stdio deployments never load them.
+"""
+
+import contextlib
+from typing import Any, AsyncIterator
+
+
+def build_http_app(mcp_server: Any, json_response: bool = False, stateless: bool = False) -> Any:
+    """
+    Build the ASGI app exposing ``mcp_server`` over Streamable HTTP and SSE.
+
+    Args:
+        mcp_server: Low-level ``mcp.server.Server`` instance to expose
+        json_response: Answer POSTs with plain JSON instead of an SSE stream
+        stateless: Create a fresh MCP session per request (no session
+            affinity needed, but clients must not rely on per-connection state)
+    """
+    from mcp.server.sse import SseServerTransport
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Mount, Route
+
+    session_manager = StreamableHTTPSessionManager(
+        app=mcp_server,
+        json_response=json_response,
+        stateless=stateless,
+    )
+    sse = SseServerTransport("/messages/")
+
+    async def handle_streamable_http(scope, receive, send) -> None:
+        await session_manager.handle_request(scope, receive, send)
+
+    async def handle_sse(request) -> Response:
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await mcp_server.run(read_stream, write_stream, mcp_server.create_initialization_options())
+        return Response()
+
+    async def healthz(request) -> JSONResponse:
+        return JSONResponse({"status": "ok"})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app) -> AsyncIterator[None]:
+        async with session_manager.run():
+            yield
+
+    return Starlette(
+        routes=[
+            Mount("/mcp", app=handle_streamable_http),
+            Route("/sse", endpoint=handle_sse),
+            Mount("/messages/", app=sse.handle_post_message),
+            Route("/healthz", endpoint=healthz),
+        ],
+        lifespan=lifespan,
+    )
+
+
+async def serve_http(mcp_server: Any,
+                     host: str = "127.0.0.1",
+                     port: int = 8000,
+                     json_response: bool = False,
+                     stateless: bool = False,
+                     keep_alive: int = 75) -> None:
+    """Serve ``mcp_server`` over HTTP until cancelled."""
+    import uvicorn
+
+    app = build_http_app(mcp_server, json_response=json_response, stateless=stateless)
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        timeout_keep_alive=keep_alive,   # keep idle client connections open for reuse
+        log_level="warning",
+    )
+    await uvicorn.Server(config).serve()
@@ -0,0 +1,265 @@
+"""
+Per-tool call metrics with Prometheus text export.
+
+``handle_call_tool`` records every call: the outcome (``ok`` or the error
+code it returned), the latency and the response size. ``books_query`` also
+records the rows its scans examined and the rows it returned. Recording a
+call is a few integer operations on the event-loop thread. Nothing is
+aggregated until a snapshot or a scrape asks for it.
+
+Latencies and sizes go into log-linear, HDR-style histograms. Values are
+integers (microseconds or bytes). Each power of two is split into 8 linear
+sub-buckets, so a percentile read back from the histogram is at most 12.5%
+above the true value, whatever the range. The Prometheus export folds the
+sub-buckets into power-of-two ``le`` bounds and also publishes the
+p50/p90/p99/p99.9 values directly, for SLOs on tail latency.
+
+``serve_metrics`` exposes the text format on a local port with the standard
+library HTTP server, so it works with the stdio transport too.
+"""
+
+import math
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 8 linear sub-buckets per power of two
+_SUB_BITS = 3
+_SUB = 1 << _SUB_BITS
+# Values below this are counted exactly, one bucket each
+_LINEAR = _SUB << 1
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# A gauge sample: label values by label name, and the value
+Sample = Tuple[Dict[str, str], float]
+# name, help text, samples
+Gauge = Tuple[str, str, List[Sample]]
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers up to ``2**max_bits``."""
+
+    def __init__(self, max_bits: int = 40) -> None:
+        self.max_value = (1 << max_bits) - 1
+        self.counts = [0] * (self._index(self.max_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < _LINEAR:
+            return value
+        shift = value.bit_length() - _SUB_BITS - 1
+        return _LINEAR + (shift - 1) * _SUB + (value >> shift) - _SUB
+
+    @staticmethod
+    def bucket_bounds(index: int) -> Tuple[int, int]:
+        """Smallest and largest value counted in bucket ``index``."""
+        if index < _LINEAR:
+            return index, index
+        shift = (index - _LINEAR) // _SUB + 1
+        top = (index - _LINEAR) % _SUB + _SUB
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        elif value > self.max_value:
+            value = self.max_value
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> int:
+        """Upper bound of the bucket holding the ``q`` quantile (0 when empty)."""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(q * self.count - 1e-9))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def count_below(self, bound: int) -> int:
+        """Values strictly below ``bound``, which must be 0 or a power of two."""
+        if bound > self.max_value:
+            return self.count
+        return sum(self.counts[:self._index(bound)])
+
+
+class ToolMetrics:
+    """Counters and histograms for one tool."""
+
+    def __init__(self) -> None:
+        self.outcomes: Dict[str, int] = {}
+        self.latency_us = Histogram()
+        self.response_bytes = Histogram()
+        self.rows_scanned = 0
+        self.rows_returned = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = self.latency_us
+        return {
+            "calls": latency.count,
+            "outcomes": dict(self.outcomes),
+            "latency_ms": {
+                "mean": round(latency.total / latency.count / 1e3, 3) if latency.count else 0.0,
+                **{f"p{_quantile_label(q)}": latency.quantile(q) / 1e3 for q in QUANTILES},
+                "max": latency.max / 1e3,
+            },
+            "response_bytes": {
+                "total": self.response_bytes.total,
+                "p50": self.response_bytes.quantile(0.5),
+                "p99": self.response_bytes.quantile(0.99),
+                "max": self.response_bytes.max,
+            },
+            "rows_scanned": self.rows_scanned,
+            "rows_returned": self.rows_returned,
+        }
+
+
+class Metrics:
+    """
+    Metrics for every tool, plus gauges read from other components on demand.
+
+    ``gauges`` are callables returning ``(name, help, samples)`` tuples. They
+    run only when a snapshot or scrape is taken, e.g. to report limiter queue
+    depths or the number of live sessions.
+    """
+
+    def __init__(self, prefix: str = "mcp") -> None:
+        self.prefix = prefix
+        self.tools: Dict[str, ToolMetrics] = {}
+        self._gauges: List[Callable[[], Iterable[Gauge]]] = []
+
+    def tool(self, name: str) -> ToolMetrics:
+        metrics = self.tools.get(name)
+        if metrics is None:
+            metrics = self.tools[name] = ToolMetrics()
+        return metrics
+
+    def add_gauges(self, collect: Callable[[], Iterable[Gauge]]) -> None:
+        self._gauges.append(collect)
+
+    def record_call(self, tool: str, outcome: str, seconds: float, response_bytes: int) -> None:
+        metrics = self.tool(tool)
+        metrics.outcomes[outcome] = metrics.outcomes.get(outcome, 0) + 1
+        metrics.latency_us.record(int(seconds * 1e6))
+        metrics.response_bytes.record(response_bytes)
+
+    def record_rows(self, tool: str, scanned: int = 0, returned: int = 0) -> None:
+        metrics = self.tool(tool)
+        metrics.rows_scanned += scanned
+        metrics.rows_returned += returned
+
+    def gauges(self) -> List[Gauge]:
+        return [gauge for collect in self._gauges for gauge in collect()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as a JSON-friendly dict."""
+        return {
+            "tools": {name: m.snapshot() for name, m in sorted(self.tools.items())},
+            "gauges": {
+                name: [dict(labels, value=value) for labels, value in samples] if _labelled(samples)
+                else (samples[0][1] if samples else 0)
+                for name, _, samples in self.gauges()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        p = self.prefix
+        lines: List[str] = []
+        tools = sorted(self.tools.items())
+
+        lines.append(f"# HELP {p}_tool_calls_total Tool calls by outcome (ok or the error code returned).")
+        lines.append(f"# TYPE {p}_tool_calls_total counter")
+        for name, m in tools:
+            for outcome, n in sorted(m.outcomes.items()):
+                lines.append(f'{p}_tool_calls_total{{tool="{name}",outcome="{outcome}"}} {n}')
+
+        lines.append(f"# HELP {p}_tool_latency_seconds Tool call latency.")
+        lines.append(f"# TYPE {p}_tool_latency_seconds histogram")
+        for name, m in tools:
+            h = m.latency_us
+            # Power-of-two microsecond bounds from 128us to ~33.5s
+            for bit in range(7, 26):
+                bound = 1 << bit
+                lines.append(f'{p}_tool_latency_seconds_bucket{{tool="{name}",le="{bound / 1e6:g}"}} '
+                             f'{h.count_below(bound)}')
+            lines.append(f'{p}_tool_latency_seconds_bucket{{tool="{name}",le="+Inf"}} {h.count}')
+            lines.append(f'{p}_tool_latency_seconds_sum{{tool="{name}"}} {h.total / 1e6:g}')
+            lines.append(f'{p}_tool_latency_seconds_count{{tool="{name}"}} {h.count}')
+
+        lines.append(f"# HELP {p}_tool_latency_quantile_seconds Tool call latency percentiles since start.")
+        lines.append(f"# TYPE {p}_tool_latency_quantile_seconds gauge")
+        for name, m in tools:
+            for q in QUANTILES:
+                lines.append(f'{p}_tool_latency_quantile_seconds{{tool="{name}",quantile="{q:g}"}} '
+                             f'{m.latency_us.quantile(q) / 1e6:g}')
+
+        for metric, help_text, attr in (
+            ("response_bytes_total", "Bytes of JSON text returned.", None),
+            ("rows_scanned_total", "Dataset rows examined by the tool's scans.", "rows_scanned"),
+            ("rows_returned_total", "Rows returned to callers.", "rows_returned"),
+        ):
+            lines.append(f"# HELP {p}_tool_{metric} {help_text}")
+            lines.append(f"# TYPE {p}_tool_{metric} counter")
+            for name, m in tools:
+                value = m.response_bytes.total if attr is None else getattr(m, attr)
+                lines.append(f'{p}_tool_{metric}{{tool="{name}"}} {value}')
+
+        for name, help_text, samples in self.gauges():
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{p}_{name}{{{label_text}}} {value:g}" if label_text else f"{p}_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: Metrics, host: str = "127.0.0.1", port: int = 9464) -> "ThreadingHTTPServer":
+    """
+    Serve ``metrics`` as Prometheus text at ``http://host:port/metrics``.
+
+    Runs on a daemon thread; call ``shutdown()`` on the returned server to
+    stop it. Scrapes read the counters without locking, so a scrape taken
+    mid-call may be off by that one call.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass  # scrapes are not worth a log line each
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
+
+
+def _labelled(samples: List[Sample]) -> bool:
+    return any(labels for labels, _ in samples)
+
+
+def _quantile_label(q: float) -> str:
+    return f"{q * 100:g}".replace(".", "")
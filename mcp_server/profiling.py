@@ -0,0 +1,286 @@
+"""
+On-demand CPU profiling and allocation tracking for the live server.
+
+``Profiler.start`` opens a profiling session that ends after a number of
+seconds or tool calls, whichever comes first. While it runs, cProfile
+profiles the event-loop thread and every function run through the
+profiler's executor wrapper, i.e. the offloaded scans and conversions.
+tracemalloc can record allocations as well. When the session ends, the
+reports are written to the profile directory:
+
+- ``<id>.pstats``: raw cProfile data for ``pstats``/snakeviz
+- ``<id>-cpu.txt``: time by component (``books``, ``books_snapshot``,
+  ``encoding``, ``orjson``, ``json``, ``numpy``..., with idle waits as
+  ``waiting``) and the top functions
+- ``<id>-memory.txt``: live allocations by component, top lines and top
+  tracebacks
+
+Between sessions nothing is hooked. The only cost is one attribute check
+per tool call and per offloaded function.
+
+Up to Python 3.11 a cProfile profiler sees only the thread that enabled
+it, so each executor thread gets its own profiler and the results are
+merged at the end. From 3.12 one profiler sees every thread and a second
+one cannot be enabled, so the event loop's profiler records the offloaded
+work as well. Scans in ``--workers`` processes appear as time spent waiting
+on the pool.
+
+cProfile, pstats and tracemalloc are imported when a session starts, so
+importing this module (and the server) does not load them.
+"""
+
+import io
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+    import pstats
+    import tracemalloc
+
+
+class ProfileSession:
+    """One profiling window: per-thread profilers and an optional tracemalloc trace."""
+
+    def __init__(self, cpu: bool, memory: bool, max_seconds: float, max_calls: Optional[int],
+                 frames: int = 10) -> None:
+        self.id = time.strftime("profile-%Y%m%d-%H%M%S-") + secrets.token_hex(2)
+        self.cpu = cpu
+        self.memory = memory
+        self.max_seconds = max_seconds
+        self.max_calls = max_calls
+        self.frames = frames
+        self.calls = 0
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._profiles: List["cProfile.Profile"] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._main: Optional["cProfile.Profile"] = None
+        self._owns_tracemalloc = False
+
+    def begin(self) -> None:
+        import tracemalloc
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracemalloc = True
+        if self.cpu:
+            self._main = self._thread_profile()
+            self._main.enable()
+
+    def _thread_profile(self) -> "cProfile.Profile":
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            import cProfile
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def run(self, fn: Callable[[], Any]) -> Any:
+        """Call ``fn`` under this thread's profiler."""
+        profile = self._thread_profile()
+        try:
+            profile.enable()
+        except ValueError:  # 3.12+: the event loop's profiler already covers this thread
+            return fn()
+        try:
+            return fn()
+        finally:
+            profile.disable()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def end(self, directory: str, top: int = 40) -> Dict[str, Any]:
+        """Stop profiling and write the reports; returns a summary with their paths."""
+        import pstats
+        import tracemalloc
+        if self._main is not None:
+            self._main.disable()
+        summary: Dict[str, Any] = {
+            "profile_id": self.id,
+            "seconds": round(self.elapsed, 3),
+            "calls": self.calls,
+            "reports": {},
+        }
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+
+        if self.cpu:
+            with self._lock:
+                profiles = list(self._profiles)
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(base + ".pstats")
+            components = cpu_by_component(stats)
+            with open(base + "-cpu.txt", "w", encoding="utf-8") as f:
+                f.write(self._header("CPU profile"))
+                f.write(f"threads profiled: {len(profiles)}\n\n")
+                f.write("time by component (own time, seconds)\n")
+                for name, seconds in components:
+                    f.write(f"  {name:<24} {seconds:10.4f}\n")
+                f.write("\n")
+                f.write(_print_stats(stats, "cumulative", top))
+                f.write(_print_stats(stats, "tottime", top, "mcp_server"))
+            summary["reports"]["pstats"] = base + ".pstats"
+            summary["reports"]["cpu"] = base + "-cpu.txt"
+            summary["cpu_by_component"] = {name: round(seconds, 4) for name, seconds in components[:10]}
+
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            components = memory_by_component(snapshot)
+            with open(base + "-memory.txt", "w", encoding="utf-8") as f:
+                f.write(self._header("Allocations"))
+                f.write(f"traced now: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+                f.write("live allocations by component (KiB, blocks)\n")
+                for name, (size, count) in components:
+                    f.write(f"  {name:<24} {size / 1024:10.1f} {count:10d}\n")
+                f.write(f"\ntop {top} lines\n")
+                for stat in snapshot.statistics("lineno")[:top]:
+                    f.write(f"  {stat}\n")
+                f.write("\ntop 5 tracebacks\n")
+                for stat in snapshot.statistics("traceback")[:5]:
+                    f.write(f"  {stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                    for line in stat.traceback.format():
+                        f.write(f"    {line}\n")
+            summary["reports"]["memory"] = base + "-memory.txt"
+            summary["memory_peak_kib"] = round(peak / 1024, 1)
+            summary["memory_by_component_kib"] = {name: round(size / 1024, 1) for name, (size, _) in components[:10]}
+        return summary
+
+    def _header(self, title: str) -> str:
+        started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started_at))
+        return f"{title} {self.id}: started {started}, {self.elapsed:.2f}s, {self.calls} tool calls\n\n"
+
+
+class Profiler:
+    """
+    Starts and stops profiling sessions; at most one runs at a time.
+
+    ``executor(inner)`` wraps the offload executor so functions submitted
+    during a session run under a profiler. The server counts tool calls with
+    ``count_call`` and ends a session when a limit is reached.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.session: Optional[ProfileSession] = None
+        self.last: Optional[Dict[str, Any]] = None
+        self._timer: Optional[Any] = None
+
+    def start(self, cpu: bool = True, memory: bool = False, seconds: float = 30.0,
+              calls: Optional[int] = None, on_timeout: Optional[Callable[[Callable[[], None]], Any]] = None) -> ProfileSession:
+        """
+        Begin a session. ``on_timeout(stop)`` schedules ``stop`` after ``seconds``
+        and returns a handle with ``cancel()`` (e.g. ``loop.call_later``).
+        """
+        if self.session is not None:
+            raise RuntimeError(f"Profiling session {self.session.id} is already running")
+        session = ProfileSession(cpu=cpu, memory=memory, max_seconds=seconds, max_calls=calls)
+        session.begin()
+        self.session = session
+        if on_timeout is not None:
+            self._timer = on_timeout(self.stop)
+        return session
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """End the running session, if any, and return its summary."""
+        session, self.session = self.session, None
+        if session is None:
+            return None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.last = session.end(self.directory)
+        return self.last
+
+    def count_call(self) -> None:
+        session = self.session
+        if session is None:
+            return
+        session.calls += 1
+        if session.max_calls is not None and session.calls >= session.max_calls:
+            self.stop()
+
+    def executor(self, inner: Executor) -> Executor:
+        return _ProfilingExecutor(inner, self)
+
+
+class _ProfilingExecutor(Executor):
+    """Executor submitting to ``inner``, under a profiler while a session runs."""
+
+    def __init__(self, inner: Executor, profiler: Profiler) -> None:
+        self._inner = inner
+        self._profiler = profiler
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> "Future[Any]":
+        session = self._profiler.session
+        if session is None or not session.cpu:
+            return self._inner.submit(fn, *args, **kwargs)
+        return self._inner.submit(session.run, lambda: fn(*args, **kwargs))
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._inner.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def component(filename: str, function: str = "") -> str:
+    """Short name of the part of the code base ``filename``/``function`` belongs to."""
+    if filename == "~":  # C functions
+        if any(wait in function for wait in ("select.", "_thread.lock", "time.sleep")):
+            return "waiting"  # idle event loop / threads, not work
+        for name in ("orjson", "numpy"):
+            if name in function:
+                return name
+        if "encode" in function and "json" in function:
+            return "json"
+        return "builtins"
+    path = filename.replace(os.sep, "/")
+    if "/mcp_server/" in path:
+        return os.path.splitext(path.rsplit("/mcp_server/", 1)[1])[0].replace("/", ".")
+    for name in ("numpy", "orjson", "json", "mcp", "pydantic", "asyncio", "anyio"):
+        if f"/{name}/" in path:
+            return name
+    return "other"
+
+
+def cpu_by_component(stats: "pstats.Stats") -> List[Tuple[str, float]]:
+    totals: Dict[str, float] = {}
+    for (filename, _, function), (_, _, tottime, _, _) in stats.stats.items():  # type: ignore[attr-defined]
+        name = component(filename, function)
+        totals[name] = totals.get(name, 0.0) + tottime
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def memory_by_component(snapshot: "tracemalloc.Snapshot") -> List[Tuple[str, Tuple[int, int]]]:
+    totals: Dict[str, Tuple[int, int]] = {}
+    for stat in snapshot.statistics("filename"):
+        name = component(stat.traceback[0].filename)
+        size, count = totals.get(name, (0, 0))
+        totals[name] = (size + stat.size, count + stat.count)
+    return sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+
+
+def _print_stats(stats: "pstats.Stats", sort: str, top: int, restrict: Optional[str] = None) -> str:
+    buffer = io.StringIO()
+    stats.stream = buffer  # type: ignore[attr-defined]
+    stats.sort_stats(sort)
+    if restrict:
+        buffer.write(f"functions in {restrict}, by {sort}\n")
+        stats.print_stats(restrict, top)
+    else:
+        buffer.write(f"top functions by {sort}\n")
+        stats.print_stats(top)
+    return buffer.getvalue()
@@ -0,0 +1,135 @@
+import csv
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+class RateHistory:
+    """
+    Time series of exchange rates, one pair of sorted columns per currency.
+
+    Rates are relative to ``base`` (1 base = rate units of the currency), like
+    ``ExchangeRates``. A lookup ``as_of`` a timestamp returns the latest rate
+    published at or before it, found by binary search over the timestamp
+    column, so lookup cost stays logarithmic no matter how long the history is.
+
+    Two file formats are accepted:
+    - CSV with ``timestamp,currency,rate`` columns, where timestamp is an
+      ISO-8601 date/datetime or Unix seconds
+    - ``.npz`` written by ``save_npz`` (``<CCY>_t`` / ``<CCY>_r`` arrays),
+      which loads millions of points per currency without parsing text
+    """
+
+    def __init__(self, path: str, base: str = "USD") -> None:
+        self.path = path
+        self.base = base.upper()
+        self._series: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self) -> None:
+        if self._series is not None:
+            return
+        with self._load_lock:
+            if self._series is not None:
+                return
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Rate history not found: {self.path}")
+            if self.path.endswith(".npz"):
+                self._series = _load_npz(self.path)
+            else:
+                self._series = _load_csv(self.path)
+
+    @classmethod
+    def from_arrays(cls, series: Dict[str, Tuple[np.ndarray, np.ndarray]], base: str = "USD") -> "RateHistory":
+        history = cls(path="", base=base)
+        history._series = {c.upper(): _sorted_columns(t, r) for c, (t, r) in series.items()}
+        return history
+
+    @property
+    def currencies(self) -> List[str]:
+        self.ensure_loaded()
+        assert self._series is not None
+        return sorted(set(self._series) | {self.base})
+
+    def rate_at(self, ccy: str, ts: float) -> float:
+        self.ensure_loaded()
+        assert self._series is not None
+        c = ccy.upper()
+        if c == self.base:
+            return 1.0
+        series = self._series.get(c)
+        if series is None:
+            raise ValueError(f"Unknown currency: {c}")
+        times, rates = series
+        i = int(np.searchsorted(times, ts, side="right")) - 1
+        if i < 0:
+            raise ValueError(f"No {c} rate on or before {format_timestamp(ts)}")
+        return float(rates[i])
+
+    def convert(self, amount: float, from_ccy: str, to_ccy: str, as_of: float) -> float:
+        if from_ccy.upper() == to_ccy.upper():
+            return amount
+        return amount / self.rate_at(from_ccy, as_of) * self.rate_at(to_ccy, as_of)
+
+    def save_npz(self, path: str) -> None:
+        self.ensure_loaded()
+        assert self._series is not None
+        arrays = {}
+        for c, (t, r) in self._series.items():
+            arrays[f"{c}_t"] = t
+            arrays[f"{c}_r"] = r
+        np.savez(path, **arrays)
+
+
+def parse_timestamp(value: Union[str, int, float]) -> float:
+    """Accept Unix seconds or an ISO-8601 date/datetime (UTC when naive)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def format_timestamp(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def _sorted_columns(times, rates) -> Tuple[np.ndarray, np.ndarray]:
+    t = np.asarray(times, dtype=np.float64)
+    r = np.asarray(rates, dtype=np.float64)
+    order = np.argsort(t, kind="stable")
+    return t[order], r[order]
+
+
+def _load_npz(path: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    with np.load(path) as npz:
+        for key in npz.files:
+            if key.endswith("_t"):
+                c = key[:-2]
+                series[c.upper()] = _sorted_columns(npz[key], npz[f"{c}_r"])
+    return series
+
+
+def _load_csv(path: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    columns: Dict[str, Tuple[List[float], List[float]]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+            c = str(row["currency"]).upper()
+            times, rates = columns.setdefault(c, ([], []))
+            times.append(parse_timestamp(row["timestamp"]))
+            rates.append(float(row["rate"]))
+    return {c: _sorted_columns(t, r) for c, (t, r) in columns.items()}
@@ -0,0 +1,209 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from .exchange import ExchangeRates, default_rates
+
+
+class RateProvider:
+    """Source of exchange-rate tables. Subclasses implement ``fetch``."""
+
+    # Seconds a fetched table stays fresh; None means it never goes stale
+    default_ttl: Optional[float] = 3600.0
+
+    def fetch(self) -> ExchangeRates:
+        raise NotImplementedError
+
+
+class StaticRateProvider(RateProvider):
+    default_ttl = None
+
+    def __init__(self, rates: Optional[ExchangeRates] = None) -> None:
+        self._rates = rates or default_rates()
+
+    def fetch(self) -> ExchangeRates:
+        return self._rates
+
+
+class JsonFileRateProvider(RateProvider):
+    """Reads ``{"base": "USD", "rates": {"EUR": 0.92, ...}}`` from a local file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def fetch(self) -> ExchangeRates:
+        with open(self.path, encoding="utf-8") as f:
+            return rates_from_json(json.load(f))
+
+
+class HttpRateProvider(RateProvider):
+    """Fetches the same JSON document as ``JsonFileRateProvider`` over HTTP."""
+
+    def __init__(self, url: str, timeout: float = 5.0) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self) -> ExchangeRates:
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as resp:
+            return rates_from_json(json.loads(resp.read().decode("utf-8")))
+
+
+def rates_from_json(doc: Dict[str, Any]) -> ExchangeRates:
+    if not isinstance(doc, dict) or "base" not in doc or not isinstance(doc.get("rates"), dict):
+        raise ValueError("Rates document must contain 'base' and a 'rates' object")
+    return ExchangeRates(base=str(doc["base"]), rates={str(k): float(v) for k, v in doc["rates"].items()})
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    rates: ExchangeRates
+    version: int
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class RateCache:
+    """
+    TTL cache in front of a ``RateProvider``.
+
+    Readers call ``snapshot()`` and always get the current immutable snapshot
+    without waiting on I/O; only the very first load blocks. Once a snapshot
+    reaches ``refresh_ahead`` of its TTL a background thread fetches a new
+    table and swaps it in with a single reference assignment. Fetch failures
+    keep serving the previous snapshot. The version only increases when the
+    fetched table differs from the current one.
+    """
+
+    def __init__(self,
+                 provider: RateProvider,
+                 ttl: Optional[float] = None,
+                 refresh_ahead: float = 0.8,
+                 retry_after: float = 30.0) -> None:
+        self.provider = provider
+        self.ttl = ttl if ttl is not None else provider.default_ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_after = retry_after
+        self.last_error: Optional[str] = None
+        self._retry_at = 0.0
+        self._snapshot: Optional[RateSnapshot] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        """True once a snapshot exists, so ``snapshot()`` no longer fetches."""
+        return self._snapshot is not None
+
+    @property
+    def refresh_interval(self) -> float:
+        return math.inf if self.ttl is None else self.ttl * self.refresh_ahead
+
+    def snapshot(self) -> RateSnapshot:
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._swap(self.provider.fetch())
+                snap = self._snapshot
+            assert snap is not None
+        elif snap.age >= self.refresh_interval:
+            self._refresh_in_background()
+        return snap
+
+    def is_stale(self) -> bool:
+        snap = self._snapshot
+        return snap is None or (self.ttl is not None and snap.age > self.ttl)
+
+    def refresh(self) -> RateSnapshot:
+        """Fetch synchronously and swap in the result."""
+        rates = self.provider.fetch()
+        with self._lock:
+            return self._swap(rates)
+
+    def start(self) -> None:
+        """Load rates now and keep them fresh from a daemon thread."""
+        if self._thread is not None:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            self._record_error(e)
+        if self.ttl is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rates-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _swap(self, rates: ExchangeRates) -> RateSnapshot:
+        current = self._snapshot
+        if current is not None and current.rates == rates:
+            version = current.version
+        else:
+            version = (current.version if current else 0) + 1
+        snap = RateSnapshot(rates=rates, version=version)
+        self._snapshot = snap
+        self.last_error = None
+        return snap
+
+    def _run(self) -> None:
+        while True:
+            snap = self._snapshot
+            wait = self.refresh_interval - snap.age if snap else 0.0
+            if self._stop.wait(max(wait, 1.0)):
+                return
+            snap = self._snapshot
+            if (snap is None or snap.age >= self.refresh_interval) and time.time() >= self._retry_at:
+                self._refresh_quietly()
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing or time.time() < self._retry_at:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_quietly, name="rates-refresh-once", daemon=True).start()
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            self._record_error(e)
+        finally:
+            self._refreshing = False
+
+    def _record_error(self, e: Exception) -> None:
+        self.last_error = f"{type(e).__name__}: {e}"
+        self._retry_at = time.time() + self.retry_after
+        print(f"[rates] refresh from {type(self.provider).__name__} failed: {self.last_error}", file=sys.stderr)
+
+
+def provider_from_env() -> RateProvider:
+    """
+    Build the rate provider named by ``RATES_SOURCE``.
+
+    An ``http://`` or ``https://`` URL selects ``HttpRateProvider``, any other
+    value is treated as a JSON file path, and an unset variable keeps the
+    built-in synthetic table.
+    """
+    source = os.environ.get("RATES_SOURCE", "").strip()
+    if not source:
+        return StaticRateProvider()
+    if source.startswith(("http://", "https://")):
+        return HttpRateProvider(source)
+    return JsonFileRateProvider(source)
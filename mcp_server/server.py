@@ -9,8 +9,8 @@ Architecture Overview:
 ===================
 This server implements a session-based authentication system specifically designed
 for AI assistants and automated tools. Unlike traditional API authentication that
-requires passing tokens with each request, this system maintains a global session
-state that persists across tool calls within the same conversation/session.
+requires passing tokens with each request, this system maintains session state per
+client connection that persists across tool calls within the same conversation/session.
 
 Key Components:
 - Authentication Manager: Handles JWT token creation/validation and session lifecycle
@@ -32,7 +32,8 @@ Security Model:
 ==============
 - JWT tokens signed with HS256 algorithm using demo secret
 - 1-hour session expiration for security (3600 seconds)
-- Automatic cleanup of expired sessions on access
+- Automatic cleanup of expired sessions on access and by a periodic reaper
+- Bounded session store (MAX_SESSIONS) with least-recently-used eviction
 - Global session management for AI assistant compatibility
 - No sensitive data stored in session (only user metadata)
 - Secure token generation with timestamp validation
@@ -43,21 +44,21 @@ Authentication Flow:
    - Server generates unique user_id and session_id
    - JWT token created with user claims and expiration
    - Session stored in global _USER_SESSIONS dictionary
-   - Global _CURRENT_SESSION set for subsequent tool calls
+   - Session set as current for the calling connection
 
 2. AI Assistant can check status with session_status()
    - Returns authentication state, user info, and time remaining
    - Automatically cleans up expired sessions
 
 3. AI Assistant calls protected operations (books_query, exchange_convert)
-   - Server checks _CURRENT_SESSION for valid authentication
+   - Server checks the connection's current session for valid authentication
    - Validates session hasn't expired (removes if expired)
    - Executes operation with user context
    - Returns results with authenticated_user information
 
 4. AI Assistant calls logout() to end session (optional)
    - Removes session from global storage
-   - Clears _CURRENT_SESSION
+   - Clears the connection's current session
    - Confirms logout success
 
 Error Handling:
@@ -109,46 +110,122 @@ Date: September 2025
 Version: 1.0.0
 """
 
+import argparse
 import asyncio
-from typing import Any, Dict, List, Optional
+import contextvars
+import secrets
+import tempfile
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import os
+import sys
+import threading
 import time
 import json
 import base64
 import hmac
 import hashlib
 
-import mcp.types as types
-from mcp.server import Server
-from mcp.server.stdio import stdio_server
+# The MCP SDK, NumPy (books, rates) and the dataset are only loaded when
+# first needed; see LAZY COMPONENTS below
+from .concurrency import (Overloaded, SingleFlight, limiters_from_env, offload_executor_from_env,
+                          run_blocking)
+from .encoding import StaticResponse, ToolResponse, response
+from .metrics import Gauge, Metrics, serve_metrics
+from .profiling import Profiler
+from .sessions import session_store_from_env
+from .tool_registry import ToolDef, ToolRegistry, ToolSpec
+from .tracing import span, tracer_from_env
 
-from .books import BooksRepository
-from .exchange import default_rates
-from .util.xlsx_to_csv import xlsx_first_sheet_to_csv
+if TYPE_CHECKING:
+    import mcp.types as types
+    from mcp.server import Server
+    from .books import BooksRepository, ConvertedPriceCache
+    from .books_vectors import BookVectors
+    from .rate_history import RateHistory
+    from .rates import RateCache, RateSnapshot
 
 
-def _prepare_books_csv() -> str:
+def _books_csv_paths() -> Tuple[str, str]:
     """
-    Prepare the books CSV file from XLSX source.
-    
-    This function handles the conversion of the Excel dataset to CSV format
-    for efficient processing by the BooksRepository. It ensures the data
-    directory exists and only converts if the CSV doesn't already exist.
+    Locations of the books dataset.
     
     Returns:
-        str: Absolute path to the prepared CSV file
+        Tuple[str, str]: Absolute paths of the CSV the BooksRepository reads
+        and of the XLSX source it is converted from on first load, if missing
         
     File Locations:
         - Input: sample-data/BooksDatasetClean.xlsx
         - Output: data/books.csv
     """
     root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-    csv_out = os.path.join(root, "data", "books.csv")
-    xlsx_in = os.path.join(root, "sample-data", "BooksDatasetClean.xlsx")
-    os.makedirs(os.path.dirname(csv_out), exist_ok=True)
-    if not os.path.exists(csv_out) and os.path.exists(xlsx_in):
-        xlsx_first_sheet_to_csv(xlsx_in, csv_out)
-    return csv_out
+    return (os.path.join(root, "data", "books.csv"),
+            os.path.join(root, "sample-data", "BooksDatasetClean.xlsx"))
+
+
+# ===============================================================================
+# JWT SIGNING STATE
+# ===============================================================================
+# The signing key is read once from configuration and turned into a keyed
+# HMAC-SHA256 object; each sign/verify copies it instead of re-deriving the
+# inner/outer key pads. The header never changes, so its encoding is cached.
+
+_JWT_SECRET = os.environ.get("JWT_SECRET", "demo-secret-key-123")
+_JWT_HMAC = hmac.new(_JWT_SECRET.encode(), digestmod=hashlib.sha256)
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(
+    json.dumps({"typ": "JWT", "alg": "HS256"}, separators=(',', ':')).encode()
+).decode().rstrip('=')
+
+
+def _jwt_signature(message: bytes) -> str:
+    mac = _JWT_HMAC.copy()
+    mac.update(message)
+    return base64.urlsafe_b64encode(mac.digest()).decode().rstrip('=')
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of tokens whose signature has already been verified.
+    
+    Entries keep the decoded payload and are dropped once the token's own
+    ``exp`` has passed, so a cache hit never extends a token's lifetime.
+    """
+    
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] < now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return dict(entry[1])
+    
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (float(payload.get('exp', 0)), dict(payload))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_VERIFIED_TOKENS = VerifiedTokenCache(int(os.environ.get("JWT_CACHE_SIZE", "1024")))
 
 
 def create_jwt_token(user_id: str, username: str) -> str:
@@ -161,7 +238,8 @@ def create_jwt_token(user_id: str, username: str) -> str:
     - Signature: HMAC-SHA256 signature for token integrity
     
     Security Notes:
-    - Uses demo secret key (replace with secure random key in production)
+    - Signing key comes from the JWT_SECRET environment variable
+      (falls back to a demo secret; always set it in production)
     - 1-hour expiration time for session security
     - Base64 URL-safe encoding without padding for JWT standard compliance
     
@@ -177,31 +255,25 @@ def create_jwt_token(user_id: str, username: str) -> str:
         Payload: {"user_id": "...", "username": "...", "exp": ..., "iat": ...}
         Signature: HMAC-SHA256 of header.payload using secret key
     """
-    # Demo secret key - in production, use a secure random key from environment
-    secret = "demo-secret-key-123"
-    
-    # JWT header specifying token type and algorithm
-    header = {"typ": "JWT", "alg": "HS256"}
+    now = time.time()
     
     # JWT payload with user claims and timestamps
     payload = {
         "user_id": user_id,        # Unique user identifier
         "username": username,       # Human-readable username
-        "exp": time.time() + 3600, # Expiration: 1 hour from now
-        "iat": time.time()         # Issued at: current timestamp
+        "exp": now + 3600,         # Expiration: 1 hour from now
+        "iat": now                 # Issued at: current timestamp
     }
 
-    # Encode header and payload to base64 (URL-safe, no padding)
-    header_b64 = base64.urlsafe_b64encode(json.dumps(header, separators=(',', ':')).encode()).decode().rstrip('=')
+    # Encode payload to base64 (URL-safe, no padding); header is precomputed
     payload_b64 = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
     
     # Create HMAC-SHA256 signature of header.payload
-    message = f"{header_b64}.{payload_b64}"
-    signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
-    signature_b64 = base64.urlsafe_b64encode(signature).decode().rstrip('=')
+    message = f"{_JWT_HEADER_B64}.{payload_b64}"
+    signature_b64 = _jwt_signature(message.encode())
     
     # Return complete JWT token
-    return f"{header_b64}.{payload_b64}.{signature_b64}"
+    return f"{message}.{signature_b64}"
 
 
 def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
@@ -209,14 +281,15 @@ def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     Validate a JWT token and return the payload if valid.
     
     This function performs comprehensive JWT validation:
-    1. Structure validation (3 parts separated by dots)
-    2. Signature verification using HMAC-SHA256
-    3. Expiration check against current time
-    4. Safe decoding with error handling
+    1. Verified-token cache lookup (skips steps 2-5 on a hit)
+    2. Structure validation (3 parts separated by dots)
+    3. Signature verification using HMAC-SHA256
+    4. Expiration check against current time
+    5. Safe decoding with error handling
     
     Security Checks:
     - Verifies token signature matches expected value
-    - Checks token hasn't expired (exp claim vs current time)
+    - Checks token hasn't expired (exp claim vs current time), also on cache hits
     - Handles malformed tokens gracefully
     - Uses constant-time comparison for signature verification
     
@@ -227,13 +300,19 @@ def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
         Optional[Dict[str, Any]]: Token payload if valid, None if invalid/expired
         
     Validation Process:
-        1. Split token into header.payload.signature
-        2. Recompute signature using same secret and algorithm
-        3. Compare signatures for integrity verification
-        4. Decode payload and check expiration time
-        5. Return payload or None based on validation result
+        1. Return the cached payload if this exact token was verified before
+        2. Split token into header.payload.signature
+        3. Recompute signature using same secret and algorithm
+        4. Compare signatures for integrity verification
+        5. Decode payload and check expiration time
+        6. Cache and return payload, or return None
     """
     try:
+        now = time.time()
+        cached = _VERIFIED_TOKENS.get(token, now)
+        if cached is not None:
+            return cached
+        
         # Split token into its three components
         parts = token.split('.')
         if len(parts) != 3:
@@ -242,13 +321,11 @@ def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
         header_b64, payload_b64, signature_b64 = parts
         
         # Verify signature integrity
-        secret = "demo-secret-key-123"  # Must match creation secret
         message = f"{header_b64}.{payload_b64}"
-        expected_signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
-        expected_signature_b64 = base64.urlsafe_b64encode(expected_signature).decode().rstrip('=')
+        expected_signature_b64 = _jwt_signature(message.encode())
         
         # Signature verification (constant-time comparison)
-        if signature_b64 != expected_signature_b64:
+        if not hmac.compare_digest(signature_b64.encode(), expected_signature_b64.encode()):
             return None  # Invalid signature
         
         # Decode payload from base64
@@ -257,9 +334,10 @@ def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
         payload = json.loads(base64.urlsafe_b64decode(payload_b64.encode()).decode())
         
         # Check token expiration
-        if payload.get('exp', 0) < time.time():
+        if payload.get('exp', 0) < now:
             return None  # Token has expired
         
+        _VERIFIED_TOKENS.put(token, payload)
         return payload  # Valid token, return claims
         
     except Exception:
@@ -274,37 +352,283 @@ def validate_jwt_token(token: str) -> Optional[Dict[str, Any]]:
 # In production, these should be replaced with Redis, database, or other
 # persistent storage solutions for scalability and reliability.
 
-# Dictionary storing all active user sessions
+# Store of all active user sessions. By default an in-process store ordered by
+# expiry and capped in size (MAX_SESSIONS, least recently used evicted first);
+# SESSION_BACKEND=redis://... or sqlite:///... shares sessions between workers
+# and across restarts, with a short-lived local read-through cache.
 # Structure: {session_id: {"user_id": str, "username": str, "token": str, "created_at": float}}
-_USER_SESSIONS = {}
+_USER_SESSIONS = session_store_from_env(ttl=3600)
 
-# Currently active session for this MCP server instance
+# Currently active session, tracked per MCP connection
 # This enables the session-based authentication model where AI assistants
-# authenticate once and then use tools without passing tokens
-_CURRENT_SESSION = None
+# authenticate once and then use tools without passing tokens. Each client
+# connection (the SDK's ServerSession) has its own entry, so clients sharing
+# one server process never see each other's session. Entries disappear with
+# the connection object.
+_CURRENT_SESSIONS: "weakref.WeakKeyDictionary[Any, str]" = weakref.WeakKeyDictionary()
+
+
+class _LocalConnection:
+    """Connection key for calls made outside an MCP request (direct calls, tests)."""
+
+
+# Fallback connection when handle_call_tool is invoked directly; can be
+# overridden per task to simulate separate clients in-process
+_LOCAL_CONNECTION: contextvars.ContextVar[Any] = contextvars.ContextVar(
+    "local_connection", default=_LocalConnection()
+)
+
+
+def _connection_key() -> Any:
+    if _SERVER is not None:
+        try:
+            return _SERVER.request_context.session
+        except LookupError:
+            pass
+    return _LOCAL_CONNECTION.get()
+
+
+def _current_session_id() -> Optional[str]:
+    """Session id authenticated on the calling connection, if any."""
+    return _CURRENT_SESSIONS.get(_connection_key())
+
+
+def _set_current_session_id(session_id: Optional[str]) -> None:
+    key = _connection_key()
+    if session_id is None:
+        _CURRENT_SESSIONS.pop(key, None)
+    else:
+        _CURRENT_SESSIONS[key] = session_id
+
+
+# ===============================================================================
+# LAZY COMPONENTS
+# ===============================================================================
+# Importing this module has no side effects and does not load the MCP SDK or
+# NumPy. The books repository, the exchange rates and the MCP server are
+# created on first use by the accessors below (the dataset itself loads on
+# the first query). A stdio server process, started per client session,
+# therefore answers initialize and tools/list after importing the SDK only.
+# Tests and tools may replace a component by assigning the global.
+
+_INIT_LOCK = threading.Lock()
+
+# Books repository over data/books.csv, converted from the XLSX on first load
+_BOOKS: Optional["BooksRepository"] = None
+
+# Price columns converted per currency, invalidated when the rate snapshot changes
+_PRICE_COLUMNS: Optional["ConvertedPriceCache"] = None
+
+# Exchange rates come from a pluggable provider (synthetic table by default,
+# or RATES_SOURCE file/URL) behind a TTL cache that refreshes in the background
+_RATES: Optional["RateCache"] = None
+
+# The MCP server with this module's handlers (create_server)
+_SERVER: Optional["Server"] = None
+
+# Similarity vectors for books_similar, with the repository they describe
+_VECTORS: Optional[Tuple[Any, "BookVectors"]] = None
+_VECTORS_LOCK = threading.Lock()
+
+
+def _books() -> "BooksRepository":
+    global _BOOKS
+    if _BOOKS is None:
+        with _INIT_LOCK:
+            if _BOOKS is None:
+                from .books import BooksRepository
+                csv_path, xlsx_path = _books_csv_paths()
+                _BOOKS = BooksRepository(csv_path, source=xlsx_path)
+    return _BOOKS
+
+
+def _price_columns() -> "ConvertedPriceCache":
+    global _PRICE_COLUMNS
+    books = _books()
+    columns = _PRICE_COLUMNS
+    if columns is None or columns.repo is not books:  # follow a replaced repository
+        from .books import ConvertedPriceCache
+        columns = _PRICE_COLUMNS = ConvertedPriceCache(books)
+    return columns
+
+
+def _book_vectors() -> "BookVectors":
+    """
+    Similarity vectors of ``_books()``, mapped from the dataset snapshot.
+
+    The snapshot (BOOKS_SNAPSHOT, or next to the CSV) is written on first use
+    unless it is up to date, so later starts reuse its vectors instead of
+    recomputing them. If it cannot be written, the vectors are computed in
+    memory. May take seconds on first use: call it off the event loop.
+    """
+    global _VECTORS
+    books = _books()
+    cached = _VECTORS
+    if cached is None or cached[0] is not books:  # follow a replaced repository
+        with _VECTORS_LOCK:
+            cached = _VECTORS
+            if cached is None or cached[0] is not books:
+                from .books_snapshot import BooksSnapshot, ensure_snapshot
+                if isinstance(books, BooksSnapshot):
+                    vectors = books.vectors()
+                else:
+                    try:
+                        path = ensure_snapshot(books, os.environ.get("BOOKS_SNAPSHOT") or None)
+                        vectors = BooksSnapshot(path).vectors()
+                    except OSError as e:
+                        print(f"[books] cannot write snapshot ({e}); computing similarity vectors in memory",
+                              file=sys.stderr)
+                        from .books_vectors import BookVectors
+                        vectors = BookVectors.build(books.headers, books.list_all())
+                cached = _VECTORS = (books, vectors)
+    return cached[1]
+
+
+def _rates() -> "RateCache":
+    global _RATES
+    if _RATES is None:
+        with _INIT_LOCK:
+            if _RATES is None:
+                from .rates import RateCache, provider_from_env
+                _RATES = RateCache(
+                    provider_from_env(),
+                    ttl=float(os.environ["RATES_TTL"]) if os.environ.get("RATES_TTL") else None,
+                )
+    return _RATES
+
+
+def _rate_history() -> Optional["RateHistory"]:
+    """The RATES_HISTORY rate history, or None when it is not configured. Its file loads on first use."""
+    global _RATE_HISTORY
+    if _RATE_HISTORY is None and os.environ.get("RATES_HISTORY"):
+        with _INIT_LOCK:
+            if _RATE_HISTORY is None:
+                from .rate_history import RateHistory
+                _RATE_HISTORY = RateHistory(os.environ["RATES_HISTORY"])
+    return _RATE_HISTORY
+
+
+async def _rate_snapshot() -> "RateSnapshot":
+    """
+    ``_rates().snapshot()`` for a tool call. The first load fetches the
+    table, so it runs off the event loop; later calls never fetch.
+    """
+    rates = _rates()
+    if rates.loaded:
+        return rates.snapshot()
+    return await run_blocking(_OFFLOAD, rates.snapshot)
+
+
+def create_server() -> "Server":
+    """
+    The MCP server for this module's tools, created and returned on first call.
+    
+    The SDK is imported here rather than at module import. The module
+    attribute ``server`` resolves to the same instance.
+    """
+    global _SERVER
+    if _SERVER is None:
+        with _INIT_LOCK:
+            if _SERVER is None:
+                from mcp.server import Server
+                mcp_server = Server("books-mcp")
+                mcp_server.list_tools()(handle_list_tools)
+                mcp_server.call_tool(validate_input=False)(handle_call_tool)
+                _SERVER = mcp_server
+    return _SERVER
+
+
+def __getattr__(name: str) -> Any:
+    # ``server`` (from mcp_server.server import server) is created on first access
+    if name == "server":
+        return create_server()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # ===============================================================================
-# REPOSITORY INITIALIZATION  
+# SERVER COMPONENTS
 # ===============================================================================
-# Initialize data repositories and server components
 
-# Prepare books CSV from Excel source and create repository
-_CSV = _prepare_books_csv()
-_BOOKS = BooksRepository(_CSV)
+# Pool of worker processes scanning a shared, read-only dataset snapshot
+# (enabled with --workers / MCP_WORKERS; None keeps every scan in-process)
+_BOOKS_WORKERS = None
+
+# On-demand CPU/allocation profiling (server_profile tool); reports go to PROFILE_DIR
+_PROFILER = Profiler(os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "mcp-profiles"))
+
+# Users allowed to call admin tools (comma-separated ADMIN_USERS; empty: nobody).
+# They must also present the ADMIN_TOKEN secret to authenticate (unset: nobody)
+_ADMIN_USERS = frozenset(u.strip() for u in os.environ.get("ADMIN_USERS", "").split(",") if u.strip())
+_ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Bounded thread pool for heavy tool bodies, so scans don't stall the event
+# loop and cheap calls (session_status, authenticate) stay responsive; work
+# submitted while a profiling session runs is profiled too
+_OFFLOAD = _PROFILER.executor(offload_executor_from_env())
+
+# Per-tool concurrency limits with a short wait queue ("concurrent:queued",
+# overridable with TOOL_LIMITS); tools without an entry are not limited
+_TOOL_LIMITERS = limiters_from_env({
+    "books_query": "8:64",
+    "books_similar": "8:64",
+    "exchange_convert_batch": "4:32",
+})
+
+# Identical books_query scans in flight at the same time run only once
+_BOOKS_INFLIGHT = SingleFlight()
+
+# Most completions one books_suggest call returns, and most books one books_similar call returns
+_SUGGEST_MAX = 50
+_SIMILAR_MAX = 50
+
+# Optional historical rates for as-of conversions (see _rate_history)
+_RATE_HISTORY: Optional["RateHistory"] = None
 
-# Initialize exchange rates with synthetic data
-_RATES = default_rates()
+# Per-tool call counters and latency histograms (server_metrics tool, and
+# Prometheus text on --metrics-port)
+_METRICS = Metrics()
+_STARTED_AT = time.time()
 
-# Create MCP server instance with descriptive name
-server = Server("books-mcp")
+# Stage-level tracing of a sample of calls (TRACE_SAMPLE_RATE, off by default)
+_TRACER = tracer_from_env()
+
+
+def _component_gauges() -> List[Gauge]:
+    """Limiter, coalescing and session gauges, read at scrape time."""
+    limiters = sorted(_TOOL_LIMITERS.items())
+    # Counting a shared store's sessions scans its whole backend, too costly per scrape
+    if _USER_SESSIONS.blocking:
+        sessions: Gauge = ("sessions_cached", "Sessions in this process's cache of the shared session store.",
+                           [({}, _USER_SESSIONS.cached_count())])
+    else:
+        sessions = ("sessions", "Live sessions in the session store.", [({}, len(_USER_SESSIONS))])
+    return [
+        ("tool_active_calls", "Calls holding one of the tool's concurrency slots.",
+         [({"tool": t}, l.active) for t, l in limiters]),
+        ("tool_queued_calls", "Calls waiting for one of the tool's slots.",
+         [({"tool": t}, l.queued) for t, l in limiters]),
+        ("tool_rejected_calls", "Calls turned away as overloaded since start.",
+         [({"tool": t}, l.rejected) for t, l in limiters]),
+        ("books_scans_started", "books_query scans started since start.", [({}, _BOOKS_INFLIGHT.started)]),
+        ("books_scans_coalesced", "books_query calls that joined a scan already running.",
+         [({}, _BOOKS_INFLIGHT.coalesced)]),
+        sessions,
+    ]
+
+
+_METRICS.add_gauges(_component_gauges)
 
 
 # ===============================================================================
-# MCP TOOL DEFINITIONS
+# MCP TOOL REGISTRY
 # ===============================================================================
+# Every tool registers its definition and handler once, below; the registry
+# compiles each inputSchema into a validator at registration
+
+_TOOLS = ToolRegistry()
 
-@server.list_tools()
-async def handle_list_tools() -> List[types.Tool]:
+
+async def handle_list_tools() -> List["types.Tool"]:
     """
     Define all available MCP tools for this server.
     
@@ -313,7 +637,12 @@ async def handle_list_tools() -> List[types.Tool]:
     
     1. Protected Operations (require active session):
        - books_query: Search and retrieve book information from dataset
+       - books_suggest: Autocomplete titles, authors and publishers
+       - books_similar: Books most like a given one ("more like this")
        - exchange_convert: Convert currency amounts using current rates
+       - exchange_convert_batch: Convert many amounts in one vectorized call
+       - server_metrics: Per-tool call counts, latency percentiles and gauges
+       - server_profile: On-demand CPU/allocation profiling (admin only)
        
     2. Session Management (public access):
        - authenticate: Create new user session with JWT token
@@ -326,462 +655,1266 @@ async def handle_list_tools() -> List[types.Tool]:
     - Optional parameters allow flexible usage patterns
     - additionalProperties: false prevents unexpected parameters
     
+    The list is built once from the registry and reused for every request.
+    
     Returns:
         List[types.Tool]: Complete list of available MCP tools
     """
-    return [
-        # =======================================================================
-        # PROTECTED OPERATIONS - REQUIRE ACTIVE SESSION
-        # =======================================================================
-        
-        types.Tool(
-            name="books_query",
-            description="Search and retrieve books from the dataset. Supports filtering by title, author, genre, year, and pagination. Returns detailed book information including metadata. Requires active session for access.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "id": {
-                        "type": "string", 
-                        "description": "Specific book ID to fetch (returns single book)"
-                    },
-                    "genre": {
-                        "type": "string", 
-                        "description": "Filter books by genre/category"
-                    },
-                    "year": {
-                        "type": "string", 
-                        "description": "Filter by publication year (exact match)"
-                    },
-                    "author": {
-                        "type": "string", 
-                        "description": "Filter by author name (partial match supported)"
-                    },
-                    "title": {
-                        "type": "string", 
-                        "description": "Filter by book title (contains search)"
-                    },
-                    "limit": {
-                        "type": "integer", 
-                        "description": "Maximum number of results to return (default: 10)"
-                    },
-                    "offset": {
-                        "type": "integer", 
-                        "description": "Starting position for pagination (default: 0)"
-                    },
-                },
-                "additionalProperties": False,
-            },
-        ),
-        
-        types.Tool(
-            name="exchange_convert",
-            description="Convert monetary amounts between different currencies using current exchange rates. Supports major world currencies with real-time conversion calculations. Requires active session for access.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "from_currency": {
-                        "type": "string", 
-                        "description": "Source currency code (e.g., 'USD', 'EUR', 'GBP')"
-                    },
-                    "to_currency": {
-                        "type": "string", 
-                        "description": "Target currency code for conversion"
-                    },
-                    "amount": {
-                        "type": "number", 
-                        "description": "Amount to convert (supports decimals)"
-                    },
-                },
-                "required": ["from_currency", "to_currency", "amount"],
-                "additionalProperties": False,
-            },
-        ),
-        
-        # =======================================================================
-        # SESSION MANAGEMENT - PUBLIC ACCESS
-        # =======================================================================
-        
-        types.Tool(
-            name="authenticate",
-            description="Create a new user session and authenticate for protected operations. Generates JWT token and establishes session state for subsequent tool calls. Required before using books_query or exchange_convert.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "username": {
-                        "type": "string", 
-                        "description": "Username for authentication (any string allowed for demo)"
-                    },
-                },
-                "required": ["username"],
-                "additionalProperties": False,
-            },
-        ),
-        types.Tool(
-            name="logout",
-            description="End the current authentication session and clean up session data. Removes session from server storage and clears authentication state. Safe to call even when not authenticated.",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "additionalProperties": False,
-            },
-        ),
-        
-        types.Tool(
-            name="session_status",
-            description="Check current authentication status and session information. Returns authentication state, user details, session age, and time remaining before expiration. Useful for monitoring session health.",
-            inputSchema={
-                "type": "object", 
-                "properties": {},
-                "additionalProperties": False,
-            },
-        ),
-    ]
+    return _TOOLS.tools()
 
 
 # ===============================================================================
 # MCP TOOL CALL HANDLER
 # ===============================================================================
 
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+# Error bodies that never change, encoded to JSON once
+_AUTHENTICATION_REQUIRED = StaticResponse({
+    "error": "authentication_required",
+    "message": "No active session. Please authenticate first using the 'authenticate' tool.",
+    "hint": "Call authenticate tool with your username to create a session"
+})
+_SESSION_EXPIRED = StaticResponse({
+    "error": "session_expired",
+    "message": "Session has expired. Please authenticate again.",
+    "hint": "Sessions expire after 1 hour. Please call authenticate tool again."
+})
+_TOKEN_REJECTED = StaticResponse({
+    "error": "invalid_credentials",
+    "message": "Session token failed validation. Please authenticate again.",
+    "hint": "Call authenticate tool again to obtain a fresh session."
+})
+_FORBIDDEN = StaticResponse({
+    "error": "forbidden",
+    "message": "This tool is restricted to administrators.",
+    "hint": "Administrators are listed in the server's ADMIN_USERS setting and authenticate with its ADMIN_TOKEN."
+})
+_ADMIN_REJECTED = StaticResponse({
+    "error": "invalid_credentials",
+    "message": "Admin token rejected.",
+    "hint": "Call authenticate without admin_token for a regular session."
+})
+_RESUME_REJECTED = StaticResponse({
+    "error": "invalid_credentials",
+    "message": "Session not found, expired or owned by another user.",
+    "hint": "Call authenticate without session_id to create a new session."
+})
+
+
+async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> ToolResponse:
     """
     Handle all incoming tool calls with session-based authentication.
     
-    This is the main dispatcher for all MCP tool requests. It implements:
-    
-    1. Session Management Tools (no authentication required):
-       - authenticate: Creates new session with JWT token
-       - session_status: Returns current authentication state  
-       - logout: Ends session and cleans up storage
-    
-    2. Protected Operations (require active session):
-       - books_query: Database operations on book dataset
-       - exchange_convert: Currency conversion calculations
+    Every call goes through the same steps:
+    1. Look the tool up in the registry (unknown names raise ValueError)
+    2. Validate the arguments with the tool's precompiled validator; invalid
+       input is rejected with invalid_request before any work is done
+    3. For protected tools, resolve the connection's session
+       (authentication_required / session_expired / invalid_credentials);
+       admin tools also require a user listed in ADMIN_USERS whose session
+       was created with the ADMIN_TOKEN secret (forbidden)
+    4. Run the tool's handler
     
-    Authentication Flow:
-    - Public tools execute immediately without session checks
-    - Protected tools first validate _CURRENT_SESSION exists and is valid
-    - Expired sessions are automatically cleaned up and marked invalid
-    - All responses include user context for audit trails
-    
-    Error Handling:
-    - authentication_required: No session for protected operations
-    - session_expired: Session exists but exceeded time limit
-    - tool_not_found: Unknown tool name requested
-    - parameter_missing: Required parameters not provided
+    Heavy tool bodies run through _run_limited, so they only start while one
+    of the tool's slots is free, or after a short wait in a bounded queue.
+    When the queue is full, or no slot frees up within TOOL_QUEUE_TIMEOUT
+    seconds, the call returns an "overloaded" error at once instead of adding
+    to everyone's latency.
     
     Args:
         name (str): Name of the tool to execute
         arguments (Dict[str, Any]): Tool parameters from the request
         
     Returns:
-        List[types.TextContent]: JSON response wrapped in MCP TextContent
-        
-    Session State Management:
-    - _CURRENT_SESSION: Global variable tracking active session
-    - _USER_SESSIONS: Dictionary of all active sessions with metadata
-    - Automatic cleanup of expired sessions on access
+        ToolResponse: JSON response wrapped in MCP TextContent (plus structured
+        content when MCP_STRUCTURED_CONTENT is set)
     """
-    global _CURRENT_SESSION
-    
-    # =======================================================================
-    # TOOL NAME VALIDATION
-    # =======================================================================
-    
-    # Check if tool name is valid before authentication check
-    valid_tools = {"authenticate", "logout", "session_status", "books_query", "exchange_convert"}
-    if name not in valid_tools:
+    spec = _TOOLS.get(name)
+    if spec is None:
         raise ValueError(f"Unknown tool: {name}")
-    
-    # =======================================================================
-    # SESSION MANAGEMENT TOOLS (PUBLIC ACCESS)
-    # =======================================================================
-    
-    if name == "authenticate":
-        """
-        Create new user session and authenticate for protected operations.
-        
-        Process:
-        1. Extract username from arguments (default to demo_user)
-        2. Generate unique user_id using hash of username
-        3. Create JWT token with user claims and 1-hour expiration
-        4. Store session in global _USER_SESSIONS dictionary
-        5. Set _CURRENT_SESSION for immediate use
-        6. Return session details and authentication confirmation
-        """
-        username = arguments.get("username", "demo_user")
-        user_id = f"user_{hash(username) % 10000}"  # Generate deterministic user ID
-        
-        # Create JWT token with user claims
-        token = create_jwt_token(user_id, username)
-        
-        # Generate unique session ID and store session data
-        session_id = f"session_{hash(username + str(time.time())) % 100000}"
-        _USER_SESSIONS[session_id] = {
-            "username": username,    # Human-readable username
-            "user_id": user_id,     # Unique user identifier
-            "token": token,         # JWT token for validation
-            "created_at": time.time()  # Session creation timestamp
-        }
-        
-        # Set as current active session
-        _CURRENT_SESSION = session_id
-        
-        # Return session details and success confirmation
-        result = {
-            "success": True,
-            "message": f"Successfully authenticated as {username}",
-            "username": username,
-            "user_id": user_id,
-            "session_id": session_id,
-            "expires_in": 3600  # 1 hour in seconds
+    arguments = arguments or {}
+    trace = _TRACER.start(name, arguments)
+    started = time.perf_counter()
+    try:
+        result = await _dispatch(spec, arguments)
+    except Exception:
+        _METRICS.record_call(name, "exception", time.perf_counter() - started, 0)
+        _TRACER.finish(trace, "exception")
+        raise
+    outcome = _record_call(name, result, time.perf_counter() - started)
+    _TRACER.finish(trace, outcome)
+    if _PROFILER.session is not None and name != "server_profile":
+        _PROFILER.count_call()
+    return result
+
+
+async def _dispatch(spec: ToolSpec, arguments: Dict[str, Any]) -> ToolResponse:
+    """Validate, authorize and run one call of a registered tool."""
+    name = spec.tool.name
+    with span("validate"):
+        problem = spec.validate(arguments)
+    if problem is not None:
+        error_result = {
+            "error": "invalid_request",
+            "message": problem,
+            "tool": name
         }
-        return [types.TextContent(type="text", text=str(result))]
+        return response(error_result)
     
-    elif name == "logout":
-        """
-        End current authentication session and clean up session data.
-        
-        Process:
-        1. Check if there's an active session
-        2. Remove session from global storage
-        3. Clear _CURRENT_SESSION variable
-        4. Return logout confirmation with username
-        5. Handle case where no session exists gracefully
-        """
-        if _CURRENT_SESSION and _CURRENT_SESSION in _USER_SESSIONS:
-            username = _USER_SESSIONS[_CURRENT_SESSION]["username"]
-            del _USER_SESSIONS[_CURRENT_SESSION]  # Remove from storage
-            _CURRENT_SESSION = None  # Clear current session
-            result = {
-                "success": True, 
-                "message": f"Successfully logged out {username}"
-            }
-        else:
-            result = {
-                "success": True, 
-                "message": "No active session to logout"
-            }
-        return [types.TextContent(type="text", text=str(result))]
+    session = None
+    if not spec.public:
+        with span("authorize"):
+            session, denied = await _authorized_session()
+        if denied is not None:
+            return denied
+        if spec.admin and not (session.get("admin") and session["username"] in _ADMIN_USERS):
+            return _FORBIDDEN()
     
-    elif name == "session_status":
-        """
-        Check current authentication status and session information.
-        
-        Process:
-        1. Check if there's an active session in _CURRENT_SESSION
-        2. Validate session exists in _USER_SESSIONS storage
-        3. Check if session has expired (1 hour limit)
-        4. Clean up expired sessions automatically
-        5. Return detailed session information or unauthenticated state
-        """
-        if _CURRENT_SESSION and _CURRENT_SESSION in _USER_SESSIONS:
-            session = _USER_SESSIONS[_CURRENT_SESSION]
-            
-            # Calculate session timing information
-            session_age = int(time.time() - session["created_at"])
-            expires_in = max(0, 3600 - session_age)  # Time remaining until expiration
-            
-            result = {
-                "authenticated": True,
-                "username": session["username"],
-                "user_id": session["user_id"], 
-                "session_age": session_age,      # How long session has been active
-                "expires_in": expires_in         # Seconds until session expires
-            }
-        else:
-            result = {
-                "authenticated": False,
-                "message": "No active session. Use 'authenticate' tool to login."
-            }
-        return [types.TextContent(type="text", text=str(result))]
+    try:
+        return await spec.handler(arguments, session)
+    except Overloaded as e:
+        error_result = {
+            "error": "overloaded",
+            "message": f"Server is busy ({e.reason}). Please retry shortly.",
+            "tool": name,
+            "retry_after": 1
+        }
+        return response(error_result)
+
+
+def _record_call(tool: str, result: ToolResponse, seconds: float) -> str:
+    """Count a finished call under its outcome ("ok", or the error code it returned) and return it."""
+    content = result[0] if isinstance(result, tuple) else result
+    text = content[0].text
+    outcome = "ok"
+    # Error bodies always lead with their "error" key, so no parsing is needed
+    if text.startswith('{"error":"'):
+        outcome = text[10:text.index('"', 10)]
+    size = len(text) if text.isascii() else len(text.encode("utf-8"))
+    _METRICS.record_call(tool, outcome, seconds, size)
+    return outcome
+
+
+async def _session_get(session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    ``_USER_SESSIONS.get(session_id)``. A shared store answers from its local
+    cache when it can; a backend read runs off the event loop.
+    """
+    if not session_id:
+        return None
+    session = _USER_SESSIONS.cached(session_id)
+    if session is None and _USER_SESSIONS.blocking:
+        session = await run_blocking(_OFFLOAD, _USER_SESSIONS.get, session_id)
+    return session
+
+
+async def _session_io(fn: Callable[..., Any], *args: Any) -> Any:
+    """Call a ``_USER_SESSIONS`` method, off the event loop if the store does backend I/O."""
+    if _USER_SESSIONS.blocking:
+        return await run_blocking(_OFFLOAD, fn, *args)
+    return fn(*args)
+
+
+async def _authorized_session() -> Tuple[Optional[Dict[str, Any]], Optional[ToolResponse]]:
+    """
+    Session of the calling connection for a protected tool, or the error to return.
     
-    # =======================================================================
-    # PROTECTED OPERATIONS - AUTHENTICATION REQUIRED
-    # =======================================================================
+    Checks that the connection has a session, that it has not expired (1 hour)
+    and that its token still validates; expired or rejected sessions are
+    removed on the spot.
+    """
+    current_session = _current_session_id()
     
     # Validate active session exists
-    if not _CURRENT_SESSION or _CURRENT_SESSION not in _USER_SESSIONS:
-        error_result = {
-            "error": "authentication_required",
-            "message": "No active session. Please authenticate first using the 'authenticate' tool.",
-            "hint": "Call authenticate tool with your username to create a session"
-        }
-        return [types.TextContent(type="text", text=str(error_result))]
+    session = await _session_get(current_session)
+    if session is None:
+        return None, _AUTHENTICATION_REQUIRED()
     
     # Validate session hasn't expired (1 hour limit)
-    session = _USER_SESSIONS[_CURRENT_SESSION]
     if time.time() - session["created_at"] > 3600:  # 1 hour = 3600 seconds
         # Clean up expired session
-        del _USER_SESSIONS[_CURRENT_SESSION]
-        _CURRENT_SESSION = None
-        error_result = {
-            "error": "session_expired",
-            "message": "Session has expired. Please authenticate again.",
-            "hint": "Sessions expire after 1 hour. Please call authenticate tool again."
-        }
-        return [types.TextContent(type="text", text=str(error_result))]
-    
-    # Session is valid - extract user information for operation context
-    username = session["username"]
-    user_id = session["user_id"]
+        await _session_io(_USER_SESSIONS.pop, current_session)
+        _set_current_session_id(None)
+        return None, _SESSION_EXPIRED()
     
-    # =======================================================================
-    # BOOKS DATABASE OPERATIONS
-    # =======================================================================
+    # Verify the session's token (signature + exp); cached after the first check
+    if validate_jwt_token(session["token"]) is None:
+        await _session_io(_USER_SESSIONS.pop, current_session)
+        _set_current_session_id(None)
+        return None, _TOKEN_REJECTED()
     
-    if name == "books_query":
-        """
-        Search and retrieve books from the dataset with various filtering options.
-        
-        This tool provides flexible book search capabilities:
-        - Specific book lookup by ID (returns single book)
-        - Multi-field filtering (genre, year, author, title)
-        - Pagination support (limit, offset)
-        - Partial text matching for titles and authors
-        
-        All operations include authenticated_user context for audit trails.
-        """
-        # Extract search parameters from arguments
-        book_id = arguments.get("id")          # Specific book ID lookup
-        genre = arguments.get("genre")         # Filter by genre/category
-        year = arguments.get("year")           # Filter by publication year
-        author = arguments.get("author")       # Filter by author name
-        title = arguments.get("title")         # Filter by title (contains)
-        limit = arguments.get("limit")         # Maximum results to return
-        offset = arguments.get("offset")       # Pagination offset
-        
-        # Handle specific book ID lookup (highest priority)
-        if book_id not in (None, ""):
-            item = _BOOKS.get_by_id(str(book_id))
-            if item is None:
-                error_result = {
-                    "error": "not_found", 
-                    "message": f"Book with ID '{book_id}' not found",
-                    "authenticated_user": username
-                }
-                return [types.TextContent(type="text", text=str(error_result))]
-            
-            # Return single book with user context
-            result = {
-                "authenticated_user": username,
-                "data": item,
-                "query_type": "specific_book"
+    return session, None
+
+
+async def _run_limited(tool: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Await ``fn()`` under ``tool``'s concurrency limit, if it has one."""
+    limiter = _TOOL_LIMITERS.get(tool)
+    if limiter is None:
+        return await fn()
+    with span("queue"):
+        await limiter.acquire()
+    try:
+        return await fn()
+    finally:
+        limiter.release()
+
+
+def _query_books_inline(params: Dict[str, Any], currency: Optional[str], snapshot: Any) -> Dict[str, Any]:
+    """books_query scan in this process; runs on the offload pool."""
+    if currency:
+        with span("books.prices"):
+            prices = _price_columns().column(currency, snapshot)
+    else:
+        prices = None
+    from .books import query_books
+    return query_books(_books(), prices=prices, **params)
+
+
+# ===============================================================================
+# BOOKS DATABASE OPERATIONS
+# ===============================================================================
+
+@_TOOLS.register(
+    ToolDef(
+        name="books_query",
+        description="Search and retrieve books from the dataset. Supports filtering by title, author, genre, year, boolean filter expressions over category, year and publisher, and pagination. Returns detailed book information including metadata. Requires active session for access.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "id": {
+                    "type": "string", 
+                    "description": "Specific book ID to fetch (returns single book)"
+                },
+                "genre": {
+                    "type": "string", 
+                    "description": "Filter books by genre/category"
+                },
+                "year": {
+                    "type": "string", 
+                    "description": "Filter by publication year (exact match)"
+                },
+                "author": {
+                    "type": "string", 
+                    "description": "Filter by author name (partial match supported)"
+                },
+                "title": {
+                    "type": "string", 
+                    "description": "Filter by book title (contains search)"
+                },
+                "filter": {
+                    "type": "string",
+                    "description": "Boolean filter on exact category, year and publisher values: field:value terms with AND, OR, NOT and parentheses, e.g. 'category:fiction AND NOT category:romance', '(category:mystery OR category:thriller) AND year:1990..1999', 'publisher:\"Simon & Schuster\"'. 'value*' matches a prefix"
+                },
+                "limit": {
+                    "type": "integer", 
+                    "description": "Maximum number of results to return (default: 10)"
+                },
+                "offset": {
+                    "type": "integer", 
+                    "description": "Starting position for pagination (default: 0)"
+                },
+                "currency": {
+                    "type": "string",
+                    "description": "Also show prices in this currency (e.g. 'EUR'); price filters then use it too"
+                },
+                "min_price": {
+                    "type": "number",
+                    "description": "Minimum price (inclusive), in 'currency' if given, otherwise USD"
+                },
+                "max_price": {
+                    "type": "number",
+                    "description": "Maximum price (inclusive), in 'currency' if given, otherwise USD"
+                },
+                "format": {
+                    "type": "string",
+                    "enum": ["records", "table"],
+                    "description": "'records' (default): one object per book; 'table': column names once plus rows as arrays (smaller)"
+                },
+                "dictionary": {
+                    "type": "boolean",
+                    "description": "With format 'table', send mostly repeated columns (e.g. category) as indexes into 'dictionaries' (default: true)"
+                },
+                "mode": {
+                    "type": "string",
+                    "enum": ["rows", "count", "exists"],
+                    "description": "'rows' (default): return matching books; 'count': only the number of matches; 'exists': only whether any book matches. Count and exists ignore limit and offset and are much cheaper than fetching rows"
+                },
+            },
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _books_query(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Search and retrieve books from the dataset with various filtering options.
+
+    This tool provides flexible book search capabilities:
+    - Specific book lookup by ID (returns single book)
+    - Multi-field filtering (genre, year, author, title)
+    - Boolean filter expressions over category, year and publisher,
+      answered from bitmap indexes
+    - Pagination support (limit, offset)
+    - Count-only and existence queries (mode), answered without building rows
+    - Partial text matching for titles and authors
+
+    All operations include authenticated_user context for audit trails.
+    """
+    username = session["username"]
+    # Extract search parameters from arguments
+    book_id = arguments.get("id")          # Specific book ID lookup
+    genre = arguments.get("genre")          # Filter by genre/category
+    year = arguments.get("year")            # Filter by publication year
+    author = arguments.get("author")        # Filter by author name
+    title = arguments.get("title")          # Filter by title (contains)
+    where = arguments.get("filter")         # Boolean filter expression
+    limit = arguments.get("limit")          # Maximum results to return
+    offset = arguments.get("offset")        # Pagination offset
+    currency = arguments.get("currency")    # Optional display/filter currency
+    min_price = arguments.get("min_price")  # Price range lower bound
+    max_price = arguments.get("max_price")  # Price range upper bound
+    output_format = arguments.get("format", "records")  # "records" or compact "table"
+    dictionary = arguments.get("dictionary", True)      # Dictionary-encode repeated values (table)
+    mode = arguments.get("mode", "rows")                # Rows, or only a count / existence check
+
+    # Reject a malformed filter expression before any work is queued
+    if where is not None:
+        from .books_index import FilterError, parse_filter
+        try:
+            parse_filter(where)
+        except FilterError as e:
+            error_result = {
+                "error": "invalid_request",
+                "message": f"Invalid filter: {e}",
+                "tool": "books_query"
             }
-            return [types.TextContent(type="text", text=str(result))]
-        
-        # Handle filtered search with multiple criteria
-        data = _BOOKS.filter(
-            genre=genre,              # Category filter
-            year=year,                # Publication year filter
-            author=author,            # Author name filter (partial match)
-            title_contains=title,     # Title search (partial match)
-            limit=limit,              # Result count limit
-            offset=offset,            # Pagination offset
-        )
-        
-        # Return search results with metadata
+            return response(error_result)
+
+    # Resolve the conversion rate once for the whole query; the scan
+    # converts the price column with it
+    price_rate = None
+    price_key = None
+    snapshot = None
+    if currency:
+        try:
+            with span("rates"):
+                snapshot = await _rate_snapshot()
+                price_rate = snapshot.rates.rate(_books().price_currency, currency)
+        except Exception as e:
+            error_result = {
+                "error": "conversion_failed",
+                "message": str(e),
+                "authenticated_user": username
+            }
+            return response(error_result)
+        price_key = f"Price ({currency.upper()})"
+
+    params = {
+        "book_id": book_id,       # Specific book ID lookup (highest priority)
+        "genre": genre,           # Category filter
+        "year": year,             # Publication year filter
+        "author": author,         # Author name filter
+        "title": title,           # Title search (partial match)
+        "where": where,           # Boolean filter expression
+        "limit": limit,           # Result count limit
+        "offset": offset,         # Pagination offset
+        "min_price": min_price,   # Price range, in the requested currency
+        "max_price": max_price,
+        "price_key": price_key,   # Extra converted-price field name
+        "format": output_format,  # Row objects or columns + row arrays
+        "dictionary": dictionary,
+        "mode": mode,             # "count"/"exists" skip building rows
+    }
+
+    async def scan() -> Dict[str, Any]:
+        with span("scan", workers=_BOOKS_WORKERS is not None):
+            if _BOOKS_WORKERS is not None:
+                # Scan in a worker process over the shared dataset snapshot
+                found = await _BOOKS_WORKERS.query(params, price_rate)
+            else:
+                # Scan on the offload pool so the event loop keeps serving other calls
+                found = await run_blocking(_OFFLOAD, _query_books_inline, params, currency, snapshot)
+        _METRICS.record_rows("books_query", scanned=found.get("scanned", 0))
+        return found
+
+    # Concurrent identical queries (same normalized filters, page and rate
+    # snapshot) share one scan; each caller still gets its own response
+    from .books import query_key
+    key = (query_key(**params), snapshot.version if snapshot is not None else None)
+    coalesced = _BOOKS_INFLIGHT.coalesced
+    with span("wait") as stage:
+        outcome = await _BOOKS_INFLIGHT.do(key, lambda: _run_limited("books_query", scan))
+        stage.set(coalesced=_BOOKS_INFLIGHT.coalesced != coalesced)
+
+    filters_applied = {
+        "genre": genre,
+        "year": year,
+        "author": author,
+        "title": title,
+        "filter": where,
+        "limit": limit,
+        "offset": offset,
+        "currency": currency.upper() if currency else None,
+        "min_price": min_price,
+        "max_price": max_price
+    }
+
+    # Count and existence checks carry no rows
+    if mode != "rows":
         result = {
             "authenticated_user": username,
-            "data": data,
-            "count": len(data),
-            "query_type": "filtered_search",
-            "filters_applied": {
-                "genre": genre,
-                "year": year, 
-                "author": author,
-                "title": title,
-                "limit": limit,
-                "offset": offset
+            mode: outcome[mode],
+            "query_type": mode,
+            "filters_applied": dict(filters_applied, id=book_id) if book_id not in (None, "") else filters_applied
+        }
+        return response(result)
+
+    # Handle specific book ID lookup
+    if book_id not in (None, ""):
+        if outcome["data"] is None:
+            error_result = {
+                "error": "not_found", 
+                "message": f"Book with ID '{book_id}' not found",
+                "authenticated_user": username
             }
+            return response(error_result)
+
+        _METRICS.record_rows("books_query", returned=1)
+        # Return single book with user context
+        result = {
+            "authenticated_user": username,
+            "data": outcome["data"],
+            "query_type": "specific_book"
         }
-        return [types.TextContent(type="text", text=str(result))]
-    
-    # =======================================================================
-    # CURRENCY EXCHANGE OPERATIONS
-    # =======================================================================
-    
-    elif name == "exchange_convert":
-        """
-        Convert monetary amounts between different currencies.
-        
-        This tool provides real-time currency conversion using:
-        - Synthetic exchange rates for demonstration
-        - Support for major world currencies
-        - Decimal precision for accurate calculations
-        - Error handling for invalid currency codes
-        
-        All conversions include authenticated_user context for audit trails.
-        """
-        # Extract required conversion parameters
-        from_currency = arguments["from_currency"]  # Source currency code
-        to_currency = arguments["to_currency"]      # Target currency code  
-        amount = arguments["amount"]                 # Amount to convert
-        
-        try:
-            # Perform currency conversion using exchange rates
-            value = _RATES.convert(float(amount), from_currency, to_currency)
-            
-            # Return conversion result with detailed information
+        return response(result)
+
+    # Return search results with metadata; a table replaces "data" with
+    # "columns", "rows" and optional "dictionaries"
+    if "table" in outcome:
+        body = dict(outcome["table"], format="table")
+        count = len(body["rows"])
+    else:
+        body = {"data": outcome["data"]}
+        count = len(outcome["data"])
+    _METRICS.record_rows("books_query", returned=count)
+    result = {
+        "authenticated_user": username,
+        **body,
+        "count": count,
+        "query_type": "filtered_search",
+        "filters_applied": filters_applied
+    }
+    if snapshot is not None:
+        result["rates_version"] = snapshot.version
+    return response(result)
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="books_suggest",
+        description="Autocomplete a title, author or publisher: returns the most frequent values starting with a prefix, with how many books have each. Much cheaper than books_query, so use it to find exact spellings before searching. Requires active session for access.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "prefix": {
+                    "type": "string",
+                    "description": "Beginning of the value, case-insensitive (e.g. 'harry pot'); empty for the most frequent values"
+                },
+                "field": {
+                    "type": "string",
+                    "enum": ["title", "author", "publisher"],
+                    "description": "Field to complete (default: title)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": f"Maximum number of suggestions (default: 10, at most {_SUGGEST_MAX})"
+                },
+            },
+            "required": ["prefix"],
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _books_suggest(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Complete a title, author or publisher prefix from the dataset.
+
+    Answered by binary search in a sorted index of normalized values, so a
+    call takes microseconds once the index is built. The first call for a
+    field builds it (and may load the dataset) on the offload pool.
+    Suggested values can be passed to books_query as they are: author
+    matches exactly, title by substring.
+    """
+    username = session["username"]
+    prefix = arguments["prefix"]
+    field = arguments.get("field", "title")
+    limit = max(0, min(int(arguments.get("limit", 10)), _SUGGEST_MAX))
+
+    repo = _books()
+    if repo.has_prefix_index(field):
+        index = repo.prefix_index(field)
+    else:
+        with span("books.prefix_index", field=field):
+            index = await run_blocking(_OFFLOAD, repo.prefix_index, field)
+    with span("suggest"):
+        completions = index.complete(prefix, limit)
+
+    result = {
+        "authenticated_user": username,
+        "field": field,
+        "prefix": prefix,
+        "suggestions": [{"value": value, "count": count} for value, count in completions],
+        "count": len(completions)
+    }
+    return response(result)
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="books_similar",
+        description="Find the books most similar to a given book ('more like this'), by cosine similarity of title, author, category and description. One call replaces chaining books_query on a book's genre and author. Requires active session for access.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "id": {
+                    "type": "string",
+                    "description": "ID of the book to find similar books for"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": f"Maximum number of similar books (default: 10, at most {_SIMILAR_MAX})"
+                },
+            },
+            "required": ["id"],
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _books_similar(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Return the books most similar to one book, best first.
+
+    Every book has a precomputed hashed TF-IDF vector (books_vectors), stored
+    in the dataset snapshot. A call scores all books with one sparse
+    matrix-vector product and keeps the top ``limit`` with a partial sort;
+    each returned book carries its cosine ``similarity`` (0 to 1).
+    """
+    username = session["username"]
+    book_id = arguments["id"]
+    limit = max(0, min(int(arguments.get("limit", 10)), _SIMILAR_MAX))
+
+    def find() -> Optional[Tuple[Dict[str, str], List[Dict[str, Any]]]]:
+        repo = _books()
+        with span("books.lookup"):
+            index = repo.index_of_id(str(book_id))
+        if index is None:
+            return None
+        with span("books.vectors"):
+            vectors = _book_vectors()
+        with span("books.similar"):
+            matches = vectors.similar(index, limit)
+        with span("books.rows", rows=len(matches)):
+            rows = repo.rows([index] + [j for j, _ in matches])
+        return rows[0], [dict(row, similarity=score) for row, (_, score) in zip(rows[1:], matches)]
+
+    # Off the event loop: scoring touches every book, and the first call
+    # loads the vectors
+    found = await _run_limited("books_similar", lambda: run_blocking(_OFFLOAD, find))
+    if found is None:
+        error_result = {
+            "error": "not_found",
+            "message": f"Book with ID '{book_id}' not found",
+            "authenticated_user": username
+        }
+        return response(error_result)
+
+    source, similar = found
+    # Every book is scored
+    _METRICS.record_rows("books_similar", scanned=len(_books()), returned=len(similar))
+    result = {
+        "authenticated_user": username,
+        "id": book_id,
+        "source": source,
+        "data": similar,
+        "count": len(similar),
+        "query_type": "similar_books"
+    }
+    return response(result)
+
+
+# ===============================================================================
+# CURRENCY EXCHANGE OPERATIONS
+# ===============================================================================
+
+@_TOOLS.register(
+    ToolDef(
+        name="exchange_convert",
+        description="Convert monetary amounts between different currencies using current exchange rates. Supports major world currencies with real-time conversion calculations. Requires active session for access.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "from_currency": {
+                    "type": "string", 
+                    "description": "Source currency code (e.g., 'USD', 'EUR', 'GBP')"
+                },
+                "to_currency": {
+                    "type": "string", 
+                    "description": "Target currency code for conversion"
+                },
+                "amount": {
+                    "type": "number", 
+                    "description": "Amount to convert (supports decimals)"
+                },
+                "as_of": {
+                    "type": ["string", "number"],
+                    "description": "Convert at historical rates in effect at this ISO-8601 date/datetime or Unix timestamp"
+                },
+            },
+            "required": ["from_currency", "to_currency", "amount"],
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _exchange_convert(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Convert monetary amounts between different currencies.
+
+    This tool provides real-time currency conversion using:
+    - Synthetic exchange rates for demonstration
+    - Support for major world currencies
+    - Decimal precision for accurate calculations
+    - Error handling for invalid currency codes
+
+    All conversions include authenticated_user context for audit trails.
+    """
+    username = session["username"]
+    # Extract required conversion parameters
+    from_currency = arguments["from_currency"]  # Source currency code
+    to_currency = arguments["to_currency"]      # Target currency code  
+    amount = arguments["amount"]                 # Amount to convert
+    as_of = arguments.get("as_of")               # Optional historical point in time
+
+    try:
+        if as_of is not None:
+            # Historical conversion: binary search in the rate time series
+            history = _rate_history()
+            if history is None:
+                raise ValueError("Historical rates are not configured (set RATES_HISTORY)")
+            from .rate_history import format_timestamp, parse_timestamp
+            as_of_ts = parse_timestamp(as_of)
+            # Off the event loop: the first call loads the whole history file
+            with span("convert", historical=True):
+                value = await run_blocking(_OFFLOAD, history.convert,
+                                           float(amount), from_currency, to_currency, as_of_ts)
             result = {
                 "authenticated_user": username,
-                "from": from_currency.upper(),    # Normalized source currency
-                "to": to_currency.upper(),        # Normalized target currency
-                "amount": float(amount),          # Original amount
-                "converted": value,               # Converted amount
-                "operation": "currency_conversion",
-                "timestamp": time.time()          # Conversion timestamp
+                "from": from_currency.upper(),
+                "to": to_currency.upper(),
+                "amount": float(amount),
+                "converted": value,
+                "operation": "historical_currency_conversion",
+                "as_of": format_timestamp(as_of_ts),  # Normalized UTC point in time
+                "timestamp": time.time()
             }
-            return [types.TextContent(type="text", text=str(result))]
-            
-        except Exception as e:
-            # Handle conversion errors (invalid currencies, rates, etc.)
+            return response(result)
+
+        # Take one snapshot so the whole call sees a consistent rate table
+        with span("rates"):
+            snapshot = await _rate_snapshot()
+
+        # Perform currency conversion using exchange rates
+        with span("convert"):
+            value = snapshot.rates.convert(float(amount), from_currency, to_currency)
+
+        # Return conversion result with detailed information
+        result = {
+            "authenticated_user": username,
+            "from": from_currency.upper(),    # Normalized source currency
+            "to": to_currency.upper(),        # Normalized target currency
+            "amount": float(amount),          # Original amount
+            "converted": value,               # Converted amount
+            "operation": "currency_conversion",
+            "rates_version": snapshot.version,    # Rate snapshot used
+            "rates_age": round(snapshot.age, 3),  # Seconds since it was fetched
+            "timestamp": time.time()          # Conversion timestamp
+        }
+        return response(result)
+
+    except Exception as e:
+        # Handle conversion errors (invalid currencies, rates, etc.)
+        error_result = {
+            "error": "conversion_failed", 
+            "message": str(e),
+            "authenticated_user": username,
+            "attempted_conversion": f"{amount} {from_currency} -> {to_currency}"
+        }
+        return response(error_result)
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="exchange_convert_batch",
+        description="Convert many monetary amounts in a single call. Currency codes may be given once for all amounts or as arrays with one code per amount. Failed items carry their own error while the rest still convert. Requires active session for access.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "amounts": {
+                    "type": "array",
+                    "items": {"type": "number"},
+                    "description": "Amounts to convert (supports decimals)"
+                },
+                "from_currency": {
+                    "oneOf": [
+                        {"type": "string"},
+                        {"type": "array", "items": {"type": "string"}},
+                    ],
+                    "description": "Source currency code, or one code per amount"
+                },
+                "to_currency": {
+                    "oneOf": [
+                        {"type": "string"},
+                        {"type": "array", "items": {"type": "string"}},
+                    ],
+                    "description": "Target currency code, or one code per amount"
+                },
+            },
+            "required": ["amounts", "from_currency", "to_currency"],
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _exchange_convert_batch(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Convert a basket of amounts in one vectorized operation.
+
+    Currency codes are resolved against the precomputed cross-rate matrix
+    and every amount is converted in a single NumPy pass. Items with an
+    unknown currency or a non-numeric amount get their own error entry
+    instead of failing the whole batch.
+    """
+    username = session["username"]
+    amounts = arguments["amounts"]
+    from_currency = arguments["from_currency"]
+    to_currency = arguments["to_currency"]
+
+    try:
+        with span("rates"):
+            snapshot = await _rate_snapshot()
+
+        async def convert() -> Any:
+            with span("convert", items=len(amounts)):
+                return await run_blocking(_OFFLOAD, snapshot.rates.convert_batch, amounts, from_currency, to_currency)
+
+        values, errors = await _run_limited("exchange_convert_batch", convert)
+    except Overloaded:
+        raise
+    except Exception as e:
+        # Shape problems (mismatched array lengths) fail the whole batch
+        error_result = {
+            "error": "conversion_failed",
+            "message": str(e),
+            "authenticated_user": username
+        }
+        return response(error_result)
+
+    n = len(amounts)
+    from_codes = [from_currency.upper()] * n if isinstance(from_currency, str) else [str(c).upper() for c in from_currency]
+    to_codes = [to_currency.upper()] * n if isinstance(to_currency, str) else [str(c).upper() for c in to_currency]
+    converted = values.tolist()
+    items = []
+    for k in range(n):
+        item = {"amount": amounts[k], "from": from_codes[k], "to": to_codes[k]}
+        if errors[k] is None:
+            item["converted"] = converted[k]
+        else:
+            item["error"] = errors[k]
+        items.append(item)
+
+    result = {
+        "authenticated_user": username,
+        "results": items,
+        "count": n,
+        "failed": sum(1 for e in errors if e is not None),
+        "operation": "batch_currency_conversion",
+        "rates_version": snapshot.version,
+        "rates_age": round(snapshot.age, 3),
+        "timestamp": time.time()
+    }
+    return response(result)
+
+
+# ===============================================================================
+# SESSION MANAGEMENT TOOLS (PUBLIC ACCESS)
+# ===============================================================================
+
+@_TOOLS.register(
+    ToolDef(
+        name="authenticate",
+        description="Create a new user session and authenticate for protected operations. Generates JWT token and establishes session state for subsequent tool calls. Required before using books_query or exchange_convert.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "username": {
+                    "type": "string", 
+                    "description": "Username for authentication (any string allowed for demo; default: demo_user)"
+                },
+                "session_id": {
+                    "type": "string",
+                    "description": "Resume this existing session instead of creating a new one (must belong to username)"
+                },
+                "admin_token": {
+                    "type": "string",
+                    "description": "Server ADMIN_TOKEN secret, for an administrator session (admin tools)"
+                },
+            },
+            "additionalProperties": False,
+        },
+    ),
+    public=True,
+)
+async def _authenticate(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Create new user session and authenticate for protected operations.
+
+    Process:
+    1. Extract username from arguments (default to demo_user)
+    2. Generate unique user_id using hash of username
+    3. Create JWT token with user claims and 1-hour expiration
+    4. Store session in global _USER_SESSIONS dictionary
+    5. Set it as the current session of the calling connection
+    6. Return session details and authentication confirmation
+    """
+    username = arguments.get("username", "demo_user")
+    admin_token = arguments.get("admin_token")
+    if admin_token is not None and not _admin_token_valid(username, admin_token):
+        return _ADMIN_REJECTED()
+
+    # Resume an existing session (e.g. after reconnecting to another worker
+    # or a server restart with a shared session backend)
+    resume_id = arguments.get("session_id")
+    if resume_id:
+        session = await _session_get(resume_id)
+        if (session is None
+                or session["username"] != username
+                or time.time() - session["created_at"] > 3600
+                or validate_jwt_token(session["token"]) is None):
+            return _RESUME_REJECTED()
+        _set_current_session_id(resume_id)
+        result = {
+            "success": True,
+            "message": f"Resumed session for {username}",
+            "username": username,
+            "user_id": session["user_id"],
+            "session_id": resume_id,
+            "expires_in": max(0, int(3600 - (time.time() - session["created_at"]))),
+            "resumed": True
+        }
+        return response(result)
+
+    user_id = f"user_{hash(username) % 10000}"  # Generate deterministic user ID
+
+    # Create JWT token with user claims
+    token = create_jwt_token(user_id, username)
+
+    # Generate unique session ID and store session data
+    session_id = f"session_{secrets.token_hex(8)}"
+    new_session = {
+        "username": username,    # Human-readable username
+        "user_id": user_id,     # Unique user identifier
+        "token": token,         # JWT token for validation
+        "created_at": time.time()  # Session creation timestamp
+    }
+    if admin_token is not None:
+        new_session["admin"] = True  # Presented a valid ADMIN_TOKEN
+    await _session_io(_USER_SESSIONS.__setitem__, session_id, new_session)
+
+    # Set as current active session
+    _set_current_session_id(session_id)
+
+    # Return session details and success confirmation
+    result = {
+        "success": True,
+        "message": f"Successfully authenticated as {username}",
+        "username": username,
+        "user_id": user_id,
+        "session_id": session_id,
+        "expires_in": 3600  # 1 hour in seconds
+    }
+    return response(result)
+
+
+def _admin_token_valid(username: str, token: str) -> bool:
+    """True if ``username`` is an administrator and ``token`` is the server's ADMIN_TOKEN."""
+    if not _ADMIN_TOKEN or username not in _ADMIN_USERS:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), _ADMIN_TOKEN.encode("utf-8"))
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="logout",
+        description="End the current authentication session and clean up session data. Removes session from server storage and clears authentication state. Safe to call even when not authenticated.",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "additionalProperties": False,
+        },
+    ),
+    public=True,
+)
+async def _logout(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    End current authentication session and clean up session data.
+
+    Process:
+    1. Check if there's an active session
+    2. Remove session from global storage
+    3. Clear the connection's current session
+    4. Return logout confirmation with username
+    5. Handle case where no session exists gracefully
+    """
+    current_session = _current_session_id()
+    current = await _session_get(current_session)
+    if current is not None:
+        username = current["username"]
+        await _session_io(_USER_SESSIONS.pop, current_session)  # Remove from storage
+        _set_current_session_id(None)  # Clear current session
+        result = {
+            "success": True, 
+            "message": f"Successfully logged out {username}"
+        }
+    else:
+        result = {
+            "success": True, 
+            "message": "No active session to logout"
+        }
+    return response(result)
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="session_status",
+        description="Check current authentication status and session information. Returns authentication state, user details, session age, and time remaining before expiration. Useful for monitoring session health.",
+        inputSchema={
+            "type": "object", 
+            "properties": {},
+            "additionalProperties": False,
+        },
+    ),
+    public=True,
+)
+async def _session_status(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Check current authentication status and session information.
+
+    Process:
+    1. Check if the calling connection has a current session
+    2. Validate session exists in _USER_SESSIONS storage
+    3. Check if session has expired (1 hour limit)
+    4. Clean up expired sessions automatically
+    5. Return detailed session information or unauthenticated state
+    """
+    session = await _session_get(_current_session_id())
+    if session is not None:
+
+        # Calculate session timing information
+        session_age = int(time.time() - session["created_at"])
+        expires_in = max(0, 3600 - session_age)  # Time remaining until expiration
+
+        result = {
+            "authenticated": True,
+            "username": session["username"],
+            "user_id": session["user_id"], 
+            "session_age": session_age,      # How long session has been active
+            "expires_in": expires_in         # Seconds until session expires
+        }
+    else:
+        result = {
+            "authenticated": False,
+            "message": "No active session. Use 'authenticate' tool to login."
+        }
+    return response(result)
+
+
+# ===============================================================================
+# SERVER OPERATIONS
+# ===============================================================================
+
+@_TOOLS.register(
+    ToolDef(
+        name="server_metrics",
+        description="Report per-tool call counts by outcome, latency percentiles (p50/p90/p99/p99.9), response sizes, rows scanned vs. returned, and concurrency-limit and session gauges. Requires authentication.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "format": {
+                    "type": "string",
+                    "enum": ["json", "prometheus"],
+                    "description": "json (default) for a structured summary, prometheus for the text exposition format"
+                }
+            },
+            "additionalProperties": False,
+        },
+    ),
+)
+async def _server_metrics(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Report the server's call metrics.
+
+    Counts cover every call since the process started, including calls
+    rejected before authentication. Latency is measured around the whole
+    dispatch (validation, session check and handler), not including MCP
+    protocol framing.
+    """
+    username = session["username"]
+    result: Dict[str, Any] = {
+        "authenticated_user": username,
+        "uptime_seconds": int(time.time() - _STARTED_AT),
+    }
+    if arguments.get("format") == "prometheus":
+        result["format"] = "prometheus"
+        result["text"] = _METRICS.prometheus()
+    else:
+        result.update(_METRICS.snapshot())
+    return response(result)
+
+
+@_TOOLS.register(
+    ToolDef(
+        name="server_profile",
+        description="Admin only. Profile the running server: start a CPU (cProfile) and/or allocation (tracemalloc) profiling session that ends after a number of seconds or tool calls, stop it early, or check its status. Reports are written on the server as pstats and text files; the response lists their paths and a summary by component.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "enum": ["start", "stop", "status"],
+                    "description": "start a session, stop the running one, or report status (default)"
+                },
+                "cpu": {
+                    "type": "boolean",
+                    "description": "Profile CPU time with cProfile (default: true)"
+                },
+                "memory": {
+                    "type": "boolean",
+                    "description": "Track allocations with tracemalloc (default: false)"
+                },
+                "seconds": {
+                    "type": "number",
+                    "description": "End the session after this many seconds (default: 30, max: 600)"
+                },
+                "calls": {
+                    "type": "integer",
+                    "description": "End the session after this many tool calls (optional)"
+                }
+            },
+            "additionalProperties": False,
+        },
+    ),
+    admin=True,
+)
+async def _server_profile(arguments: Dict[str, Any], session: Optional[Dict[str, Any]]) -> ToolResponse:
+    """
+    Start, stop or inspect an on-demand profiling session.
+
+    A session profiles the event loop and offloaded work until its time or
+    call budget runs out (or it is stopped), then writes its reports to
+    PROFILE_DIR. Calls to this tool do not count against the call budget.
+    """
+    username = session["username"]
+    action = arguments.get("action", "status")
+    result: Dict[str, Any] = {"authenticated_user": username, "action": action}
+
+    if action == "start":
+        cpu = arguments.get("cpu", True)
+        memory = arguments.get("memory", False)
+        seconds = min(max(float(arguments.get("seconds", 30)), 0.1), 600.0)
+        calls = arguments.get("calls")
+        if not (cpu or memory):
             error_result = {
-                "error": "conversion_failed", 
+                "error": "invalid_request",
+                "message": "Enable cpu and/or memory profiling",
+                "tool": "server_profile"
+            }
+            return response(error_result)
+        loop = asyncio.get_running_loop()
+        try:
+            profile = _PROFILER.start(cpu=cpu, memory=memory, seconds=seconds,
+                                      calls=int(calls) if calls else None,
+                                      on_timeout=lambda stop: loop.call_later(seconds, stop))
+        except RuntimeError as e:
+            error_result = {
+                "error": "invalid_request",
                 "message": str(e),
-                "authenticated_user": username,
-                "attempted_conversion": f"{amount} {from_currency} -> {to_currency}"
+                "tool": "server_profile"
             }
-            return [types.TextContent(type="text", text=str(error_result))]
-    
-    # This should never be reached due to early validation above
-    # But kept as a safety net
-    raise ValueError(f"Unknown tool: {name}")
+            return response(error_result)
+        result.update({"status": "running", "profile_id": profile.id, "cpu": cpu, "memory": memory,
+                       "max_seconds": seconds, "max_calls": profile.max_calls,
+                       "directory": _PROFILER.directory})
+    elif action == "stop":
+        summary = _PROFILER.stop()
+        result["status"] = "stopped" if summary is not None else "idle"
+        if summary is not None:
+            result["profile"] = summary
+    else:
+        running = _PROFILER.session
+        if running is not None:
+            result.update({"status": "running", "profile_id": running.id,
+                           "elapsed": round(running.elapsed, 3), "calls": running.calls})
+        else:
+            result["status"] = "idle"
+        if _PROFILER.last is not None:
+            result["last_profile"] = _PROFILER.last
+    return response(result)
 
 
 # ===============================================================================
 # MCP SERVER MAIN FUNCTION
 # ===============================================================================
 
-async def main() -> None:
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """
-    Run the MCP server with stdio transport.
+    Parse command-line options; each flag falls back to an environment variable.
     
-    This function initializes and runs the Model Context Protocol server using
-    standard input/output for communication. This is the standard transport
-    method for MCP servers that integrates with AI assistants and tools.
+    --transport / MCP_TRANSPORT   stdio (default) or http
+    --host      / MCP_HOST        HTTP bind address (default 127.0.0.1)
+    --port      / MCP_PORT        HTTP port (default 8000)
+    --json-response               Answer HTTP POSTs with JSON instead of SSE streams
+    --stateless                   New MCP session per HTTP request
+    --workers   / MCP_WORKERS     Worker processes for books_query scans (default 0: in-process)
+    --metrics-port / MCP_METRICS_PORT  Serve Prometheus metrics on this local port (default 0: off)
+    """
+    parser = argparse.ArgumentParser(prog="python -m mcp_server.server", description="Books MCP server")
+    parser.add_argument("--transport", choices=("stdio", "http"),
+                        default=os.environ.get("MCP_TRANSPORT", "stdio"),
+                        help="transport to serve (env: MCP_TRANSPORT)")
+    parser.add_argument("--host", default=os.environ.get("MCP_HOST", "127.0.0.1"),
+                        help="HTTP bind address (env: MCP_HOST)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MCP_PORT", "8000")),
+                        help="HTTP port (env: MCP_PORT)")
+    parser.add_argument("--json-response", action="store_true",
+                        help="answer HTTP POSTs with JSON instead of SSE streams")
+    parser.add_argument("--stateless", action="store_true",
+                        help="create a new MCP session per HTTP request")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MCP_WORKERS", "0")),
+                        help="worker processes for books_query scans, 0 to scan in-process (env: MCP_WORKERS)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("MCP_METRICS_PORT", "0")),
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics, 0 to disable "
+                             "(env: MCP_METRICS_PORT; MCP_METRICS_HOST changes the bind address)")
+    return parser.parse_args(argv)
+
+
+def _start_books_workers(workers: int) -> None:
+    """
+    Serve books_query scans from ``workers`` processes sharing one dataset snapshot.
+    
+    The CSV is loaded once here and written as a memory-mapped snapshot
+    (rebuilt only when the CSV is newer; BOOKS_SNAPSHOT overrides its path).
+    This process then reads through the same snapshot instead of keeping
+    its own parsed copy, so the dataset sits in memory once for all of them.
+    """
+    global _BOOKS, _PRICE_COLUMNS, _BOOKS_WORKERS
+    from .books import ConvertedPriceCache
+    from .books_snapshot import BooksSnapshot, ensure_snapshot
+    from .workers import BooksWorkerPool
+    
+    path = ensure_snapshot(_books(), os.environ.get("BOOKS_SNAPSHOT") or None)
+    _BOOKS = BooksSnapshot(path)
+    _PRICE_COLUMNS = ConvertedPriceCache(_BOOKS)
+    pool = BooksWorkerPool(path, workers)
+    pool.start()
+    _BOOKS_WORKERS = pool
+    print(f"[books] {workers} query workers attached to {path}", file=sys.stderr)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Run the MCP server over stdio (default) or HTTP.
+    
+    This function initializes and runs the Model Context Protocol server.
+    With stdio, every client spawns its own server process. With
+    ``--transport http`` one long-lived process serves all clients over
+    Streamable HTTP (``/mcp``) and HTTP+SSE (``/sse``), sharing a single warm
+    copy of the books dataset and exchange rates.
     
     The server will:
-    1. Set up stdio streams for communication
-    2. Initialize the MCP server with standard options
+    1. Start session reaping; over HTTP also load the exchange rates and
+       books dataset and keep the rates fresh in the background
+    2. Set up the selected transport
     3. Run the server event loop to handle incoming requests
     4. Process tool calls and return responses
     
     Transport Method:
-    - Uses stdio (standard input/output) for communication
-    - Compatible with AI assistants and MCP clients
+    - stdio: standard input/output, compatible with every MCP client
+    - http: Streamable HTTP and SSE on one port, with HTTP keep-alive and
+      per-client MCP sessions
     - Handles JSON-RPC protocol automatically
     - Manages connection lifecycle and error handling
     
     Usage:
     - Run directly: python -m mcp_server.server
+    - Shared HTTP server: python -m mcp_server.server --transport http --port 8000
+    - Parallel scans: python -m mcp_server.server --transport http --workers 4
     - Or via MCP client configuration in AI assistant settings
     """
+    args = _parse_args(argv)
+    create_server()
+    
+    # Periodically evict expired sessions so idle ones don't accumulate
+    _USER_SESSIONS.start(interval=float(os.environ.get("SESSION_REAP_INTERVAL", "60")))
+    
+    if args.workers > 0:
+        try:
+            _start_books_workers(args.workers)
+        except FileNotFoundError as e:
+            print(f"[books] {e}; scanning in-process", file=sys.stderr)
+    
+    metrics_http = None
+    if args.metrics_port > 0:
+        metrics_host = os.environ.get("MCP_METRICS_HOST", "127.0.0.1")
+        metrics_http = serve_metrics(_METRICS, metrics_host, args.metrics_port)
+        print(f"[metrics] serving http://{metrics_host}:{args.metrics_port}/metrics", file=sys.stderr)
+    
+    try:
+        await _serve(args)
+    finally:
+        if metrics_http is not None:
+            metrics_http.shutdown()
+        _TRACER.close()
+        _PROFILER.stop()
+        if _BOOKS_WORKERS is not None:
+            _BOOKS_WORKERS.close()
+        _OFFLOAD.shutdown(wait=False, cancel_futures=True)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    """Run the selected transport until it exits."""
+    if args.transport == "http":
+        from .http_transport import serve_http
+        
+        # Load rates and the dataset once up front; every HTTP client shares
+        # them, and the rates are refreshed in the background
+        _rates().start()
+        try:
+            _books().ensure_loaded()
+        except FileNotFoundError as e:
+            print(f"[books] {e}", file=sys.stderr)
+        
+        await serve_http(create_server(), host=args.host, port=args.port,
+                         json_response=args.json_response, stateless=args.stateless)
+        return
+    
+    # A stdio process serves one client session and must answer initialize
+    # and tools/list quickly: rates and the dataset load on first use, off
+    # the event loop, and a stale rate table is refreshed in the background
+    # by the call that finds it stale
+    from mcp.server.stdio import stdio_server
+    
+    mcp_server = create_server()
     async with stdio_server() as (read_stream, write_stream):
-        await server.run(
+        await mcp_server.run(
             read_stream,             # Input stream for receiving requests
             write_stream,            # Output stream for sending responses
-            server.create_initialization_options()  # Standard MCP initialization
+            mcp_server.create_initialization_options()  # Standard MCP initialization
         )
 
 
@@ -797,8 +1930,9 @@ if __name__ == "__main__":
     - python mcp_server/server.py
     - python -m mcp_server.server
     
-    The server will start and listen for MCP protocol messages on stdio,
-    enabling integration with AI assistants and other MCP clients.
+    The server will start and listen for MCP protocol messages on stdio
+    (or HTTP with --transport http), enabling integration with AI
+    assistants and other MCP clients.
     """
     asyncio.run(main())
 
@@ -0,0 +1,341 @@
+import json
+import math
+import queue
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+
+Session = Dict[str, Any]
+
+
+class SessionBackend:
+    """
+    Storage for sessions shared between server processes.
+
+    Sessions are JSON-serializable dicts. Every write carries the absolute
+    ``expires_at`` time so backends can expire entries on their own. Batch
+    methods exist so callers can amortize round trips.
+    """
+
+    def get_many(self, session_ids: Sequence[str]) -> Dict[str, Session]:
+        raise NotImplementedError
+
+    def set_many(self, items: Sequence[Tuple[str, Session, float]]) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, session_ids: Sequence[str]) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def evict_expired(self, now: float) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    def get(self, session_id: str) -> Optional[Session]:
+        return self.get_many([session_id]).get(session_id)
+
+    def set(self, session_id: str, session: Session, expires_at: float) -> None:
+        self.set_many([(session_id, session, expires_at)])
+
+    def delete(self, session_id: str) -> bool:
+        return self.delete_many([session_id]) > 0
+
+
+class _Pool:
+    """Small blocking pool of reusable connections."""
+
+    def __init__(self, factory, max_size: int, timeout: float = 10.0) -> None:
+        self._factory = factory
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._timeout = timeout
+
+    def acquire(self) -> Any:
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError("Timed out waiting for a pooled connection")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._factory()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def run(self, fn):
+        conn = self.acquire()
+        try:
+            result = fn(conn)
+        except BaseException:
+            # A command failed part way: unread replies or an open transaction
+            # may be left on the connection, so it is not reused
+            self.release(conn, broken=True)
+            raise
+        self.release(conn)
+        return result
+
+
+# ===============================================================================
+# SQLITE BACKEND
+# ===============================================================================
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    Sessions in a SQLite file, shared by every process that opens it.
+
+    Uses WAL journaling so readers in other workers are not blocked by a
+    writer. Doubles as the local stand-in for a networked backend in tests.
+    """
+
+    _CHUNK = 500  # stay well below SQLite's host-parameter limit
+
+    def __init__(self, path: str, pool_size: int = 4) -> None:
+        self.path = path
+        self._pool = _Pool(self._connect, pool_size)
+        self._pool.run(self._create_schema)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def get_many(self, session_ids: Sequence[str]) -> Dict[str, Session]:
+        def fetch(conn: sqlite3.Connection) -> Dict[str, Session]:
+            found: Dict[str, Session] = {}
+            for chunk in _chunks(session_ids, self._CHUNK):
+                marks = ",".join("?" * len(chunk))
+                for sid, data in conn.execute(f"SELECT id, data FROM sessions WHERE id IN ({marks})", chunk):
+                    found[sid] = json.loads(data)
+            return found
+        return self._pool.run(fetch) if session_ids else {}
+
+    def set_many(self, items: Sequence[Tuple[str, Session, float]]) -> None:
+        rows = [(sid, json.dumps(session), expires_at) for sid, session, expires_at in items]
+
+        def write(conn: sqlite3.Connection) -> None:
+            with _transaction(conn):
+                conn.executemany("INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)", rows)
+        if rows:
+            self._pool.run(write)
+
+    def delete_many(self, session_ids: Sequence[str]) -> int:
+        def delete(conn: sqlite3.Connection) -> int:
+            removed = 0
+            with _transaction(conn):
+                for chunk in _chunks(session_ids, self._CHUNK):
+                    marks = ",".join("?" * len(chunk))
+                    removed += conn.execute(f"DELETE FROM sessions WHERE id IN ({marks})", chunk).rowcount
+            return removed
+        return self._pool.run(delete) if session_ids else 0
+
+    def count(self) -> int:
+        return self._pool.run(lambda conn: conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0])
+
+    def clear(self) -> None:
+        self._pool.run(lambda conn: conn.execute("DELETE FROM sessions"))
+
+    def evict_expired(self, now: float) -> int:
+        return self._pool.run(lambda conn: conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount)
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+class _transaction:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+# ===============================================================================
+# REDIS-PROTOCOL BACKEND
+# ===============================================================================
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    """Minimal RESP2 client connection supporting pipelined commands."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None,
+                 timeout: float = 5.0, tls: bool = False) -> None:
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if tls:
+            # Verifies the server certificate and host name against the system CAs
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self._sock = sock
+        self._reader = self._sock.makefile("rb")
+        setup: List[Tuple[Any, ...]] = []
+        if password:
+            setup.append(("AUTH", password))
+        if db:
+            setup.append(("SELECT", db))
+        if setup:
+            self.pipeline(setup)
+
+    def pipeline(self, commands: Sequence[Tuple[Any, ...]]) -> List[Any]:
+        """Send every command in one write, then read all replies in order."""
+        self._sock.sendall(b"".join(_encode_command(c) for c in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *command: Any) -> Any:
+        return self.pipeline([command])[0]
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+        finally:
+            self._sock.close()
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._reader.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read_reply() for _ in range(n)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+
+def _encode_command(command: Tuple[Any, ...]) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Sessions stored as JSON strings in any server speaking the Redis protocol.
+
+    Keys expire on the server via ``SET ... EX``, so no reaper is needed.
+    Batch operations are pipelined over pooled connections. With ``tls``
+    (a ``rediss://`` URL) connections are encrypted with TLS.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, prefix: str = "mcp:session:",
+                 pool_size: int = 8, timeout: float = 5.0, tls: bool = False) -> None:
+        self.prefix = prefix
+        self._pool = _Pool(lambda: _RespConnection(host, port, db, password, timeout, tls), pool_size)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisSessionBackend":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        password = unquote(parsed.password) if parsed.password else None
+        return cls(host=parsed.hostname or "127.0.0.1", port=parsed.port or 6379, db=db,
+                   password=password, tls=parsed.scheme == "rediss", **kwargs)
+
+    def get_many(self, session_ids: Sequence[str]) -> Dict[str, Session]:
+        if not session_ids:
+            return {}
+        keys = [self.prefix + sid for sid in session_ids]
+        values = self._pool.run(lambda conn: conn.execute("MGET", *keys))
+        return {sid: json.loads(v) for sid, v in zip(session_ids, values) if v is not None}
+
+    def set_many(self, items: Sequence[Tuple[str, Session, float]]) -> None:
+        now = time.time()
+        commands = [
+            ("SET", self.prefix + sid, json.dumps(session), "EX", max(1, math.ceil(expires_at - now)))
+            for sid, session, expires_at in items
+        ]
+        if commands:
+            self._pool.run(lambda conn: conn.pipeline(commands))
+
+    def delete_many(self, session_ids: Sequence[str]) -> int:
+        if not session_ids:
+            return 0
+        keys = [self.prefix + sid for sid in session_ids]
+        return self._pool.run(lambda conn: conn.execute("DEL", *keys))
+
+    def count(self) -> int:
+        return sum(len(batch) for batch in self._scan())
+
+    def clear(self) -> None:
+        for batch in self._scan():
+            if batch:
+                self._pool.run(lambda conn, keys=batch: conn.execute("DEL", *keys))
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def _scan(self) -> Iterable[List[bytes]]:
+        cursor = b"0"
+        while True:
+            cursor, keys = self._pool.run(
+                lambda conn, c=cursor: conn.execute("SCAN", c, "MATCH", self.prefix + "*", "COUNT", 1000)
+            )
+            yield keys
+            if cursor in (b"0", 0, "0"):
+                return
+
+
+def _chunks(items: Sequence[str], size: int) -> Iterable[List[str]]:
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,319 @@
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .session_backends import SessionBackend
+
+
+Session = Dict[str, Any]
+
+
+class _Reaper:
+    """Runs ``evict_expired`` periodically from a daemon thread."""
+
+    _stop: threading.Event
+    _thread: Optional[threading.Thread]
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    def start(self, interval: float = 60.0) -> None:
+        """Evict expired sessions every ``interval`` seconds from a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="session-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.evict_expired()
+            except Exception as e:  # keep reaping on unexpected errors
+                print(f"[sessions] eviction failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+class SessionStore(_Reaper):
+    """
+    In-memory session table with expiry ordering and a size cap.
+
+    Sessions live in an ``OrderedDict`` kept in least-recently-used order,
+    next to a min-heap of ``(expires_at, session_id)``. ``evict_expired``
+    pops the heap until it reaches a live session, so each expired session
+    costs O(log n) to remove. Heap entries for sessions that were deleted
+    early are skipped lazily and the heap is rebuilt once they outnumber the
+    live ones, which keeps memory proportional to the number of sessions.
+
+    When ``max_sessions`` is reached, inserting a new session evicts the
+    least recently used one. The store supports the dict operations the
+    server uses (``[]``, ``in``, ``del``, ``len``, ``get``, ``clear``).
+    """
+
+    # Operations never wait on I/O, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, ttl: float = 3600.0, max_sessions: Optional[int] = None) -> None:
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.evicted_expired = 0
+        self.evicted_lru = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def expires_at(self, session: Session) -> float:
+        return float(session["created_at"]) + self.ttl
+
+    def __setitem__(self, session_id: str, session: Session) -> None:
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            heapq.heappush(self._heap, (self.expires_at(session), session_id))
+            if self.max_sessions is not None:
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted_lru += 1
+            self._maybe_compact()
+
+    def set_many(self, items: Sequence[Tuple[str, Session]]) -> None:
+        for sid, session in items:
+            self[sid] = session
+
+    def cached(self, session_id: str) -> Optional[Session]:
+        """The session, if it can be returned without I/O (always, in memory)."""
+        return self.get(session_id)
+
+    def get_many(self, session_ids: Sequence[str]) -> Dict[str, Session]:
+        found = {sid: self.get(sid) for sid in session_ids}
+        return {sid: s for sid, s in found.items() if s is not None}
+
+    def __getitem__(self, session_id: str) -> Session:
+        with self._lock:
+            session = self._sessions[session_id]
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get(self, session_id: Optional[str], default: Optional[Session] = None) -> Optional[Session]:
+        if session_id is None:
+            return default
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._sessions
+
+    def __delitem__(self, session_id: str) -> None:
+        with self._lock:
+            del self._sessions[session_id]
+            self._maybe_compact()
+
+    def pop(self, session_id: str, default: Optional[Session] = None) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.pop(session_id, default)
+            self._maybe_compact()
+            return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._heap = []
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """Remove every session whose expiry time has passed; returns the count."""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < now:
+                expires, session_id = heapq.heappop(heap)
+                session = self._sessions.get(session_id)
+                # Skip entries left behind by deleted or replaced sessions
+                if session is not None and self.expires_at(session) == expires:
+                    del self._sessions[session_id]
+                    removed += 1
+            self.evicted_expired += removed
+        return removed
+
+    def _maybe_compact(self) -> None:
+        if len(self._heap) > 2 * len(self._sessions) + 64:
+            self._heap = [(self.expires_at(s), sid) for sid, s in self._sessions.items()]
+            heapq.heapify(self._heap)
+
+
+class SharedSessionStore(_Reaper):
+    """
+    Session store backed by a ``SessionBackend`` shared between workers.
+
+    Exposes the same operations as ``SessionStore``. Reads go through a small
+    in-process cache: a session fetched from the backend is reused for
+    ``cache_ttl`` seconds, so the per-call ``in``/``[]`` checks on the hot path
+    rarely leave the process. Writes and deletes go to the backend first and
+    then update the cache. A deletion made by another worker becomes visible
+    here within ``cache_ttl`` seconds.
+
+    Operations other than ``cached`` may wait on the backend's network or
+    disk I/O (``blocking``), so async callers run them off the event loop.
+    """
+
+    blocking = True
+
+    def __init__(self,
+                 backend: "SessionBackend",
+                 ttl: float = 3600.0,
+                 cache_ttl: float = 2.0,
+                 cache_size: int = 10000) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache: "OrderedDict[str, Tuple[float, Session]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def expires_at(self, session: Session) -> float:
+        return float(session["created_at"]) + self.ttl
+
+    def __setitem__(self, session_id: str, session: Session) -> None:
+        self.set_many([(session_id, session)])
+
+    def set_many(self, items: Sequence[Tuple[str, Session]]) -> None:
+        """Write several sessions in one pipelined backend round trip."""
+        self.backend.set_many([(sid, s, self.expires_at(s)) for sid, s in items])
+        for sid, s in items:
+            self._cache_put(sid, s)
+
+    def __getitem__(self, session_id: str) -> Session:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def get(self, session_id: Optional[str], default: Optional[Session] = None) -> Optional[Session]:
+        if session_id is None:
+            return default
+        cached = self._cache_get(session_id)
+        if cached is not None:
+            return cached
+        session = self.backend.get(session_id)
+        if session is None:
+            return default
+        self._cache_put(session_id, session)
+        return session
+
+    def cached_count(self) -> int:
+        """Sessions in the local cache (live or not); unlike ``len`` this does no I/O."""
+        with self._lock:
+            return len(self._cache)
+
+    def cached(self, session_id: str) -> Optional[Session]:
+        """The session if the local cache holds it, else None (then ``get`` asks the backend)."""
+        return self._cache_get(session_id, count_miss=False)
+
+    def get_many(self, session_ids: Sequence[str]) -> Dict[str, Session]:
+        """Resolve several sessions, fetching all cache misses in one batch."""
+        found: Dict[str, Session] = {}
+        missing: List[str] = []
+        for sid in session_ids:
+            cached = self._cache_get(sid)
+            if cached is None:
+                missing.append(sid)
+            else:
+                found[sid] = cached
+        for sid, session in self.backend.get_many(missing).items():
+            self._cache_put(sid, session)
+            found[sid] = session
+        return found
+
+    def __contains__(self, session_id: object) -> bool:
+        return isinstance(session_id, str) and self.get(session_id) is not None
+
+    def __delitem__(self, session_id: str) -> None:
+        if self.pop(session_id) is None:
+            raise KeyError(session_id)
+
+    def pop(self, session_id: str, default: Optional[Session] = None) -> Optional[Session]:
+        session = self.get(session_id)
+        self.backend.delete(session_id)
+        with self._lock:
+            self._cache.pop(session_id, None)
+        return default if session is None else session
+
+    def __len__(self) -> int:
+        return self.backend.count()
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._lock:
+            self._cache.clear()
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            for sid in [sid for sid, (_, s) in self._cache.items() if self.expires_at(s) < now]:
+                del self._cache[sid]
+        return self.backend.evict_expired(now)
+
+    def _cache_get(self, session_id: str, count_miss: bool = True) -> Optional[Session]:
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and time.monotonic() - entry[0] < self.cache_ttl:
+                self._cache.move_to_end(session_id)
+                self.cache_hits += 1
+                return entry[1]
+            if count_miss:
+                self.cache_misses += 1
+            return None
+
+    def _cache_put(self, session_id: str, session: Session) -> None:
+        with self._lock:
+            self._cache[session_id] = (time.monotonic(), session)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def session_store_from_env(ttl: float = 3600.0) -> Any:
+    """
+    Build the session store selected by ``SESSION_BACKEND``.
+
+    ``redis://host:port/db`` uses ``RedisSessionBackend`` (``rediss://`` over
+    TLS), ``sqlite:///path`` (or a plain ``*.db``/``*.sqlite`` path) uses
+    ``SqliteSessionBackend``, and an unset variable or ``memory`` keeps
+    sessions in this process only.
+    """
+    backend = os.environ.get("SESSION_BACKEND", "").strip()
+    max_sessions = int(os.environ.get("MAX_SESSIONS", "100000"))
+    if not backend or backend == "memory":
+        return SessionStore(ttl=ttl, max_sessions=max_sessions)
+    cache_ttl = float(os.environ.get("SESSION_CACHE_TTL", "2"))
+    # Loaded only for shared backends: it imports socket, ssl and sqlite3
+    from .session_backends import RedisSessionBackend, SqliteSessionBackend
+    if backend.startswith(("redis://", "rediss://")):
+        return SharedSessionStore(RedisSessionBackend.from_url(backend), ttl=ttl, cache_ttl=cache_ttl)
+    if backend.startswith("sqlite://"):
+        backend = backend[len("sqlite://"):]
+    return SharedSessionStore(SqliteSessionBackend(backend), ttl=ttl, cache_ttl=cache_ttl)
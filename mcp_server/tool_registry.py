@@ -0,0 +1,214 @@
+"""
+Declarative tool registry.
+
+Each tool registers its ``types.Tool`` definition and its handler once, at
+import. Registration compiles the tool's ``inputSchema`` into a validator
+function, so each call costs a dict lookup plus a walk over the arguments.
+The schema is not interpreted again on every call. The tool list for
+``tools/list`` is built once and reused.
+
+The validator compiler supports the JSON Schema subset the tools use:
+``type`` (a name or a list of names), ``properties``, ``required``,
+``additionalProperties: false``, ``items``, ``enum`` and ``oneOf``. A
+schema using any other keyword is rejected at registration, so new tools
+cannot silently skip validation. As in JSON Schema, a whole-number float
+such as ``2.0`` is a valid integer; validation converts such values of
+top-level integer parameters to ``int``, so handlers can slice with them.
+
+Tools are declared as ``ToolDef`` tuples, which mirror ``types.Tool``. The
+MCP SDK is only imported when the tool list is first built, so importing
+the server module does not load the SDK.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import mcp.types as types
+
+
+# Returns an error message for invalid input, None when the value is valid
+Validator = Callable[[Any, str], Optional[str]]
+Handler = Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Awaitable[Any]]
+
+_ANNOTATIONS = {"description", "title", "default", "examples", "$schema"}
+_SUPPORTED = {"type", "properties", "required", "additionalProperties", "items", "enum", "oneOf"} | _ANNOTATIONS
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool))
+                         or (isinstance(v, float) and v.is_integer()),
+}
+
+
+class SchemaError(ValueError):
+    """A tool schema uses a keyword the validator compiler does not support."""
+
+
+class ToolDef(NamedTuple):
+    """Definition of a tool, turned into a ``types.Tool`` for tools/list."""
+    name: str
+    description: str
+    inputSchema: Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    # A ToolDef, or a types.Tool
+    tool: Any
+    handler: Handler
+    validate: Callable[[Dict[str, Any]], Optional[str]]
+    # Public tools run without an authenticated session
+    public: bool = False
+    # Admin tools also require the session's user to be an administrator
+    admin: bool = False
+
+
+class ToolRegistry:
+    """Tools by name, with their compiled validators and a cached tool list."""
+
+    def __init__(self) -> None:
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Optional[List["types.Tool"]] = None
+
+    def register(self, tool: Any, public: bool = False,
+                 admin: bool = False) -> Callable[[Handler], Handler]:
+        """
+        Decorator registering ``handler`` for ``tool`` (a ``ToolDef`` or ``types.Tool``).
+
+        The handler is called as ``handler(arguments, session)``, where
+        ``session`` is None for public tools.
+        """
+        if public and admin:
+            raise ValueError(f"Tool {tool.name} cannot be both public and admin-only")
+        if tool.name in self._specs:
+            raise ValueError(f"Tool already registered: {tool.name}")
+        validator = compile_schema(tool.inputSchema)
+        integers = [key for key, prop in tool.inputSchema.get("properties", {}).items()
+                    if prop.get("type") == "integer" or "integer" in (prop.get("type") or ())]
+
+        def validate(arguments: Dict[str, Any]) -> Optional[str]:
+            problem = validator(arguments, "")
+            if problem is None:
+                for key in integers:
+                    value = arguments.get(key)
+                    if isinstance(value, float):
+                        arguments[key] = int(value)
+            return problem
+
+        def decorator(handler: Handler) -> Handler:
+            self._specs[tool.name] = ToolSpec(tool=tool, handler=handler, validate=validate,
+                                              public=public, admin=admin)
+            self._tools = None
+            return handler
+        return decorator
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def tools(self) -> List["types.Tool"]:
+        """Tool definitions in registration order, built once."""
+        if self._tools is None:
+            import mcp.types as types
+            self._tools = [spec.tool if isinstance(spec.tool, types.Tool) else types.Tool(**spec.tool._asdict())
+                           for spec in self._specs.values()]
+        return self._tools
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """Compile ``schema`` into a validator called as ``validator(value, path)``."""
+    unknown = set(schema) - _SUPPORTED
+    if unknown:
+        raise SchemaError(f"Unsupported schema keywords: {sorted(unknown)}")
+    checks: List[Validator] = []
+
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [_TYPE_CHECKS[n] for n in names]
+        expected = " or ".join(names)
+
+        def check_type(value: Any, path: str) -> Optional[str]:
+            for ok in type_checks:
+                if ok(value):
+                    return None
+            return f"{_name(path)} must be {expected}"
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value: Any, path: str) -> Optional[str]:
+            return None if value in allowed else f"{_name(path)} must be one of {allowed}"
+        checks.append(check_enum)
+
+    if "oneOf" in schema:
+        options = [compile_schema(s) for s in schema["oneOf"]]
+
+        def check_one_of(value: Any, path: str) -> Optional[str]:
+            matches = sum(1 for option in options if option(value, path) is None)
+            return None if matches == 1 else f"{_name(path)} does not match exactly one allowed form"
+        checks.append(check_one_of)
+
+    if "items" in schema:
+        item_validator = compile_schema(schema["items"])
+
+        def check_items(value: Any, path: str) -> Optional[str]:
+            if not isinstance(value, list):
+                return None
+            for i, item in enumerate(value):
+                problem = item_validator(item, f"{path}[{i}]")
+                if problem is not None:
+                    return problem
+            return None
+        checks.append(check_items)
+
+    properties = {k: compile_schema(v) for k, v in schema.get("properties", {}).items()}
+    required = list(schema.get("required", []))
+    closed = schema.get("additionalProperties", True) is False
+    if properties or required or closed:
+        def check_object(value: Any, path: str) -> Optional[str]:
+            if not isinstance(value, dict):
+                return None
+            for key in required:
+                if key not in value:
+                    return f"Missing required parameter: {_join(path, key)}"
+            for key, item in value.items():
+                validator = properties.get(key)
+                if validator is not None:
+                    problem = validator(item, _join(path, key))
+                    if problem is not None:
+                        return problem
+                elif closed:
+                    return f"Unexpected parameter: {_join(path, key)}"
+            return None
+        checks.append(check_object)
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def validate(value: Any, path: str) -> Optional[str]:
+        for check in checks:
+            problem = check(value, path)
+            if problem is not None:
+                return problem
+        return None
+    return validate
+
+
+def _join(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+
+def _name(path: str) -> str:
+    return f"Parameter '{path}'" if path else "Arguments"
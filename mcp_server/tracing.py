@@ -0,0 +1,314 @@
+"""
+Stage-level tracing of tool calls.
+
+A sampled tool call gets a ``Trace``. Code on the call's path marks its
+stages with ``span(name)``: validation, session check, rate lookup, the
+books scan and its repository steps, and response encoding. Each finished
+span records its offset from the start of the call and its duration. When
+the call ends, the whole trace goes to the tracer's exporter as one record.
+
+The active trace lives in a context variable. It therefore follows the call
+into tasks it starts and into offloaded work (``run_blocking`` runs in a
+copy of the caller's context). Code running outside a traced call, such as
+a worker process, gets a shared no-op span, which costs one context-variable
+lookup.
+
+Configuration (``tracer_from_env``):
+
+- ``TRACE_SAMPLE_RATE``: fraction of calls traced, 0 (default) to 1
+- ``TRACE_FILE``: JSON-lines file for the default exporter (``traces.jsonl``)
+- ``TRACE_EXPORTER``: ``jsonl`` (default) or ``package.module:factory``, a
+  callable returning a ``TraceExporter``
+
+Summarize a trace file into its slowest stages and calls with::
+
+    python -m mcp_server.tracing traces.jsonl [--top 10] [--tool books_query]
+"""
+
+import argparse
+import contextvars
+import importlib
+import json
+import os
+import queue
+import random
+import secrets
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+_ACTIVE: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("mcp_trace", default=None)
+
+
+class Trace:
+    """Spans of one sampled tool call."""
+
+    __slots__ = ("trace_id", "tool", "arguments", "started_at", "spans", "_t0", "_token")
+
+    def __init__(self, tool: str, arguments: Dict[str, Any]) -> None:
+        self.trace_id = secrets.token_hex(8)
+        self.tool = tool
+        self.arguments = arguments
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._t0 = time.perf_counter()
+        self._token: Optional[contextvars.Token] = None
+
+    def record(self, outcome: str) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "tool": self.tool,
+            "start": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._t0) * 1e3, 3),
+            "outcome": outcome,
+            "arguments": self.arguments,
+            "spans": list(self.spans),
+        }
+
+
+class _Span:
+    __slots__ = ("_trace", "_name", "_attrs", "_start")
+
+    def __init__(self, trace: Trace, name: str, attrs: Dict[str, Any]) -> None:
+        self._trace = trace
+        self._name = name
+        self._attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self._attrs.update(attrs)
+
+    def __enter__(self) -> "_Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.perf_counter()
+        t0 = self._trace._t0
+        record = {"name": self._name,
+                  "start_ms": round((self._start - t0) * 1e3, 3),
+                  "duration_ms": round((end - self._start) * 1e3, 3)}
+        if self._attrs:
+            record.update(self._attrs)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self._trace.spans.append(record)  # list.append is atomic, spans may end on other threads
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """Context manager timing stage ``name`` of the active trace (a no-op outside one)."""
+    trace = _ACTIVE.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attrs)
+
+
+class TraceExporter:
+    """Destination for finished traces. Subclasses implement ``export``."""
+
+    def export(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesExporter(TraceExporter):
+    """
+    Appends each trace as one JSON line to ``path``.
+
+    Records are handed to a writer thread, so the event loop never waits
+    on the file system.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]) -> None:
+        self._queue.put(record)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _write_loop(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    return
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+
+class Tracer:
+    """
+    Decides which calls are traced and exports their traces.
+
+    ``redact`` names arguments left out of trace records (session ids and
+    admin tokens by default).
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter: Optional[TraceExporter] = None,
+                 redact: Iterable[str] = ("session_id", "admin_token")) -> None:
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+        self.exporter = exporter
+        self.redact = frozenset(redact)
+
+    def start(self, tool: str, arguments: Dict[str, Any]) -> Optional[Trace]:
+        """Begin tracing a call of ``tool``, or return None if it is not sampled."""
+        if self.sample_rate <= 0.0 or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return None
+        trace = Trace(tool, {k: v for k, v in arguments.items() if k not in self.redact})
+        trace._token = _ACTIVE.set(trace)
+        return trace
+
+    def finish(self, trace: Optional[Trace], outcome: str) -> None:
+        """End ``trace`` (from ``start``, in the same context) and export it."""
+        if trace is None:
+            return
+        if trace._token is not None:
+            _ACTIVE.reset(trace._token)
+        assert self.exporter is not None
+        self.exporter.export(trace.record(outcome))
+
+    def close(self) -> None:
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def tracer_from_env() -> Tracer:
+    """Build the tracer configured by ``TRACE_SAMPLE_RATE``, ``TRACE_EXPORTER`` and ``TRACE_FILE``."""
+    rate = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+    if rate <= 0:
+        return Tracer()
+    name = os.environ.get("TRACE_EXPORTER", "jsonl").strip()
+    if name == "jsonl":
+        exporter: TraceExporter = JsonLinesExporter(os.environ.get("TRACE_FILE", "traces.jsonl"))
+    else:
+        module, _, attr = name.partition(":")
+        exporter = getattr(importlib.import_module(module), attr)()
+    return Tracer(min(rate, 1.0), exporter)
+
+
+# ===============================================================================
+# TRACE FILE SUMMARY
+# ===============================================================================
+
+def load_traces(path: str) -> List[Dict[str, Any]]:
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                traces.append(json.loads(line))
+    return traces
+
+
+def summarize(traces: List[Dict[str, Any]], top: int = 10) -> Dict[str, Any]:
+    """
+    Per-stage time statistics and the slowest calls in ``traces``.
+
+    Stages are keyed by tool and span name and sorted by total time. Spans
+    nest (``scan`` contains the ``books.*`` steps), so stage totals can add
+    up to more than the call time.
+    """
+    stages: Dict[tuple, List[float]] = {}
+    for trace in traces:
+        for s in trace["spans"]:
+            stages.setdefault((trace["tool"], s["name"]), []).append(s["duration_ms"])
+        stages.setdefault((trace["tool"], "(call)"), []).append(trace["duration_ms"])
+
+    stage_rows = []
+    for (tool, name), durations in stages.items():
+        durations.sort()
+        n = len(durations)
+        stage_rows.append({
+            "tool": tool,
+            "stage": name,
+            "count": n,
+            "total_ms": round(sum(durations), 3),
+            "mean_ms": round(sum(durations) / n, 3),
+            "p50_ms": durations[(n - 1) // 2],
+            "p99_ms": durations[min(n - 1, int(n * 0.99))],
+            "max_ms": durations[-1],
+        })
+    stage_rows.sort(key=lambda r: r["total_ms"], reverse=True)
+
+    slowest = []
+    for trace in sorted(traces, key=lambda t: t["duration_ms"], reverse=True)[:top]:
+        spans = trace["spans"]
+        # Innermost stage that took the most time: skip enclosing spans
+        leaf = max((s for s in spans if not _encloses(s, spans)), key=lambda s: s["duration_ms"], default=None)
+        slowest.append({
+            "trace_id": trace["trace_id"],
+            "tool": trace["tool"],
+            "duration_ms": trace["duration_ms"],
+            "outcome": trace["outcome"],
+            "slowest_stage": leaf["name"] if leaf else None,
+            "slowest_stage_ms": leaf["duration_ms"] if leaf else None,
+            "arguments": trace.get("arguments", {}),
+        })
+    return {"traces": len(traces), "stages": stage_rows, "slowest": slowest}
+
+
+def _encloses(outer: Dict[str, Any], spans: List[Dict[str, Any]]) -> bool:
+    start, end = outer["start_ms"], outer["start_ms"] + outer["duration_ms"]
+    return any(s is not outer and start <= s["start_ms"] and s["start_ms"] + s["duration_ms"] <= end
+               for s in spans)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m mcp_server.tracing",
+                                     description="Summarize a JSON-lines trace file")
+    parser.add_argument("path", help="trace file written by the jsonl exporter")
+    parser.add_argument("--top", type=int, default=10, help="slowest calls and stages to list")
+    parser.add_argument("--tool", help="only calls of this tool")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.path)
+    if args.tool:
+        traces = [t for t in traces if t["tool"] == args.tool]
+    summary = summarize(traces, top=args.top)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    print(f"{summary['traces']} traced calls\n")
+    print(f"{'tool':<24} {'stage':<16} {'count':>7} {'total ms':>11} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+    for r in summary["stages"][:args.top]:
+        print(f"{r['tool']:<24} {r['stage']:<16} {r['count']:>7} {r['total_ms']:>11.1f} {r['mean_ms']:>9.3f} "
+              f"{r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['max_ms']:>9.3f}")
+    print("\nslowest calls")
+    for t in summary["slowest"]:
+        stage = f"{t['slowest_stage']} {t['slowest_stage_ms']:.3f} ms" if t["slowest_stage"] else "-"
+        print(f"{t['duration_ms']:>10.3f} ms  {t['tool']:<24} {t['outcome']:<24} {stage:<28} "
+              f"{json.dumps(t['arguments'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
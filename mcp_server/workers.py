@@ -0,0 +1,78 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .books import query_books
+from .books_snapshot import BooksSnapshot
+
+
+# Snapshot attached by each worker process at startup
+_SNAPSHOT: Optional[BooksSnapshot] = None
+# Converted price columns in the worker, keyed by rate
+_PRICE_COLUMNS: Dict[float, np.ndarray] = {}
+
+
+def _attach(path: str) -> None:
+    global _SNAPSHOT
+    _SNAPSHOT = BooksSnapshot(path)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_query(params: Dict[str, Any], rate: Optional[float]) -> Dict[str, Any]:
+    assert _SNAPSHOT is not None
+    prices = None
+    if rate is not None:
+        prices = _PRICE_COLUMNS.get(rate)
+        if prices is None:
+            if len(_PRICE_COLUMNS) >= 16:
+                _PRICE_COLUMNS.clear()
+            prices = _PRICE_COLUMNS[rate] = _SNAPSHOT.prices() * rate
+    return query_books(_SNAPSHOT, prices=prices, **params)
+
+
+class BooksWorkerPool:
+    """
+    Worker processes answering ``books_query`` scans from a shared snapshot.
+
+    Each worker maps the same read-only ``BooksSnapshot`` file, so the dataset
+    is held once in the page cache however many workers run, and scans run
+    in parallel instead of contending for the server process's GIL. The
+    server process keeps the MCP protocol and sessions and only ships query
+    parameters (and a conversion rate, when a currency is requested) to the
+    workers; answers come back as plain dicts.
+
+    Workers are started with the ``spawn`` method, since the server process
+    already runs threads (rate refresh, session reaping) by the time the
+    pool is created.
+    """
+
+    def __init__(self, snapshot_path: str, workers: Optional[int] = None) -> None:
+        self.snapshot_path = snapshot_path
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach,
+            initargs=(snapshot_path,),
+        )
+
+    def start(self) -> None:
+        """Start every worker now rather than on the first queries."""
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    async def query(self, params: Dict[str, Any], rate: Optional[float] = None) -> Dict[str, Any]:
+        """Run ``query_books(snapshot, **params)`` in a worker, pricing with ``rate`` if given."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _run_query, params, rate)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -13,6 +13,7 @@ Date: September 2025
 """
 
 import asyncio
+import json
 import pytest
 import sys
 import os
@@ -28,10 +29,14 @@ from mcp_server.server import (
     validate_jwt_token,
     handle_call_tool,
     _USER_SESSIONS,
-    _CURRENT_SESSION
+    _current_session_id
 )
-from mcp_server.books import BooksRepository
+from mcp_server.books import BooksRepository, ConvertedPriceCache
 from mcp_server.exchange import ExchangeRates, default_rates
+from mcp_server.rate_history import RateHistory, parse_timestamp
+from mcp_server.sessions import SessionStore, SharedSessionStore
+from mcp_server.session_backends import RedisSessionBackend, SqliteSessionBackend
+from mcp_server.rates import HttpRateProvider, JsonFileRateProvider, RateCache, RateProvider
 
 
 class TestJWTTokens:
@@ -91,6 +96,38 @@ class TestJWTTokens:
         # Now validate it with current time (should be expired)
         payload = validate_jwt_token(token)
         assert payload is None, "Expired token should return None"
+    
+    def test_tampered_signature_rejected(self):
+        """Test that a token with a modified signature is rejected."""
+        token = create_jwt_token("user789", "tamperuser")
+        header, payload, signature = token.split('.')
+        forged = f"{header}.{payload}.{signature[:-2]}AA"
+        assert validate_jwt_token(forged) is None, "Forged signature should be rejected"
+    
+    def test_verified_token_cache_respects_exp(self):
+        """Test that cached tokens still expire at their own exp time."""
+        from mcp_server.server import _VERIFIED_TOKENS
+        
+        _VERIFIED_TOKENS.clear()
+        token = create_jwt_token("user_cache", "cacheuser")
+        assert validate_jwt_token(token) is not None
+        assert len(_VERIFIED_TOKENS) == 1, "Verified token should be cached"
+        
+        with patch('time.time', return_value=time.time() + 7200):
+            assert validate_jwt_token(token) is None, "Cached token must not outlive exp"
+        assert len(_VERIFIED_TOKENS) == 0, "Expired entry should be evicted"
+    
+    def test_verified_token_cache_is_bounded(self):
+        """Test LRU eviction in the verified-token cache."""
+        from mcp_server.server import VerifiedTokenCache
+        
+        cache = VerifiedTokenCache(max_size=2)
+        exp = time.time() + 60
+        for name in ("a", "b", "c"):
+            cache.put(name, {"exp": exp})
+        assert len(cache) == 2, "Cache should not grow beyond max_size"
+        assert cache.get("a", time.time()) is None, "Least recently used entry should be evicted"
+        assert cache.get("c", time.time()) is not None
 
 
 class TestSessionAuthentication:
@@ -100,19 +137,19 @@ class TestSessionAuthentication:
         """Clear session state before each test."""
         import mcp_server.server
         _USER_SESSIONS.clear()
-        mcp_server.server._CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     def setup_method(self):
         """Clean up sessions before each test."""
-        global _USER_SESSIONS, _CURRENT_SESSION
+        import mcp_server.server
         _USER_SESSIONS.clear()
-        _CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     @pytest.mark.asyncio
     async def test_authenticate_user(self):
         """Test user authentication and session creation."""
         result = await handle_call_tool("authenticate", {"username": "testuser"})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert response["success"] is True, "Authentication should succeed"
         assert response["username"] == "testuser", "Response should contain username"
@@ -122,15 +159,13 @@ class TestSessionAuthentication:
         
         # Check that session was created
         assert len(_USER_SESSIONS) == 1, "Should have one active session"
-        # Import module to get current value of _CURRENT_SESSION
-        import mcp_server.server
-        assert mcp_server.server._CURRENT_SESSION is not None, "Should have current session set"
+        assert _current_session_id() is not None, "Should have current session set"
     
     @pytest.mark.asyncio
     async def test_session_status_unauthenticated(self):
         """Test session status when not authenticated."""
         result = await handle_call_tool("session_status", {})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert response["authenticated"] is False, "Should not be authenticated"
         assert "message" in response, "Should contain message about no session"
@@ -143,7 +178,7 @@ class TestSessionAuthentication:
         
         # Then check status
         result = await handle_call_tool("session_status", {})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert response["authenticated"] is True, "Should be authenticated"
         assert response["username"] == "statususer", "Should show correct username"
@@ -161,20 +196,20 @@ class TestSessionAuthentication:
         
         # Logout
         result = await handle_call_tool("logout", {})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert response["success"] is True, "Logout should succeed"
         assert "Successfully logged out" in response["message"], "Should confirm logout"
         
         # Verify session was cleaned up
         assert len(_USER_SESSIONS) == 0, "Should have no sessions after logout"
-        assert _CURRENT_SESSION is None, "Current session should be None"
+        assert _current_session_id() is None, "Current session should be None"
     
     @pytest.mark.asyncio
     async def test_logout_without_session(self):
         """Test logout when no session exists."""
         result = await handle_call_tool("logout", {})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert response["success"] is True, "Logout should still succeed"
         assert "No active session" in response["message"], "Should indicate no session"
@@ -187,13 +222,13 @@ class TestProtectedOperations:
         """Clean up sessions before each test."""
         import mcp_server.server
         _USER_SESSIONS.clear()
-        mcp_server.server._CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     @pytest.mark.asyncio
     async def test_books_query_without_auth(self):
         """Test books query without authentication should fail."""
         result = await handle_call_tool("books_query", {"title": "python"})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert "error" in response, "Should return error"
         assert response["error"] == "authentication_required", "Should require authentication"
@@ -207,7 +242,7 @@ class TestProtectedOperations:
             "to_currency": "EUR", 
             "amount": 100
         })
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert "error" in response, "Should return error"
         assert response["error"] == "authentication_required", "Should require authentication"
@@ -220,7 +255,7 @@ class TestProtectedOperations:
         
         # Then query books
         result = await handle_call_tool("books_query", {"limit": 5})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert "authenticated_user" in response, "Should show authenticated user"
         assert response["authenticated_user"] == "bookuser", "Should show correct user"
@@ -240,7 +275,7 @@ class TestProtectedOperations:
             "to_currency": "EUR",
             "amount": 100
         })
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert "authenticated_user" in response, "Should show authenticated user"
         assert response["authenticated_user"] == "currencyuser", "Should show correct user"
@@ -249,6 +284,120 @@ class TestProtectedOperations:
         assert response["amount"] == 100.0, "Should show original amount"
         assert "converted" in response, "Should show converted amount"
         assert isinstance(response["converted"], (int, float)), "Converted amount should be numeric"
+        assert response["rates_version"] >= 1, "Should expose the rate snapshot version"
+        assert response["rates_age"] >= 0, "Should expose the rate snapshot age"
+    
+    @pytest.mark.asyncio
+    async def test_books_query_with_currency(self):
+        """Test price conversion and price filters in the requested currency."""
+        import mcp_server.server
+        
+        csv_path = "/tmp/test_books_currency.csv"
+        with open(csv_path, "w") as f:
+            f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n"
+                    "Cheap Book,A,Fiction,P,10.00,2001\n"
+                    "Pricey Book,B,Fiction,P,100.00,2002\n")
+        repo = BooksRepository(csv_path)
+        try:
+            await handle_call_tool("authenticate", {"username": "priceuser"})
+            with patch.object(mcp_server.server, "_BOOKS", repo), \
+                    patch.object(mcp_server.server, "_PRICE_COLUMNS", ConvertedPriceCache(repo)):
+                result = await handle_call_tool("books_query", {"currency": "eur", "min_price": 50})
+                response = json.loads(result[0].text)
+                
+                assert [b["Title"] for b in response["data"]] == ["Pricey Book"], "Filter should apply in EUR"
+                assert response["data"][0]["Price (EUR)"] == 92.0, "Should show the converted price"
+                assert response["filters_applied"]["currency"] == "EUR"
+                
+                result = await handle_call_tool("books_query", {"id": "1", "currency": "JPY"})
+                response = json.loads(result[0].text)
+                assert response["data"]["Price (JPY)"] == 1470.0, "Single book should show converted price"
+        finally:
+            os.remove(csv_path)
+    
+    @pytest.mark.asyncio
+    async def test_books_query_table_format(self):
+        """Test the compact table format, with dictionary-encoded columns."""
+        import mcp_server.server
+        
+        csv_path = "/tmp/test_books_table.csv"
+        with open(csv_path, "w") as f:
+            f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n")
+            for i in range(6):
+                f.write(f"Book {i},Author {i},{'Fiction' if i % 2 else 'History'},Scribner,{10 + i}.00,2001\n")
+        repo = BooksRepository(csv_path)
+        try:
+            await handle_call_tool("authenticate", {"username": "tableuser"})
+            with patch.object(mcp_server.server, "_BOOKS", repo), \
+                    patch.object(mcp_server.server, "_PRICE_COLUMNS", ConvertedPriceCache(repo)):
+                records = json.loads((await handle_call_tool("books_query", {"currency": "EUR"}))[0].text)
+                table = json.loads((await handle_call_tool("books_query", {
+                    "currency": "EUR", "format": "table"
+                }))[0].text)
+                plain = json.loads((await handle_call_tool("books_query", {
+                    "format": "table", "dictionary": False, "limit": 2
+                }))[0].text)
+        finally:
+            os.remove(csv_path)
+        
+        assert table["format"] == "table" and "data" not in table
+        assert table["count"] == records["count"] == 6
+        assert table["columns"][-1] == "Price (EUR)", "Converted price should be the last column"
+        assert set(table["dictionaries"]) == {"Category", "Publisher", "Publish Date (Year)"}
+        assert table["dictionaries"]["Publisher"] == ["Scribner"]
+        
+        # Decoding the table gives back exactly the records response
+        decoded = []
+        for row in table["rows"]:
+            item = {}
+            for col, value in zip(table["columns"], row):
+                values = table["dictionaries"].get(col)
+                item[col] = values[value] if values is not None else value
+            decoded.append(item)
+        assert decoded == records["data"]
+        
+        assert "dictionaries" not in plain and plain["rows"][1][2] == "Fiction"
+    
+    @pytest.mark.asyncio
+    async def test_exchange_convert_as_of(self):
+        """Test historical conversion through the configured rate history."""
+        import mcp_server.server
+        import numpy as np
+        
+        await handle_call_tool("authenticate", {"username": "historyuser"})
+        history = RateHistory.from_arrays({
+            "EUR": (np.array([parse_timestamp("2020-01-01"), parse_timestamp("2021-01-01")]), np.array([0.8, 0.9]))
+        })
+        with patch.object(mcp_server.server, "_RATE_HISTORY", history):
+            result = await handle_call_tool("exchange_convert", {
+                "from_currency": "USD",
+                "to_currency": "EUR",
+                "amount": 100,
+                "as_of": "2020-06-30"
+            })
+        response = json.loads(result[0].text)
+        
+        assert response["converted"] == pytest.approx(80.0), "Should use the rate in effect at as_of"
+        assert response["as_of"].startswith("2020-06-30"), "Should echo the normalized as_of time"
+    
+    @pytest.mark.asyncio
+    async def test_exchange_convert_batch_with_auth(self):
+        """Test batch currency conversion with valid authentication."""
+        await handle_call_tool("authenticate", {"username": "batchuser"})
+        
+        result = await handle_call_tool("exchange_convert_batch", {
+            "amounts": [100, 20, 5],
+            "from_currency": "USD",
+            "to_currency": ["EUR", "JPY", "XYZ"]
+        })
+        response = json.loads(result[0].text)
+        
+        assert response["authenticated_user"] == "batchuser", "Should show correct user"
+        assert response["count"] == 3, "Should return one result per amount"
+        assert response["failed"] == 1, "Only the unknown currency should fail"
+        assert response["results"][0]["to"] == "EUR"
+        assert response["results"][1]["converted"] > 20, "USD to JPY should increase amount"
+        assert "error" in response["results"][2], "Unknown currency should carry an error"
 
 
 class TestSessionExpiration:
@@ -256,9 +405,9 @@ class TestSessionExpiration:
     
     def setup_method(self):
         """Clean up sessions before each test."""
-        global _USER_SESSIONS, _CURRENT_SESSION
+        import mcp_server.server
         _USER_SESSIONS.clear()
-        _CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     @pytest.mark.asyncio
     async def test_expired_session(self):
@@ -269,12 +418,306 @@ class TestSessionExpiration:
         
         # Try to use expired session (current time much later)
         result = await handle_call_tool("books_query", {"limit": 1})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         assert "error" in response, "Should return error for expired session"
         assert response["error"] == "session_expired", "Should indicate session expired"
         assert len(_USER_SESSIONS) == 0, "Expired session should be cleaned up"
-        assert _CURRENT_SESSION is None, "Current session should be None"
+        assert _current_session_id() is None, "Current session should be None"
+
+
+class TestTokenValidationOnProtectedCalls:
+    """Test that protected operations re-validate the session token."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_invalid_session_token(self):
+        """Test that a session whose token fails validation is rejected."""
+        await handle_call_tool("authenticate", {"username": "tokenuser"})
+        session = _USER_SESSIONS[_current_session_id()]
+        session["token"] = session["token"][:-4] + "AAAA"
+        
+        result = await handle_call_tool("exchange_convert", {
+            "from_currency": "USD", "to_currency": "EUR", "amount": 1
+        })
+        response = json.loads(result[0].text)
+        
+        assert response["error"] == "invalid_credentials", "Tampered token should be rejected"
+        assert len(_USER_SESSIONS) == 0, "Session with invalid token should be removed"
+
+
+class TestSessionStore:
+    """Test the expiry-ordered, size-capped session store."""
+    
+    def _session(self, created_at):
+        return {"username": "u", "user_id": "id", "token": "t", "created_at": created_at}
+    
+    def test_evict_expired(self):
+        """Test that only sessions past their expiry are evicted."""
+        store = SessionStore(ttl=100)
+        store["old"] = self._session(1000)
+        store["new"] = self._session(1050)
+        
+        assert store.evict_expired(now=1099) == 0, "Nothing has expired yet"
+        assert store.evict_expired(now=1120) == 1, "Only the older session has expired"
+        assert "old" not in store and "new" in store
+    
+    def test_lru_eviction_at_cap(self):
+        """Test that the least recently used session is evicted at the cap."""
+        store = SessionStore(ttl=100, max_sessions=2)
+        store["a"] = self._session(1000)
+        store["b"] = self._session(1000)
+        store["a"]  # touch "a" so "b" becomes least recently used
+        store["c"] = self._session(1000)
+        
+        assert len(store) == 2, "Store should not exceed max_sessions"
+        assert "b" not in store, "Least recently used session should be evicted"
+        assert "a" in store and "c" in store
+    
+    def test_deleted_sessions_do_not_grow_heap(self):
+        """Test that heap entries of deleted sessions are compacted away."""
+        store = SessionStore(ttl=100)
+        for i in range(1000):
+            store[f"s{i}"] = self._session(1000 + i)
+            del store[f"s{i}"]
+        assert len(store) == 0
+        assert len(store._heap) <= 64 + 1, "Stale heap entries should be compacted"
+        assert store.evict_expired(now=10**9) == 0, "Deleted sessions must not be counted"
+
+
+class _FakeRespServer:
+    """Tiny in-process server speaking enough of the Redis protocol for tests."""
+    
+    def __init__(self):
+        import socketserver
+        import threading
+        
+        data = self.data = {}
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    n = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(n + 2)[:-2])
+                return args
+            
+            def bulk(self, v):
+                return b"$-1\r\n" if v is None else b"$%d\r\n%s\r\n" % (len(v), v)
+            
+            def handle(self):
+                while True:
+                    args = self.read_command()
+                    if args is None:
+                        return
+                    cmd = args[0].upper()
+                    if cmd == b"SET":
+                        data[args[1]] = args[2]
+                        reply = b"+OK\r\n"
+                    elif cmd == b"MGET":
+                        reply = b"*%d\r\n" % (len(args) - 1) + b"".join(self.bulk(data.get(k)) for k in args[1:])
+                    elif cmd == b"DEL":
+                        reply = b":%d\r\n" % sum(data.pop(k, None) is not None for k in args[1:])
+                    elif cmd == b"SCAN":
+                        prefix = args[3].rstrip(b"*")
+                        keys = [k for k in data if k.startswith(prefix)]
+                        reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(self.bulk(k) for k in keys)
+                    else:
+                        reply = b"-ERR unknown command\r\n"
+                    self.wfile.write(reply)
+        
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestSharedSessionBackends:
+    """Test shared session backends and the read-through session store."""
+    
+    def setup_method(self):
+        """Use a fresh SQLite file per test."""
+        self.db_path = "/tmp/test_sessions.db"
+        self.teardown_method()
+    
+    def teardown_method(self):
+        """Clean up SQLite files."""
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+    
+    def _session(self, name, created_at=None):
+        return {"username": name, "user_id": f"id_{name}", "token": "t",
+                "created_at": time.time() if created_at is None else created_at}
+    
+    def test_sqlite_sessions_shared_between_workers(self):
+        """Test that two stores on one SQLite file see each other's sessions."""
+        worker_a = SharedSessionStore(SqliteSessionBackend(self.db_path), cache_ttl=0)
+        worker_b = SharedSessionStore(SqliteSessionBackend(self.db_path), cache_ttl=0)
+        
+        worker_a["s1"] = self._session("alice")
+        assert "s1" in worker_b, "Session written by one worker should be visible to another"
+        assert worker_b["s1"]["username"] == "alice"
+        
+        del worker_b["s1"]
+        assert "s1" not in worker_a, "Deletion should propagate through the backend"
+    
+    def test_read_through_cache_and_batches(self):
+        """Test pipelined batch writes and cached reads."""
+        store = SharedSessionStore(SqliteSessionBackend(self.db_path), cache_ttl=60)
+        store.set_many([(f"s{i}", self._session(f"user{i}")) for i in range(50)])
+        assert len(store) == 50
+        
+        misses = store.cache_misses
+        for _ in range(10):
+            assert store["s7"]["username"] == "user7"
+        assert store.cache_misses == misses, "Repeated reads should be served from the cache"
+        
+        fresh = SharedSessionStore(SqliteSessionBackend(self.db_path))
+        assert len(fresh.get_many([f"s{i}" for i in range(0, 50, 5)] + ["missing"])) == 10
+    
+    def test_sqlite_evicts_expired(self):
+        """Test that expired rows are removed by the reaper pass."""
+        store = SharedSessionStore(SqliteSessionBackend(self.db_path), ttl=100)
+        store["old"] = self._session("old", created_at=1000)
+        store["new"] = self._session("new")
+        assert store.evict_expired() == 1, "Only the expired session should be removed"
+        assert "old" not in store and "new" in store
+    
+    def test_redis_protocol_backend(self):
+        """Test the Redis-protocol backend against a local stand-in server."""
+        fake = _FakeRespServer()
+        try:
+            backend = RedisSessionBackend(port=fake.port, pool_size=2)
+            store = SharedSessionStore(backend, cache_ttl=0)
+            store.set_many([("r1", self._session("ann")), ("r2", self._session("bob"))])
+            
+            assert store["r2"]["username"] == "bob"
+            assert len(store) == 2
+            assert set(store.get_many(["r1", "r2", "r3"])) == {"r1", "r2"}
+            del store["r1"]
+            assert "r1" not in store
+            store.clear()
+            assert len(store) == 0
+            backend.close()
+        finally:
+            fake.close()
+    
+    def test_failed_command_discards_connection(self):
+        """Test that a connection is not reused after a command fails part way."""
+        from mcp_server.session_backends import RedisError
+        
+        fake = _FakeRespServer()
+        try:
+            backend = RedisSessionBackend(port=fake.port, pool_size=1)
+            assert backend.get_many(["missing"]) == {}
+            assert backend._pool._idle.qsize() == 1
+            with pytest.raises(RedisError):
+                backend._pool.run(lambda conn: conn.pipeline([("MGET", "a"), ("BOGUS",)]))
+            assert backend._pool._idle.qsize() == 0, "The failed connection should be closed"
+            assert backend.get_many(["missing"]) == {}, "A new connection should replace it"
+            backend.close()
+        finally:
+            fake.close()
+    
+    @pytest.mark.asyncio
+    async def test_backend_io_off_event_loop(self):
+        """Test that tool calls do shared-backend session I/O on the offload pool, not the event loop."""
+        import threading
+        import mcp_server.server
+        
+        threads = []
+        
+        class RecordingBackend(SqliteSessionBackend):
+            def get_many(self, session_ids):
+                threads.append(threading.current_thread())
+                return super().get_many(session_ids)
+            
+            def set_many(self, items):
+                threads.append(threading.current_thread())
+                super().set_many(items)
+            
+            def delete_many(self, session_ids):
+                threads.append(threading.current_thread())
+                return super().delete_many(session_ids)
+        
+        store = SharedSessionStore(RecordingBackend(self.db_path), cache_ttl=0)
+        mcp_server.server._CURRENT_SESSIONS.clear()
+        with patch.object(mcp_server.server, "_USER_SESSIONS", store):
+            await handle_call_tool("authenticate", {"username": "shared"})
+            status = json.loads((await handle_call_tool("session_status", {}))[0].text)
+            assert status["authenticated"] is True
+            result = await handle_call_tool("exchange_convert", {"amount": 1, "from_currency": "USD",
+                                                                 "to_currency": "USD"})
+            assert "error" not in json.loads(result[0].text)
+            await handle_call_tool("logout", {})
+        assert len(threads) >= 4
+        assert threading.current_thread() not in threads, "Backend I/O must not run on the event loop"
+    
+    def test_rediss_url_uses_tls(self):
+        """Test that rediss:// URLs wrap every connection in TLS, verifying the host name."""
+        fake = _FakeRespServer()
+        try:
+            context = Mock()
+            context.wrap_socket.side_effect = lambda sock, server_hostname: sock
+            with patch("mcp_server.session_backends.ssl.create_default_context", return_value=context):
+                backend = RedisSessionBackend.from_url(f"rediss://127.0.0.1:{fake.port}/0", pool_size=1)
+                assert backend.get_many(["missing"]) == {}
+                backend.close()
+            assert context.wrap_socket.call_args.kwargs["server_hostname"] == "127.0.0.1"
+            
+            with patch("mcp_server.session_backends.ssl.create_default_context") as plain:
+                backend = RedisSessionBackend.from_url(f"redis://127.0.0.1:{fake.port}/0", pool_size=1)
+                assert backend.get_many(["missing"]) == {}
+                backend.close()
+            plain.assert_not_called()
+        finally:
+            fake.close()
+
+
+class TestSessionResume:
+    """Test resuming a stored session from another connection."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_resume_session(self):
+        """Test that a new connection can resume an existing session by id."""
+        import mcp_server.server as srv
+        
+        auth = json.loads((await handle_call_tool("authenticate", {"username": "resumer"}))[0].text)
+        
+        async def other_connection(arguments):
+            srv._LOCAL_CONNECTION.set(srv._LocalConnection())
+            result = json.loads((await handle_call_tool("authenticate", arguments))[0].text)
+            status = json.loads((await handle_call_tool("session_status", {}))[0].text)
+            return result, status
+        
+        result, status = await asyncio.create_task(other_connection(
+            {"username": "resumer", "session_id": auth["session_id"]}))
+        assert result["resumed"] is True, "Existing session should be resumed"
+        assert status["username"] == "resumer", "Resumed session should become current"
+        
+        result, status = await asyncio.create_task(other_connection(
+            {"username": "intruder", "session_id": auth["session_id"]}))
+        assert result["error"] == "invalid_credentials", "Session owned by another user must not resume"
+        assert status["authenticated"] is False
 
 
 class TestBooksRepository:
@@ -337,6 +780,412 @@ Python Tricks,Dan Bader,Programming,Real Python,29.99,2017"""
         """Test getting a book with non-existent ID."""
         book = self.books_repo.get_by_id("nonexistent_id")
         assert book is None, "Should return None for non-existent ID"
+    
+    def test_books_filter_by_price_range(self):
+        """Test inclusive price-range filtering on the parsed price column."""
+        results = self.books_repo.filter(min_price=20, max_price=45.99)
+        titles = [r["Title"] for r in results]
+        assert titles == ["Clean Code", "Python Tricks"], "Should keep books priced within range"
+    
+    def test_converted_price_cache(self):
+        """Test converted price columns and their invalidation on new snapshots."""
+        from mcp_server.rates import RateSnapshot
+        
+        cache = ConvertedPriceCache(self.books_repo)
+        snap1 = RateSnapshot(rates=ExchangeRates(base="USD", rates={"EUR": 0.5}), version=1)
+        col = cache.column("eur", snap1)
+        assert col[1] == pytest.approx(12.99 * 0.5), "Column should be converted to EUR"
+        assert cache.column("EUR", snap1) is col, "Same snapshot should reuse the column"
+        
+        snap2 = RateSnapshot(rates=ExchangeRates(base="USD", rates={"EUR": 2.0}), version=2)
+        assert cache.column("EUR", snap2)[1] == pytest.approx(12.99 * 2.0), "New snapshot should recompute"
+        
+        eur = cache.column("EUR", snap2)
+        results = self.books_repo.filter(max_price=30, prices=eur)
+        assert [r["Title"] for r in results] == ["The Great Gatsby"], "Price filter should use the given column"
+
+
+class TestBooksSnapshot:
+    """Test the memory-mapped dataset snapshot and the worker pool reading it."""
+    
+    def setup_method(self):
+        """Write a small catalog and its snapshot."""
+        self.csv_path = "/tmp/test_books_snapshot.csv"
+        self.snapshot_path = "/tmp/test_books.snapshot"
+        with open(self.csv_path, "w") as f:
+            f.write("""Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)
+Clean Code,Robert Martin,Programming,Prentice Hall,45.99,2008
+The Great Gatsby,F. Scott Fitzgerald,Fiction,Scribner,12.99,1925
+Python Tricks,Dan Bader,Programming,Real Python,29.99,2017
+Clean Architecture,Robert Martin,Programming,Prentice Hall,,2017
+Café Stories,Zoë Müller,Fiction,Éditions,9.50,2017""")
+        from mcp_server.books_snapshot import BooksSnapshot, write_snapshot
+        
+        self.repo = BooksRepository(self.csv_path)
+        write_snapshot(self.repo, self.snapshot_path)
+        self.snapshot = BooksSnapshot(self.snapshot_path)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        self.snapshot.close()
+        for path in (self.csv_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def test_rows_round_trip(self):
+        """Test that the snapshot reproduces every row and price."""
+        assert self.snapshot.headers == self.repo.headers
+        assert self.snapshot.list_all() == self.repo.list_all(), "Rows should decode unchanged"
+        assert list(self.snapshot.prices()[:3]) == [45.99, 12.99, 29.99]
+        assert self.snapshot.prices()[3] != self.snapshot.prices()[3], "Missing price should stay NaN"
+    
+    def test_filters_match_repository(self):
+        """Test that every filter returns the same rows, in order, as the repository."""
+        queries = [
+            {},
+            {"genre": "programming"},
+            {"genre": ""},
+            {"title_contains": "CLEAN"},
+            {"title_contains": "é"},
+            {"author": " robert martin "},
+            {"author": "Robert"},
+            {"year": "2017"},
+            {"year": "2017", "genre": "fiction"},
+            {"min_price": 10, "max_price": 40},
+            {"min_price": 10, "title_contains": "clean"},
+            {"title_contains": "nothing like this"},
+        ]
+        for q in queries:
+            assert self.snapshot.filter_indices(**q) == self.repo.filter_indices(**q), f"Mismatch for {q}"
+    
+    def test_id_lookup(self):
+        """Test id lookups against the repository, including padded and missing ids."""
+        for book_id in ("1", "5", " 3 ", "6", "", "nonexistent_id"):
+            assert self.snapshot.index_of_id(book_id) == self.repo.index_of_id(book_id), book_id
+        assert self.snapshot.get_by_id("2")["Title"] == "The Great Gatsby"
+    
+    def test_query_books_on_snapshot(self):
+        """Test the shared books_query implementation against both stores."""
+        from mcp_server.books import query_books
+        
+        eur = self.repo.prices() * 0.5
+        args = {"year": "2017", "limit": 2, "offset": 1, "price_key": "Price (EUR)"}
+        expected = query_books(self.repo, prices=eur, **args)
+        assert query_books(self.snapshot, prices=self.snapshot.prices() * 0.5, **args) == expected
+        assert [r["Price (EUR)"] for r in expected["data"]] == [None, 4.75], "NaN prices should become None"
+    
+    def test_column_values_match_repository(self):
+        """Test the column-wise read used by the table format."""
+        indices = self.repo.filter_indices(year="2017")
+        assert self.snapshot.column_values(indices) == self.repo.column_values(indices)
+    
+    def test_worker_pool_query(self):
+        """Test that worker processes answer queries from the snapshot."""
+        from mcp_server.books import query_books
+        from mcp_server.workers import BooksWorkerPool
+        
+        pool = BooksWorkerPool(self.snapshot_path, workers=2)
+        try:
+            pool.start()
+            params = {"genre": "programming", "price_key": "Price (EUR)"}
+            
+            async def run():
+                return await asyncio.gather(pool.query(params, 0.5), pool.query({"book_id": "2"}))
+            
+            converted, by_id = asyncio.run(run())
+        finally:
+            pool.close()
+        assert converted == query_books(self.repo, prices=self.repo.prices() * 0.5, **params)
+        assert by_id["data"]["Title"] == "The Great Gatsby"
+
+
+class TestBooksIndex:
+    """Test the bitmap indexes and boolean filter expressions."""
+    
+    def setup_method(self):
+        """Write a catalog with composite categories."""
+        self.csv_path = "/tmp/test_books_index.csv"
+        self.snapshot_path = "/tmp/test_books_index.snapshot"
+        with open(self.csv_path, "w") as f:
+            f.write("""Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)
+Love Story,A,"Fiction , Romance",Penguin,10.00,1995
+Murder Inc,B,"Fiction , Mystery",Penguin Books,20.00,2001
+Cold Case,C,Mystery,Simon & Schuster,30.00,2002
+War Years,D,History,Scribner,40.00,1999
+Quiet Novel,E,Fiction,Scribner,,2001""")
+        self.repo = BooksRepository(self.csv_path)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        for path in (self.csv_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def titles(self, **filters):
+        return [r["Title"] for r in self.repo.filter(**filters)]
+    
+    def test_parse_filter(self):
+        """Test precedence, implied AND, normalization and syntax errors."""
+        from mcp_server.books_index import FilterError, parse_filter
+        
+        assert parse_filter("genre:Fiction OR category:mystery year:2001") == ("or", (
+            ("term", "category", "fiction"),
+            ("and", (("term", "category", "mystery"), ("term", "year", "2001"))),
+        )), "AND should bind tighter than OR"
+        assert parse_filter('NOT NOT publisher:"Simon & Schuster"') == ("term", "publisher", "simon & schuster")
+        assert parse_filter("NOT " * 2000 + "category:x") == ("term", "category", "x"), "Long NOT runs should not recurse"
+        assert parse_filter("NOT " * 2001 + "category:x") == ("not", ("term", "category", "x"))
+        assert parse_filter("year:1990..1999 publisher:pen*") == ("and", (
+            ("range", "year", 1990, 1999), ("prefix", "publisher", "pen"),
+        ))
+        for bad in ("", "  ", "category:", "author:x", "(year:2001", "year:2001 OR", "fiction",
+                    'publisher:"open', "year:2001 )", "year:2005..2001"):
+            with pytest.raises(FilterError):
+                parse_filter(bad)
+    
+    def test_boolean_filters(self):
+        """Test AND/OR/NOT over split categories, years and publishers."""
+        assert self.titles(where="category:fiction") == ["Love Story", "Murder Inc", "Quiet Novel"]
+        assert self.titles(where="category:fiction OR category:mystery") == [
+            "Love Story", "Murder Inc", "Cold Case", "Quiet Novel"]
+        assert self.titles(where="category:fiction AND NOT category:romance") == ["Murder Inc", "Quiet Novel"]
+        assert self.titles(where="NOT category:fiction") == ["Cold Case", "War Years"]
+        assert self.titles(where="category:roman") == [], "Terms should match whole values"
+        assert self.titles(where="category:myst* year:2000..2010") == ["Murder Inc", "Cold Case"]
+        assert self.titles(where='publisher:"simon & schuster" OR publisher:SCRIBNER') == [
+            "Cold Case", "War Years", "Quiet Novel"]
+        assert self.titles(where="publisher:penguin*", min_price=15) == ["Murder Inc"]
+        assert self.titles(where="NOT category:romance", title_contains="o") == ["Cold Case", "Quiet Novel"]
+    
+    def test_snapshot_filters_match_repository(self):
+        """Test that the snapshot's stored index answers like the repository's."""
+        from mcp_server.books_snapshot import BooksSnapshot, ensure_snapshot
+        
+        snapshot = BooksSnapshot(ensure_snapshot(self.repo, self.snapshot_path))
+        try:
+            for where in ("category:fiction AND NOT category:romance", "NOT year:2001",
+                          "(category:mystery OR category:history) AND publisher:s*", "category:none"):
+                for extra in ({}, {"genre": "fiction"}, {"max_price": 25}):
+                    assert snapshot.filter_indices(where=where, **extra) == \
+                        self.repo.filter_indices(where=where, **extra), f"Mismatch for {where} {extra}"
+        finally:
+            snapshot.close()
+    
+    def test_count_and_exists(self):
+        """Test count-only and existence queries against both stores, without rows."""
+        from mcp_server.books import query_books
+        from mcp_server.books_snapshot import BooksSnapshot, ensure_snapshot
+        
+        snapshot = BooksSnapshot(ensure_snapshot(self.repo, self.snapshot_path))
+        try:
+            for store in (self.repo, snapshot):
+                assert store.count_matches(where="category:fiction") == (3, 0), "Index terms need no row checks"
+                assert store.count_matches(year="2001", max_price=25) == (1, 0)
+                assert store.count_matches() == (5, 0)
+                assert store.count_matches(genre="fiction", where="NOT category:romance")[0] == 2
+                assert store.count_matches(author="nobody", stop_after=1)[0] == 0
+                assert query_books(store, where="category:mystery", limit=1, mode="count")["count"] == 2
+                assert query_books(store, title="war", mode="exists")["exists"] is True
+                assert query_books(store, book_id="9", mode="exists")["exists"] is False
+            # The row-by-row check stops at the first match
+            assert self.repo.count_matches(title_contains="o", stop_after=1) == (1, 1)
+        finally:
+            snapshot.close()
+    
+    @pytest.mark.asyncio
+    async def test_books_query_filter(self):
+        """Test the books_query filter and mode parameters, and filter validation."""
+        import mcp_server.server
+        
+        _USER_SESSIONS.clear()
+        await handle_call_tool("authenticate", {"username": "filteruser"})
+        with patch.object(mcp_server.server, "_BOOKS", self.repo):
+            result = await handle_call_tool("books_query", {"filter": "category:mystery AND NOT category:fiction"})
+            response = json.loads(result[0].text)
+            assert [b["Title"] for b in response["data"]] == ["Cold Case"]
+            assert response["filters_applied"]["filter"] == "category:mystery AND NOT category:fiction"
+            
+            result = await handle_call_tool("books_query", {"filter": "category:fiction", "mode": "count"})
+            response = json.loads(result[0].text)
+            assert response["count"] == 3 and response["query_type"] == "count"
+            assert "data" not in response, "Count queries should not return rows"
+            
+            result = await handle_call_tool("books_query", {"author": "Z", "mode": "exists"})
+            assert json.loads(result[0].text)["exists"] is False
+            
+            result = await handle_call_tool("books_query", {"filter": "category:fiction", "limit": 2.0, "offset": 1.0})
+            response = json.loads(result[0].text)
+            assert response["count"] == 2, "Whole-number floats should work as integer parameters"
+            
+            result = await handle_call_tool("books_query", {"filter": "category:fiction OR"})
+            response = json.loads(result[0].text)
+            assert response["error"] == "invalid_request", "Malformed filters should be rejected"
+            assert "Invalid filter" in response["message"]
+
+
+class TestBooksSuggest:
+    """Test prefix completion over titles, authors and publishers."""
+    
+    def setup_method(self):
+        """Write a catalog with repeated and differently spelled values."""
+        self.csv_path = "/tmp/test_books_suggest.csv"
+        with open(self.csv_path, "w") as f:
+            f.write("""Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)
+Harry Potter,By J. K. Rowling,Fiction,Scholastic,10.00,1998
+Harry Potter,By J. K. Rowling,Fiction,Scholastic,12.00,1999
+harry  potter,By J. K. Rowling,Fiction,scholastic,12.00,1999
+Harvest Moon,By Jane Austen,Fiction,Scribner,9.00,2001
+Hard Times,By Charles Dickens,Fiction,Penguin,8.00,1854
+Harvest,By Janet Evans,Fiction,Penguin,7.00,2010""")
+        self.repo = BooksRepository(self.csv_path)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        if os.path.exists(self.csv_path):
+            os.remove(self.csv_path)
+    
+    def test_complete_prefix(self):
+        """Test ranking by frequency, shared keys for spelling variants and prefix bounds."""
+        titles = self.repo.prefix_index("title")
+        assert titles.complete("har") == [("Harry Potter", 3), ("Hard Times", 1), ("Harvest", 1), ("Harvest Moon", 1)]
+        assert titles.complete("HARV", limit=1) == [("Harvest", 1)], "Ties should go in key order"
+        assert titles.complete("harry   pot") == [("Harry Potter", 3)], "Spacing should not matter"
+        assert titles.complete("xyz") == [] and titles.complete("har", limit=0) == []
+        assert titles.complete("", limit=2) == [("Harry Potter", 3), ("Hard Times", 1)]
+        
+        authors = self.repo.prefix_index("author")
+        assert authors.complete("jane") == [("By Jane Austen", 1), ("By Janet Evans", 1)], "'By ' should be optional"
+        assert authors.complete("By Jane ") == [("By Jane Austen", 1)], "A trailing space should end the word"
+        assert self.repo.prefix_index("publisher").complete("S") == [("Scholastic", 3), ("Scribner", 1)]
+    
+    @pytest.mark.asyncio
+    async def test_books_suggest_tool(self):
+        """Test the books_suggest tool, whose suggestions feed books_query."""
+        import mcp_server.server
+        
+        _USER_SESSIONS.clear()
+        result = await handle_call_tool("books_suggest", {"prefix": "har"})
+        assert json.loads(result[0].text)["error"] == "authentication_required"
+        
+        await handle_call_tool("authenticate", {"username": "suggestuser"})
+        with patch.object(mcp_server.server, "_BOOKS", self.repo):
+            result = await handle_call_tool("books_suggest", {"prefix": "charles", "field": "author", "limit": 5})
+            response = json.loads(result[0].text)
+            assert response["suggestions"] == [{"value": "By Charles Dickens", "count": 1}]
+            
+            result = await handle_call_tool("books_query", {"author": response["suggestions"][0]["value"]})
+            assert [b["Title"] for b in json.loads(result[0].text)["data"]] == ["Hard Times"]
+            
+            result = await handle_call_tool("books_suggest", {"prefix": "h", "field": "isbn"})
+            assert json.loads(result[0].text)["error"] == "invalid_request"
+    
+    @pytest.mark.asyncio
+    async def test_books_suggest_on_snapshot(self):
+        """Test books_suggest when workers have replaced the repository with a snapshot."""
+        import mcp_server.server
+        from mcp_server.books_snapshot import BooksSnapshot, write_snapshot
+        
+        snapshot_path = "/tmp/test_books_suggest.snapshot"
+        write_snapshot(self.repo, snapshot_path)
+        snapshot = BooksSnapshot(snapshot_path)
+        try:
+            for field in ("title", "author", "publisher"):
+                assert snapshot.prefix_index(field).complete("", limit=10) == \
+                    self.repo.prefix_index(field).complete("", limit=10), field
+            
+            _USER_SESSIONS.clear()
+            await handle_call_tool("authenticate", {"username": "suggestuser"})
+            with patch.object(mcp_server.server, "_BOOKS", snapshot):
+                result = await handle_call_tool("books_suggest", {"prefix": "harv"})
+                response = json.loads(result[0].text)
+                assert response["suggestions"] == [{"value": "Harvest", "count": 1},
+                                                   {"value": "Harvest Moon", "count": 1}]
+                assert snapshot.has_prefix_index("title")
+        finally:
+            snapshot.close()
+            os.remove(snapshot_path)
+
+
+class TestBooksSimilar:
+    """Test the similarity vectors and the books_similar tool."""
+    
+    def setup_method(self):
+        """Write a small catalog with two clear neighbours of the first book."""
+        self.csv_path = "/tmp/test_books_similar.csv"
+        self.snapshot_path = "/tmp/test_books_similar.snapshot"
+        with open(self.csv_path, "w") as f:
+            f.write("""Title,Authors,Description,Category,Publisher,Price Starting With ($),Publish Date (Year)
+Murder on the Orient Express,By Agatha Christie,A detective solves a murder on a train,"Fiction , Mystery",Collins,10.00,1934
+Death on the Nile,By Agatha Christie,A detective solves a murder on a cruise,"Fiction , Mystery",Collins,11.00,1937
+The Hound of the Baskervilles,By Arthur Conan Doyle,A detective and a legendary hound,"Fiction , Mystery",Newnes,9.00,1902
+A Brief History of Time,By Stephen Hawking,Black holes and the big bang,Science,Bantam,15.00,1988
+Zzz,,,,,,""")
+        self.repo = BooksRepository(self.csv_path)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        for path in (self.csv_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def test_similar_ranking(self):
+        """Test that shared author, category and words rank neighbours by cosine similarity."""
+        from mcp_server.books_vectors import BookVectors
+        
+        vectors = BookVectors.build(self.repo.headers, self.repo.list_all())
+        similar = vectors.similar(0, 10)
+        assert [j for j, _ in similar] == [1, 2], "Same author first, books sharing nothing left out"
+        scores = [score for _, score in similar]
+        assert 0 < scores[1] < scores[0] < 1
+        assert vectors.similar(0, 1) == similar[:1], "The partial sort should keep the best"
+        assert vectors.similar(4, 10) == [], "A book without features has no neighbours"
+    
+    def test_similar_with_empty_last_rows(self):
+        """Test that books without features at the end do not cut short the scores before them."""
+        from mcp_server.books_vectors import BookVectors
+        
+        rows = [dict(self.repo.list_all()[0]) for _ in range(2)] + [{}]
+        vectors = BookVectors.build(self.repo.headers, rows)
+        assert vectors.indptr[-1] == vectors.indptr[-2], "The last book should have no features"
+        assert vectors.similar(0, 10) == [(1, 1.0)], "Identical books should score 1"
+        assert vectors.similar(2, 10) == []
+    
+    def test_vectors_persisted_in_snapshot(self):
+        """Test that the snapshot stores the vectors and answers like freshly built ones."""
+        import numpy as np
+        from mcp_server.books_snapshot import BooksSnapshot, write_snapshot
+        from mcp_server.books_vectors import BookVectors
+        
+        built = BookVectors.build(self.repo.headers, self.repo.list_all())
+        write_snapshot(self.repo, self.snapshot_path)
+        snapshot = BooksSnapshot(self.snapshot_path)
+        mapped = snapshot.vectors()
+        try:
+            for name, array in built.arrays().items():
+                assert np.array_equal(mapped.arrays()[name], array), name
+            assert [mapped.similar(i, 3) for i in range(5)] == [built.similar(i, 3) for i in range(5)]
+        finally:
+            mapped = None  # release the mapped arrays so the snapshot can close
+            snapshot.close()
+    
+    @pytest.mark.asyncio
+    async def test_books_similar_tool(self):
+        """Test the books_similar tool, which writes the snapshot on first use."""
+        import mcp_server.server
+        
+        _USER_SESSIONS.clear()
+        await handle_call_tool("authenticate", {"username": "similaruser"})
+        with patch.object(mcp_server.server, "_BOOKS", self.repo), \
+                patch.dict(os.environ, {"BOOKS_SNAPSHOT": self.snapshot_path}):
+            result = await handle_call_tool("books_similar", {"id": "2", "limit": 1})
+            response = json.loads(result[0].text)
+            assert response["source"]["Title"] == "Death on the Nile"
+            assert [b["Title"] for b in response["data"]] == ["Murder on the Orient Express"]
+            assert 0 < response["data"][0]["similarity"] < 1
+            assert os.path.exists(self.snapshot_path), "Vectors should be persisted with the snapshot"
+            
+            result = await handle_call_tool("books_similar", {"id": "99"})
+            assert json.loads(result[0].text)["error"] == "not_found"
 
 
 class TestExchangeRates:
@@ -375,6 +1224,194 @@ class TestExchangeRates:
         """Test exchange with negative amount."""
         result = self.exchange.convert(-100, "USD", "EUR")
         assert result < 0, "Negative amount should return negative result"
+    
+    def test_cross_rate_matrix_matches_convert(self):
+        """Test that the precomputed cross-rate matrix agrees with the loaded rates."""
+        rates = {c.upper(): float(r) for c, r in self.exchange.rates.items()}
+        codes = self.exchange.codes
+        for i, from_c in enumerate(codes):
+            for j, to_c in enumerate(codes):
+                expected = rates[to_c] / rates[from_c]
+                assert self.exchange.matrix[i, j] == pytest.approx(expected)
+        # A cross pair that does not go through the base currency
+        assert self.exchange.base not in ("EUR", "GBP")
+        assert self.exchange.rate("EUR", "GBP") == pytest.approx(0.79 / 0.92)
+    
+    def test_convert_batch(self):
+        """Test vectorized batch conversion with per-item errors."""
+        values, errors = self.exchange.convert_batch(
+            [100, 50, "abc", 10],
+            ["usd", "EUR", "USD", "XXX"],
+            "GBP",
+        )
+        assert values[0] == pytest.approx(self.exchange.convert(100, "USD", "GBP"))
+        assert values[1] == pytest.approx(self.exchange.convert(50, "EUR", "GBP"))
+        assert errors[:2] == [None, None], "Valid items should not carry errors"
+        assert "Invalid amount" in errors[2], "Non-numeric amount should be reported"
+        assert errors[3] == "Unknown currency: XXX", "Unknown currency should be reported"
+    
+    def test_convert_batch_length_mismatch(self):
+        """Test that mismatched array lengths are rejected."""
+        with pytest.raises(ValueError):
+            self.exchange.convert_batch([1, 2, 3], ["USD", "EUR"], "GBP")
+
+
+class TestRateCache:
+    """Test rate providers and the background-refreshing rate cache."""
+    
+    def setup_method(self):
+        """Write a rates document for the file provider."""
+        self.rates_path = "/tmp/test_rates.json"
+        self._write_rates(0.9)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        if os.path.exists(self.rates_path):
+            os.remove(self.rates_path)
+    
+    def _write_rates(self, eur):
+        import json
+        with open(self.rates_path, "w") as f:
+            json.dump({"base": "USD", "rates": {"USD": 1.0, "EUR": eur}}, f)
+    
+    def test_file_provider_versions(self):
+        """Test that the snapshot version only changes when rates change."""
+        cache = RateCache(JsonFileRateProvider(self.rates_path), ttl=60)
+        first = cache.snapshot()
+        assert first.version == 1
+        assert first.rates.convert(100, "USD", "EUR") == pytest.approx(90.0)
+        
+        assert cache.refresh().version == 1, "Unchanged rates should keep the version"
+        self._write_rates(0.8)
+        second = cache.refresh()
+        assert second.version == 2, "Changed rates should bump the version"
+        assert second.rates.convert(100, "USD", "EUR") == pytest.approx(80.0)
+    
+    def test_http_provider(self):
+        """Test fetching rates from a local HTTP stand-in."""
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps({"base": "USD", "rates": {"GBP": 0.75}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        httpd = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{httpd.server_address[1]}/rates"
+            snapshot = RateCache(HttpRateProvider(url)).snapshot()
+            assert snapshot.rates.convert(100, "USD", "GBP") == pytest.approx(75.0)
+        finally:
+            httpd.shutdown()
+    
+    def test_stale_snapshot_refreshes_in_background(self):
+        """Test that readers are never blocked by a slow refresh."""
+        import threading
+        
+        release = threading.Event()
+        
+        class SlowProvider(RateProvider):
+            calls = 0
+            
+            def fetch(self):
+                SlowProvider.calls += 1
+                if SlowProvider.calls > 1:
+                    release.wait(5)
+                return ExchangeRates(base="USD", rates={"EUR": 0.9 + SlowProvider.calls / 100})
+        
+        cache = RateCache(SlowProvider(), ttl=0.01, refresh_ahead=0.5)
+        first = cache.snapshot()
+        time.sleep(0.02)
+        
+        started = time.perf_counter()
+        assert cache.snapshot() is first, "Stale reads should return the current snapshot"
+        assert time.perf_counter() - started < 0.5, "Reads must not wait for the fetch"
+        
+        release.set()
+        deadline = time.time() + 5
+        while cache.snapshot().version == 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache.snapshot().version == 2, "Background refresh should swap in new rates"
+    
+    @pytest.mark.asyncio
+    async def test_first_load_off_event_loop(self):
+        """Test that a conversion's first rate fetch does not run on the event loop thread."""
+        import threading
+        import mcp_server.server
+        
+        fetched_on = []
+        
+        class RecordingProvider(RateProvider):
+            def fetch(self):
+                fetched_on.append(threading.current_thread())
+                return ExchangeRates(base="USD", rates={"EUR": 0.9})
+        
+        _USER_SESSIONS.clear()
+        await handle_call_tool("authenticate", {"username": "ratesuser"})
+        with patch.object(mcp_server.server, "_RATES", RateCache(RecordingProvider(), ttl=60)):
+            for _ in range(2):
+                result = await handle_call_tool("exchange_convert", {"amount": 100, "from_currency": "USD",
+                                                                     "to_currency": "EUR"})
+                assert json.loads(result[0].text)["converted"] == pytest.approx(90.0)
+        assert len(fetched_on) == 1, "Only the first call should fetch"
+        assert fetched_on[0] is not threading.current_thread(), "The fetch should not block the event loop"
+
+
+class TestRateHistory:
+    """Test the historical exchange-rate store."""
+    
+    def setup_method(self):
+        """Write a small rate history CSV."""
+        self.history_path = "/tmp/test_rate_history.csv"
+        with open(self.history_path, "w") as f:
+            f.write("timestamp,currency,rate\n"
+                    "2024-01-01,EUR,0.90\n"
+                    "2024-03-01,EUR,0.95\n"
+                    "2024-02-01,EUR,0.92\n"
+                    "2024-01-01,GBP,0.80\n")
+        self.history = RateHistory(self.history_path)
+    
+    def teardown_method(self):
+        """Clean up test files."""
+        if os.path.exists(self.history_path):
+            os.remove(self.history_path)
+    
+    def test_as_of_lookup(self):
+        """Test that lookups resolve to the latest rate at or before the time."""
+        assert self.history.rate_at("EUR", parse_timestamp("2024-01-15")) == 0.90
+        assert self.history.rate_at("EUR", parse_timestamp("2024-02-01")) == 0.92
+        assert self.history.rate_at("EUR", parse_timestamp("2025-01-01")) == 0.95
+        assert self.history.rate_at("USD", parse_timestamp("2000-01-01")) == 1.0
+    
+    def test_as_of_before_history(self):
+        """Test lookups before the first data point and for unknown currencies."""
+        with pytest.raises(ValueError):
+            self.history.rate_at("EUR", parse_timestamp("2023-12-31"))
+        with pytest.raises(ValueError):
+            self.history.rate_at("XYZ", parse_timestamp("2024-06-01"))
+    
+    def test_historical_convert_and_npz_roundtrip(self):
+        """Test cross conversion and reloading from the columnar npz format."""
+        ts = parse_timestamp("2024-01-15")
+        assert self.history.convert(90, "EUR", "GBP", ts) == pytest.approx(80.0)
+        
+        npz_path = "/tmp/test_rate_history.npz"
+        try:
+            self.history.save_npz(npz_path)
+            reloaded = RateHistory(npz_path)
+            assert reloaded.convert(90, "EUR", "GBP", ts) == pytest.approx(80.0)
+        finally:
+            os.remove(npz_path)
 
 
 class TestIntegration:
@@ -382,39 +1419,39 @@ class TestIntegration:
     
     def setup_method(self):
         """Clean up sessions before each test."""
-        global _USER_SESSIONS, _CURRENT_SESSION
+        import mcp_server.server
         _USER_SESSIONS.clear()
-        _CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     @pytest.mark.asyncio
     async def test_complete_authentication_flow(self):
         """Test the complete authentication and usage flow."""
         # Step 1: Check initial status (should be unauthenticated)
         status_result = await handle_call_tool("session_status", {})
-        status_response = eval(status_result[0].text)
+        status_response = json.loads(status_result[0].text)
         assert status_response["authenticated"] is False
         
         # Step 2: Try to use protected operation (should fail)
         books_result = await handle_call_tool("books_query", {"limit": 1})
-        books_response = eval(books_result[0].text)
+        books_response = json.loads(books_result[0].text)
         assert "error" in books_response
         assert books_response["error"] == "authentication_required"
         
         # Step 3: Authenticate
         auth_result = await handle_call_tool("authenticate", {"username": "integrationuser"})
-        auth_response = eval(auth_result[0].text)
+        auth_response = json.loads(auth_result[0].text)
         assert auth_response["success"] is True
         assert auth_response["username"] == "integrationuser"
         
         # Step 4: Check status after authentication
         status_result = await handle_call_tool("session_status", {})
-        status_response = eval(status_result[0].text)
+        status_response = json.loads(status_result[0].text)
         assert status_response["authenticated"] is True
         assert status_response["username"] == "integrationuser"
         
         # Step 5: Use protected operations (should succeed)
         books_result = await handle_call_tool("books_query", {"limit": 2})
-        books_response = eval(books_result[0].text)
+        books_response = json.loads(books_result[0].text)
         assert "authenticated_user" in books_response
         assert books_response["authenticated_user"] == "integrationuser"
         assert "data" in books_response
@@ -424,19 +1461,19 @@ class TestIntegration:
             "to_currency": "EUR",
             "amount": 50
         })
-        currency_response = eval(currency_result[0].text)
+        currency_response = json.loads(currency_result[0].text)
         assert "authenticated_user" in currency_response
         assert currency_response["authenticated_user"] == "integrationuser"
         assert currency_response["amount"] == 50.0
         
         # Step 6: Logout
         logout_result = await handle_call_tool("logout", {})
-        logout_response = eval(logout_result[0].text)
+        logout_response = json.loads(logout_result[0].text)
         assert logout_response["success"] is True
         
         # Step 7: Try to use protected operation after logout (should fail)
         books_result = await handle_call_tool("books_query", {"limit": 1})
-        books_response = eval(books_result[0].text)
+        books_response = json.loads(books_result[0].text)
         assert "error" in books_response
         assert books_response["error"] == "authentication_required"
     
@@ -448,7 +1485,7 @@ class TestIntegration:
         
         # Check session
         status_result = await handle_call_tool("session_status", {})
-        status_response = eval(status_result[0].text)
+        status_response = json.loads(status_result[0].text)
         assert status_response["username"] == "user1"
         
         # Authenticate as second user (should replace first)
@@ -456,23 +1493,750 @@ class TestIntegration:
         
         # Check session is now user2
         status_result = await handle_call_tool("session_status", {})
-        status_response = eval(status_result[0].text)
+        status_response = json.loads(status_result[0].text)
         assert status_response["username"] == "user2"
         
         # Use operation - should show user2
         books_result = await handle_call_tool("books_query", {"limit": 1})
-        books_response = eval(books_result[0].text)
+        books_response = json.loads(books_result[0].text)
         assert books_response["authenticated_user"] == "user2"
 
 
+class TestConnectionIsolation:
+    """Test that concurrent clients sharing one server keep separate sessions."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_mcp_clients(self):
+        """Test many MCP client connections authenticating and calling tools at once."""
+        from mcp.shared.memory import create_connected_server_and_client_session
+        from mcp_server.server import server
+        
+        async def client(i):
+            async with create_connected_server_and_client_session(server) as session:
+                await session.call_tool("authenticate", {"username": f"client{i}"})
+                await asyncio.sleep(0)  # let other clients authenticate in between
+                status = json.loads((await session.call_tool("session_status", {})).content[0].text)
+                converted = json.loads((await session.call_tool("exchange_convert", {
+                    "from_currency": "USD", "to_currency": "EUR", "amount": i
+                })).content[0].text)
+                return status["username"], converted["authenticated_user"]
+        
+        results = await asyncio.gather(*(client(i) for i in range(25)))
+        for i, (status_user, convert_user) in enumerate(results):
+            assert status_user == f"client{i}", "Each client should see its own session"
+            assert convert_user == f"client{i}", "Protected calls should run as the caller"
+    
+    @pytest.mark.asyncio
+    async def test_thousands_of_connections_no_cross_talk(self):
+        """Test thousands of interleaved connections, including logouts."""
+        import mcp_server.server as srv
+        
+        async def client(i):
+            srv._LOCAL_CONNECTION.set(srv._LocalConnection())
+            await handle_call_tool("authenticate", {"username": f"user{i}"})
+            await asyncio.sleep(0)
+            if i % 10 == 0:
+                await handle_call_tool("logout", {})
+            status = json.loads((await handle_call_tool("session_status", {}))[0].text)
+            return status
+        
+        statuses = await asyncio.gather(*(client(i) for i in range(2000)))
+        for i, status in enumerate(statuses):
+            if i % 10 == 0:
+                assert status["authenticated"] is False, "Logout should only affect its own connection"
+            else:
+                assert status["username"] == f"user{i}", "Sessions must not leak across connections"
+        assert len(_USER_SESSIONS) == 1800, "Every remaining connection keeps its own session"
+
+
+class TestToolLimits:
+    """Test per-tool admission control and offloading of heavy tool bodies."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_limiter_queue_and_rejection(self):
+        """Test that calls beyond the limit queue, then get rejected when the queue is full."""
+        from mcp_server.concurrency import Overloaded, ToolLimiter
+        
+        limiter = ToolLimiter("books_query", max_concurrent=2, max_queued=1, max_wait=5)
+        await limiter.acquire()
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1, "Third call should wait for a slot"
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        assert limiter.active == 2 and limiter.queued == 0, "Released slot should pass to the waiter"
+        assert limiter.rejected == 1
+        limiter.release()
+        limiter.release()
+        assert limiter.active == 0
+    
+    @pytest.mark.asyncio
+    async def test_limiter_wait_timeout(self):
+        """Test that a queued call gives up after max_wait and leaves the queue."""
+        from mcp_server.concurrency import Overloaded, ToolLimiter
+        
+        limiter = ToolLimiter("books_query", max_concurrent=1, max_queued=4, max_wait=0.05)
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        assert limiter.queued == 0, "Timed-out waiter should leave the queue"
+        limiter.release()
+        await limiter.acquire()  # the slot is free again
+    
+    @pytest.mark.asyncio
+    async def test_overloaded_result_and_responsive_loop(self):
+        """Test back-pressure on books_query while cheap tools keep answering."""
+        import threading
+        import mcp_server.server as srv
+        from mcp_server.concurrency import ToolLimiter
+        
+        await handle_call_tool("authenticate", {"username": "busy_user"})
+        release = threading.Event()
+        
+        def slow_scan(params, currency, snapshot):
+            release.wait(5)
+            return {"data": []}
+        
+        limiters = {"books_query": ToolLimiter("books_query", max_concurrent=1, max_queued=0)}
+        with patch.object(srv, "_TOOL_LIMITERS", limiters), patch.object(srv, "_query_books_inline", slow_scan):
+            first = asyncio.ensure_future(handle_call_tool("books_query", {"genre": "fiction"}))
+            await asyncio.sleep(0.05)
+            
+            # The scan runs off the event loop, so cheap calls are answered meanwhile
+            status = json.loads((await asyncio.wait_for(handle_call_tool("session_status", {}), 1))[0].text)
+            assert status["authenticated"] is True
+            
+            second = json.loads((await handle_call_tool("books_query", {"genre": "history"}))[0].text)
+            assert second["error"] == "overloaded", "Excess call should be rejected, not queued forever"
+            
+            release.set()
+            first_result = json.loads((await first)[0].text)
+        assert first_result["count"] == 0 and limiters["books_query"].active == 0
+
+
+class TestRequestCoalescing:
+    """Test single-flight sharing of identical concurrent books_query scans."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        """Test that concurrent calls with one key share a single execution."""
+        from mcp_server.concurrency import SingleFlight
+        
+        flight = SingleFlight()
+        runs = []
+        
+        async def work(value):
+            runs.append(value)
+            await asyncio.sleep(0.01)
+            if value == "boom":
+                raise ValueError(value)
+            return value
+        
+        results = await asyncio.gather(*(flight.do("a", lambda: work("a")) for _ in range(10)),
+                                       flight.do("b", lambda: work("b")))
+        assert results == ["a"] * 10 + ["b"], "Every caller should get its key's result"
+        assert runs == ["a", "b"] and flight.coalesced == 9 and len(flight) == 0
+        
+        failures = await asyncio.gather(*(flight.do("c", lambda: work("boom")) for _ in range(3)),
+                                        return_exceptions=True)
+        assert all(isinstance(f, ValueError) for f in failures), "Errors should reach every caller"
+        assert await flight.do("a", lambda: work("a2")) == "a2", "Finished calls should not be cached"
+    
+    @pytest.mark.asyncio
+    async def test_identical_queries_share_one_scan(self):
+        """Test a burst of equivalent books_query calls from different users."""
+        import mcp_server.server as srv
+        
+        scans = []
+        
+        def counting_scan(params, currency, snapshot):
+            scans.append(params)
+            time.sleep(0.05)
+            return {"data": [{"Title": "Shared"}]}
+        
+        async def client(i, genre):
+            srv._LOCAL_CONNECTION.set(srv._LocalConnection())
+            await handle_call_tool("authenticate", {"username": f"agent{i}"})
+            return json.loads((await handle_call_tool("books_query", {"genre": genre, "limit": 10}))[0].text)
+        
+        with patch.object(srv, "_query_books_inline", counting_scan):
+            results = await asyncio.gather(*(client(i, "Fiction" if i % 2 else "fiction") for i in range(20)),
+                                           client(99, "history"))
+        assert len(scans) == 2, "Equivalent queries should run one scan; a different one runs its own"
+        for i, result in enumerate(results[:20]):
+            assert result["authenticated_user"] == f"agent{i}", "Each caller keeps its own user context"
+            assert result["data"] == [{"Title": "Shared"}]
+            assert result["filters_applied"]["genre"] == ("Fiction" if i % 2 else "fiction")
+        assert results[20]["authenticated_user"] == "agent99"
+
+
+class TestResponseEncoding:
+    """Test JSON encoding of tool responses."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    def test_dumps_with_and_without_orjson(self):
+        """Test that both encoders produce the same compact JSON."""
+        import numpy as np
+        import mcp_server.encoding as encoding
+        
+        value = {"title": "Café", "price": 12.5, "missing": None, "ok": True, "n": np.int64(3)}
+        fast = encoding.dumps(value)
+        with patch.object(encoding, "orjson", None):
+            slow = encoding.dumps(value)
+        expected = {"title": "Café", "price": 12.5, "missing": None, "ok": True, "n": 3}
+        assert json.loads(fast) == json.loads(slow) == expected
+        assert " " not in slow.replace("Café", ""), "Output should be compact"
+    
+    def test_non_finite_floats_encode_as_null(self):
+        """Test that NaN and infinities become null with both encoders, keeping the JSON valid."""
+        import numpy as np
+        import mcp_server.encoding as encoding
+        
+        value = {"rate": float("nan"), "prices": [1.5, float("inf")], "n": np.float64("-inf"),
+                 "column": np.array([np.nan, 2.0])}
+        expected = '{"rate":null,"prices":[1.5,null],"n":null,"column":[null,2.0]}'
+        assert encoding.dumps(value) == expected
+        with patch.object(encoding, "orjson", None):
+            assert encoding.dumps(value) == expected
+            assert encoding.dumps({"price": 2.5}) == '{"price":2.5}'
+    
+    def test_static_response_reused(self):
+        """Test that static error bodies are encoded once and parse as JSON."""
+        from mcp_server.encoding import StaticResponse
+        
+        body = StaticResponse({"error": "authentication_required"})
+        first, second = body(), body()
+        assert first[0].text is second[0].text, "Pre-encoded text should be reused"
+        assert json.loads(first[0].text) == {"error": "authentication_required"}
+    
+    def test_structured_content(self):
+        """Test that structured mode returns the result next to its JSON text."""
+        import mcp_server.encoding as encoding
+        
+        with patch.object(encoding, "STRUCTURED_CONTENT", True):
+            content, structured = asyncio.run(handle_call_tool("session_status", {}))
+        assert structured["authenticated"] is False
+        assert json.loads(content[0].text) == structured
+    
+    def test_tool_responses_are_json(self):
+        """Test that protected tool responses are valid JSON with JSON literals."""
+        asyncio.run(handle_call_tool("authenticate", {"username": "json_user"}))
+        text = asyncio.run(handle_call_tool("exchange_convert_batch", {
+            "amounts": [1, 2], "from_currency": ["USD", "XXX"], "to_currency": "EUR"
+        }))[0].text
+        assert '"authenticated_user":"json_user"' in text
+        assert json.loads(text)["failed"] == 1
+
+
+class TestToolRegistry:
+    """Test registry dispatch and precompiled argument validation."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    def test_compiled_validator(self):
+        """Test the compiled validator against the schema subset tools use."""
+        from mcp_server.tool_registry import compile_schema
+        
+        validate = compile_schema({
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "count": {"type": "integer"},
+                "mode": {"type": "string", "enum": ["a", "b"]},
+                "amounts": {"type": "array", "items": {"type": "number"}},
+                "currency": {"oneOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]},
+            },
+            "required": ["name"],
+            "additionalProperties": False,
+        })
+        assert validate({"name": "x", "count": 3, "amounts": [1, 2.5], "currency": ["USD"]}, "") is None
+        assert validate({"name": "x", "count": 3.0}, "") is None, "Integral floats count as integers"
+        assert validate({}, "") == "Missing required parameter: name"
+        assert validate({"name": "x", "extra": 1}, "") == "Unexpected parameter: extra"
+        assert validate({"name": "x", "count": True}, "") == "Parameter 'count' must be integer"
+        assert validate({"name": "x", "mode": "c"}, "") == "Parameter 'mode' must be one of ['a', 'b']"
+        assert validate({"name": "x", "amounts": [1, "2"]}, "") == "Parameter 'amounts[1]' must be number"
+        assert "currency" in validate({"name": "x", "currency": 5}, "")
+    
+    def test_unsupported_schema_keyword(self):
+        """Test that schemas the compiler cannot enforce are rejected at registration."""
+        import mcp.types as types
+        from mcp_server.tool_registry import SchemaError, ToolRegistry
+        
+        registry = ToolRegistry()
+        tool = types.Tool(name="t", description="", inputSchema={"type": "object", "minProperties": 1})
+        with pytest.raises(SchemaError):
+            registry.register(tool)
+    
+    @pytest.mark.asyncio
+    async def test_tool_list_cached(self):
+        """Test that tools/list returns the same prebuilt list every time."""
+        from mcp_server.server import handle_list_tools
+        
+        first, second = await handle_list_tools(), await handle_list_tools()
+        assert first is second
+        assert [t.name for t in first] == ["books_query", "books_suggest", "books_similar",
+                                           "exchange_convert", "exchange_convert_batch", "authenticate", "logout",
+                                           "session_status", "server_metrics", "server_profile"]
+    
+    @pytest.mark.asyncio
+    async def test_invalid_arguments_rejected_before_auth(self):
+        """Test that malformed arguments are rejected before the session check."""
+        result = await handle_call_tool("books_query", {"limit": "ten"})
+        response = json.loads(result[0].text)
+        assert response == {"error": "invalid_request", "message": "Parameter 'limit' must be integer",
+                            "tool": "books_query"}
+        
+        await handle_call_tool("authenticate", {"username": "registry_user"})
+        result = await handle_call_tool("exchange_convert", {"amount": 1, "from_currency": "USD",
+                                                             "to_currency": "EUR", "rate": 2})
+        assert json.loads(result[0].text)["message"] == "Unexpected parameter: rate"
+    
+    @pytest.mark.asyncio
+    async def test_unknown_tool(self):
+        """Test that unregistered tools still raise."""
+        with pytest.raises(ValueError, match="Unknown tool"):
+            await handle_call_tool("no_such_tool", {})
+
+
+class TestMetrics:
+    """Test per-tool counters, latency histograms and the metrics endpoints."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    def test_histogram_quantiles(self):
+        """Test that percentiles stay within the sub-bucket resolution."""
+        from mcp_server.metrics import Histogram
+        
+        h = Histogram()
+        for v in range(1, 10001):
+            h.record(v)
+        assert h.count == 10000 and h.max == 10000
+        for q in (0.5, 0.9, 0.99):
+            exact = q * 10000
+            assert exact <= h.quantile(q) <= exact * 1.125, f"p{q} should be within 12.5%"
+        assert h.quantile(1.0) == 10000
+        assert h.count_below(1024) == 1023
+        for index in (0, 15, 16, 23, 24, 100):
+            low, high = Histogram.bucket_bounds(index)
+            assert Histogram._index(low) == Histogram._index(high) == index
+    
+    @pytest.mark.asyncio
+    async def test_server_metrics_tool(self):
+        """Test that calls are counted by outcome, with rows scanned and returned."""
+        import mcp_server.server
+        from mcp_server.metrics import Metrics
+        
+        csv_path = "/tmp/test_books_metrics.csv"
+        with open(csv_path, "w") as f:
+            f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n")
+            for i in range(5):
+                f.write(f"Book {i},Author {i},{'Fiction' if i % 2 else 'History'},P,10.00,2001\n")
+        repo = BooksRepository(csv_path)
+        metrics = Metrics()
+        metrics.add_gauges(mcp_server.server._component_gauges)
+        try:
+            with patch.object(mcp_server.server, "_METRICS", metrics), \
+                    patch.object(mcp_server.server, "_BOOKS", repo):
+                await handle_call_tool("books_query", {})
+                await handle_call_tool("authenticate", {"username": "metrics_user"})
+                await handle_call_tool("books_query", {"genre": "fiction"})
+                result = await handle_call_tool("server_metrics", {})
+        finally:
+            os.remove(csv_path)
+        report = json.loads(result[0].text)
+        books = report["tools"]["books_query"]
+        assert books["outcomes"] == {"authentication_required": 1, "ok": 1}
+        assert books["rows_scanned"] == 5 and books["rows_returned"] == 2
+        assert books["calls"] == 2 and books["latency_ms"]["p99"] >= books["latency_ms"]["p50"]
+        assert books["response_bytes"]["total"] > 0
+        assert report["tools"]["authenticate"]["outcomes"] == {"ok": 1}
+        assert report["gauges"]["sessions"] == 1
+        assert {"tool": "books_query", "value": 0} in report["gauges"]["tool_active_calls"]
+    
+    @pytest.mark.asyncio
+    async def test_shared_store_sessions_gauge(self):
+        """Test that metrics never count a shared session store's backend, which would scan it."""
+        import mcp_server.server
+        
+        db_path = "/tmp/test_metrics_sessions.db"
+        
+        class NoCountBackend(SqliteSessionBackend):
+            def count(self):
+                raise AssertionError("count() scans the whole backend")
+        
+        store = SharedSessionStore(NoCountBackend(db_path), cache_ttl=60)
+        try:
+            with patch.object(mcp_server.server, "_USER_SESSIONS", store):
+                await handle_call_tool("authenticate", {"username": "metricsuser"})
+                report = json.loads((await handle_call_tool("server_metrics", {}))[0].text)
+                assert report["gauges"]["sessions_cached"] == 1
+                assert "sessions" not in report["gauges"]
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+    
+    @pytest.mark.asyncio
+    async def test_prometheus_endpoint(self):
+        """Test the Prometheus text over the local HTTP port."""
+        import urllib.request
+        from mcp_server.metrics import Metrics, serve_metrics
+        
+        metrics = Metrics()
+        metrics.record_call("books_query", "ok", 0.002, 120)
+        metrics.record_call("books_query", "session_expired", 0.0001, 80)
+        httpd = serve_metrics(metrics, port=0)
+        try:
+            url = f"http://127.0.0.1:{httpd.server_address[1]}/metrics"
+            text = await asyncio.to_thread(lambda: urllib.request.urlopen(url, timeout=5).read().decode())
+        finally:
+            httpd.shutdown()
+        assert 'mcp_tool_calls_total{tool="books_query",outcome="session_expired"} 1' in text
+        assert 'mcp_tool_latency_seconds_bucket{tool="books_query",le="0.000128"} 1' in text
+        assert 'mcp_tool_latency_seconds_bucket{tool="books_query",le="+Inf"} 2' in text
+        assert 'mcp_tool_latency_seconds_count{tool="books_query"} 2' in text
+        assert 'mcp_tool_response_bytes_total{tool="books_query"} 200' in text
+
+
+class TestTracing:
+    """Test stage-level tracing of tool calls and the trace file summary."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    def test_spans_are_noops_outside_a_trace(self):
+        """Test that untraced code gets the shared no-op span."""
+        from mcp_server.tracing import Tracer, span
+        
+        assert span("books.filter") is span("encode")
+        assert Tracer(sample_rate=1.0).start("books_query", {}) is None, "No exporter means no tracing"
+    
+    @pytest.mark.asyncio
+    async def test_traced_books_query_stages(self):
+        """Test that a sampled call records each stage, including offloaded repository steps."""
+        import mcp_server.server
+        from mcp_server.tracing import TraceExporter, Tracer
+        
+        class ListExporter(TraceExporter):
+            def __init__(self):
+                self.records = []
+            
+            def export(self, record):
+                self.records.append(record)
+        
+        csv_path = "/tmp/test_books_tracing.csv"
+        with open(csv_path, "w") as f:
+            f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n")
+            for i in range(4):
+                f.write(f"Book {i},Author {i},Fiction,P,10.00,2001\n")
+        exporter = ListExporter()
+        try:
+            with patch.object(mcp_server.server, "_TRACER", Tracer(1.0, exporter)), \
+                    patch.object(mcp_server.server, "_BOOKS", BooksRepository(csv_path)):
+                await handle_call_tool("authenticate", {"username": "trace_user", "session_id": "secret"})
+                await handle_call_tool("authenticate", {"username": "trace_user"})
+                await handle_call_tool("books_query", {"genre": "fiction", "limit": 2})
+        finally:
+            os.remove(csv_path)
+        
+        resume, _, books = exporter.records
+        assert resume["outcome"] == "invalid_credentials" and "session_id" not in resume["arguments"]
+        assert books["tool"] == "books_query" and books["outcome"] == "ok"
+        assert books["arguments"] == {"genre": "fiction", "limit": 2}
+        names = [s["name"] for s in books["spans"]]
+        for stage in ("validate", "authorize", "queue", "scan", "books.load", "books.filter",
+                      "books.rows", "wait", "encode"):
+            assert stage in names, f"Missing stage {stage}"
+        wait = next(s for s in books["spans"] if s["name"] == "wait")
+        assert wait["coalesced"] is False
+        assert all(s["start_ms"] + s["duration_ms"] <= books["duration_ms"] + 0.01 for s in books["spans"])
+    
+    def test_jsonl_exporter_and_summary(self, tmp_path, capsys):
+        """Test writing traces as JSON lines and summarizing the slowest stages and calls."""
+        from mcp_server.tracing import JsonLinesExporter, load_traces, main, summarize
+        
+        path = str(tmp_path / "traces.jsonl")
+        exporter = JsonLinesExporter(path)
+        for i, filter_ms in enumerate([1.0, 40.0, 2.0]):
+            exporter.export({
+                "trace_id": f"t{i}", "tool": "books_query", "start": 0.0, "duration_ms": filter_ms + 5,
+                "outcome": "ok", "arguments": {"title": f"q{i}"},
+                "spans": [{"name": "scan", "start_ms": 1.0, "duration_ms": filter_ms + 2},
+                          {"name": "books.filter", "start_ms": 1.5, "duration_ms": filter_ms},
+                          {"name": "encode", "start_ms": filter_ms + 3.5, "duration_ms": 1.0}],
+            })
+        exporter.close()
+        
+        traces = load_traces(path)
+        assert len(traces) == 3
+        summary = summarize(traces, top=2)
+        assert summary["stages"][0]["stage"] == "(call)"
+        filter_stage = next(r for r in summary["stages"] if r["stage"] == "books.filter")
+        assert filter_stage["count"] == 3 and filter_stage["max_ms"] == 40.0
+        slowest = summary["slowest"][0]
+        assert slowest["trace_id"] == "t1" and slowest["slowest_stage"] == "books.filter"
+        assert len(summary["slowest"]) == 2
+        
+        main([path, "--top", "3"])
+        out = capsys.readouterr().out
+        assert "3 traced calls" in out and '{"title": "q1"}' in out
+
+
+class TestProfiling:
+    """Test the admin-only on-demand profiling tool."""
+    
+    def setup_method(self):
+        """Clean up sessions before each test."""
+        import mcp_server.server
+        _USER_SESSIONS.clear()
+        mcp_server.server._CURRENT_SESSIONS.clear()
+    
+    @pytest.mark.asyncio
+    async def test_profile_requires_admin(self):
+        """Test that non-administrators are refused."""
+        await handle_call_tool("authenticate", {"username": "not_admin"})
+        result = await handle_call_tool("server_profile", {"action": "start"})
+        assert json.loads(result[0].text)["error"] == "forbidden"
+    
+    @pytest.mark.asyncio
+    async def test_admin_requires_token(self):
+        """Test that an admin username alone is not enough: the session needs the ADMIN_TOKEN."""
+        import mcp_server.server
+        
+        with patch.object(mcp_server.server, "_ADMIN_USERS", frozenset({"ops"})), \
+                patch.object(mcp_server.server, "_ADMIN_TOKEN", "s3cret"):
+            await handle_call_tool("authenticate", {"username": "ops"})
+            result = await handle_call_tool("server_profile", {})
+            assert json.loads(result[0].text)["error"] == "forbidden", "A username alone must not grant admin"
+            
+            for username, token in (("ops", "wrong"), ("not_admin", "s3cret")):
+                result = await handle_call_tool("authenticate", {"username": username, "admin_token": token})
+                assert json.loads(result[0].text)["error"] == "invalid_credentials"
+            
+            await handle_call_tool("authenticate", {"username": "ops", "admin_token": "s3cret"})
+            result = await handle_call_tool("server_profile", {})
+            assert json.loads(result[0].text)["status"] == "idle"
+        
+        with patch.object(mcp_server.server, "_ADMIN_USERS", frozenset({"ops"})):
+            result = await handle_call_tool("authenticate", {"username": "ops", "admin_token": ""})
+            assert json.loads(result[0].text)["error"] == "invalid_credentials", "No ADMIN_TOKEN: nobody is admin"
+    
+    def test_profiler_single_session(self, tmp_path):
+        """Test that only one session runs at a time and stopping when idle is harmless."""
+        from mcp_server.profiling import Profiler
+        
+        profiler = Profiler(str(tmp_path))
+        assert profiler.stop() is None
+        profiler.start(cpu=True, seconds=5)
+        with pytest.raises(RuntimeError):
+            profiler.start(cpu=True, seconds=5)
+        summary = profiler.stop()
+        assert os.path.exists(summary["reports"]["pstats"])
+        assert profiler.session is None
+    
+    @pytest.mark.asyncio
+    async def test_profile_session_ends_after_calls(self, tmp_path):
+        """Test a CPU + allocation session that stops by itself after N tool calls."""
+        import pstats
+        import mcp_server.server
+        
+        csv_path = "/tmp/test_books_profile.csv"
+        with open(csv_path, "w") as f:
+            f.write("Title,Authors,Category,Publisher,Price Starting With ($),Publish Date (Year)\n")
+            for i in range(50):
+                f.write(f"Book {i},Author {i},Fiction,P,10.00,2001\n")
+        profiler = mcp_server.server._PROFILER
+        try:
+            with patch.object(mcp_server.server, "_ADMIN_USERS", frozenset({"ops"})), \
+                    patch.object(mcp_server.server, "_ADMIN_TOKEN", "s3cret"), \
+                    patch.object(profiler, "directory", str(tmp_path)), \
+                    patch.object(mcp_server.server, "_BOOKS", BooksRepository(csv_path)):
+                await handle_call_tool("authenticate", {"username": "ops", "admin_token": "s3cret"})
+                result = await handle_call_tool("server_profile", {"action": "start", "memory": True,
+                                                                   "calls": 2})
+                started = json.loads(result[0].text)
+                assert started["status"] == "running" and started["max_calls"] == 2
+                await handle_call_tool("books_query", {"genre": "fiction"})
+                status = json.loads((await handle_call_tool("server_profile", {}))[0].text)
+                assert status["status"] == "running" and status["calls"] == 1
+                await handle_call_tool("books_query", {"title": "book 1", "format": "table"})
+                status = json.loads((await handle_call_tool("server_profile", {}))[0].text)
+        finally:
+            profiler.stop()
+            os.remove(csv_path)
+        
+        assert status["status"] == "idle", "Session should end after two calls"
+        report = status["last_profile"]
+        assert report["calls"] == 2
+        assert "books" in report["cpu_by_component"]
+        assert "memory" in report["reports"] and os.path.exists(report["reports"]["memory"])
+        functions = {func for _, _, func in pstats.Stats(report["reports"]["pstats"]).stats}
+        assert "filter_indices" in functions, "Offloaded scans should be profiled"
+        with open(report["reports"]["cpu"]) as f:
+            assert "time by component" in f.read()
+
+
+class TestHttpTransport:
+    """Test serving several clients from one process over Streamable HTTP."""
+    
+    def setup_method(self):
+        """Start the HTTP app on a free local port."""
+        import socket
+        import threading
+        import uvicorn
+        from mcp_server.http_transport import build_http_app
+        from mcp_server.server import server
+        
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(build_http_app(server), host="127.0.0.1", port=self.port, log_level="warning")
+        self.http_server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.http_server.run, daemon=True)
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.http_server.started and time.time() < deadline:
+            time.sleep(0.05)
+    
+    def teardown_method(self):
+        """Stop the HTTP server."""
+        self.http_server.should_exit = True
+        self.thread.join(timeout=10)
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_http_clients(self):
+        """Test that HTTP clients share one process but keep their own sessions."""
+        from mcp import ClientSession
+        try:
+            from mcp.client.streamable_http import streamable_http_client
+        except ImportError:  # older SDKs
+            from mcp.client.streamable_http import streamablehttp_client as streamable_http_client
+        
+        url = f"http://127.0.0.1:{self.port}/mcp"
+        
+        async def client(i):
+            async with streamable_http_client(url) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    tools = await session.list_tools()
+                    await session.call_tool("authenticate", {"username": f"http{i}"})
+                    await asyncio.sleep(0.01)
+                    status = json.loads((await session.call_tool("session_status", {})).content[0].text)
+                    return len(tools.tools), status["username"]
+        
+        results = await asyncio.gather(*(client(i) for i in range(5)))
+        for i, (tool_count, username) in enumerate(results):
+            assert tool_count > 0, "Tools should be listed over HTTP"
+            assert username == f"http{i}", "Each HTTP client should keep its own session"
+
+
+class TestColdStart:
+    """Test that importing the server is cheap and components are created on first use."""
+    
+    def test_import_has_no_side_effects(self):
+        """Test that the import loads neither the MCP SDK, NumPy, optional subsystems nor the dataset."""
+        import subprocess
+        
+        code = ("import sys, mcp_server.server as s; "
+                "print('mcp' in sys.modules, 'numpy' in sys.modules, s._BOOKS is None, s._SERVER is None, "
+                "any(m in sys.modules for m in ('orjson', 'sqlite3', 'cProfile', 'pstats', 'tracemalloc')))")
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        # A configured rate history must not load at import either
+        env = dict(os.environ, RATES_HISTORY="/tmp/test_cold_start_history.npz")
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True,
+                             check=True)
+        assert out.stdout.split() == ["False", "False", "True", "True", "False"]
+    
+    def test_server_created_once(self):
+        """Test that create_server and the module attribute return one configured server."""
+        import mcp.types as types
+        import mcp_server.server
+        from mcp_server.server import create_server, server
+        
+        assert create_server() is server is mcp_server.server.server
+        assert types.ListToolsRequest in server.request_handlers
+        assert types.CallToolRequest in server.request_handlers
+    
+    def test_csv_converted_on_first_load(self, tmp_path):
+        """Test that a missing CSV is converted from its XLSX source by the first load."""
+        import zipfile
+        
+        xlsx_path = tmp_path / "books.xlsx"
+        cells = [["Title", "Price Starting With ($)"], ["First Book", "4.99"], ["Second Book", "9.99"]]
+        rows = "".join(
+            f'<row r="{r}">' + "".join(f'<c r="{"AB"[c]}{r}" t="str"><v>{v}</v></c>'
+                                       for c, v in enumerate(values)) + "</row>"
+            for r, values in enumerate(cells, start=1))
+        with zipfile.ZipFile(xlsx_path, "w") as zf:
+            zf.writestr("xl/worksheets/sheet1.xml",
+                        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        f'<sheetData>{rows}</sheetData></worksheet>')
+        
+        csv_path = tmp_path / "data" / "books.csv"
+        repo = BooksRepository(str(csv_path), source=str(xlsx_path))
+        assert not csv_path.exists(), "Nothing is converted before the first load"
+        assert repo.get_by_id("2")["Title"] == "Second Book"
+        assert csv_path.exists()
+        assert [p.name for p in csv_path.parent.iterdir()] == ["books.csv"], "No partial file is left behind"
+    
+    @pytest.mark.asyncio
+    async def test_replaced_repository_gets_its_own_price_columns(self, tmp_path):
+        """Test that the converted price cache follows a replaced books repository."""
+        import mcp_server.server
+        
+        csv_path = tmp_path / "books.csv"
+        csv_path.write_text("Title,Price Starting With ($)\nOnly Book,10.00\n", encoding="utf-8")
+        repo = BooksRepository(str(csv_path))
+        with patch.object(mcp_server.server, "_BOOKS", repo):
+            assert mcp_server.server._price_columns().repo is repo
+
+
 class TestErrorHandling:
     """Test error handling and edge cases."""
     
     def setup_method(self):
         """Clean up sessions before each test."""
-        global _USER_SESSIONS, _CURRENT_SESSION
+        import mcp_server.server
         _USER_SESSIONS.clear()
-        _CURRENT_SESSION = None
+        mcp_server.server._CURRENT_SESSIONS.clear()
     
     @pytest.mark.asyncio
     async def test_invalid_tool_name(self):
@@ -490,15 +2254,17 @@ class TestErrorHandling:
         # First authenticate
         await handle_call_tool("authenticate", {"username": "testuser"})
         
-        # Try conversion without required parameters
-        with pytest.raises(KeyError):
-            await handle_call_tool("exchange_convert", {"from_currency": "USD"})
+        # Conversion without required parameters is rejected before running
+        result = await handle_call_tool("exchange_convert", {"from_currency": "USD"})
+        response = json.loads(result[0].text)
+        assert response["error"] == "invalid_request"
+        assert response["message"] == "Missing required parameter: to_currency"
     
     @pytest.mark.asyncio
     async def test_authenticate_without_username(self):
         """Test authentication without username parameter."""
         result = await handle_call_tool("authenticate", {})
-        response = eval(result[0].text)
+        response = json.loads(result[0].text)
         
         # Should still work with default username
         assert response["success"] is True